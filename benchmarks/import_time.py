@@ -0,0 +1,64 @@
+#!/usr/bin/env python2
+
+"""
+Benchmark of the time of `import pvtools`.
+
+Each import is timed in a fresh interpreter. The import of pvtools is
+compared with the import of Paraview, which pvtools used to pay on import
+before it was made lazy.
+
+Usage:
+    python benchmarks/import_time.py [repeats]
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        os.pardir)
+
+_SCRIPT = """
+import time
+start = time.time()
+%s
+print(time.time() - start)
+"""
+
+
+def time_import(statement, repeats):
+    """Return the median time of the statement run in fresh interpreters."""
+    times = []
+    with open(os.devnull, "w") as devnull:
+        for _ in range(repeats):
+            output = subprocess.check_output(
+                [sys.executable, "-c", _SCRIPT % statement], cwd=ROOT_DIR,
+                stderr=devnull)
+            times.append(float(output.split()[-1]))
+    return np.median(times)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    t_pvtools = time_import("import pvtools", repeats)
+    print("%-32s %8.3f s" % ("import pvtools:", t_pvtools))
+
+    check = ("import sys, pvtools; "
+             "assert 'paraview' not in sys.modules, 'Paraview imported'")
+    subprocess.check_call([sys.executable, "-c", check], cwd=ROOT_DIR)
+    print("Paraview not imported by pvtools")
+
+    try:
+        t_paraview = time_import("import pvtools, paraview.simple", repeats)
+    except subprocess.CalledProcessError:
+        print("Paraview not available, skipping the comparison")
+        return
+    print("%-32s %8.3f s" % ("import pvtools, paraview.simple:", t_paraview))
+    print("Speedup: %.1fx" % (t_paraview / t_pvtools))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python2
+
+"""
+Generator of synthetic meshes for the benchmarks.
+
+The meshes are uniform grids of hexahedra of the unit cube, as close to the
+requested number of cells as possible. They are written as legacy VTK files
+(structured or unstructured grid, ASCII or binary) or as OpenFOAM cases
+(ASCII or binary). The binary unstructured grids can be also made of
+tetrahedra (each hexahedron split into 6) or of mixed cells (columns of
+hexahedra alternating with columns of wedges). The fields are linear
+functions of the coordinates, so that the interpolated values are known
+exactly:
+
+    pressure = 1 + x + 2 y + 3 z,    velocity = (x, y, z)
+
+named 'PPressure' and 'PVelocity' (point data) in the VTK files, and 'p' and
+'U' (cell data) in the OpenFOAM cases.
+
+Usage:
+    python benchmarks/meshgen.py format cells output
+"""
+
+import os
+import sys
+
+import numpy as np
+
+FORMATS = ["vtk-structured", "vtk-ascii", "vtk-binary", "vtk-tetra",
+           "vtk-mixed", "foam-ascii", "foam-binary"]
+
+SHAPES = ["hexahedron", "tetrahedron", "mixed"]
+
+# Average number of cells a hexahedron of the grid is split into
+_CELLS_PER_HEXAHEDRON = {"hexahedron": 1, "tetrahedron": 6, "mixed": 1.5}
+
+# Tetrahedra of a hexahedron around its diagonal 0-6, positively oriented,
+# as indices of the VTK order of the hexahedron. All the hexahedra are split
+# the same way, so the faces of the neighbours match.
+_HEXAHEDRON_TETRAHEDRA = [(0, 1, 2, 6), (0, 2, 3, 6), (0, 3, 7, 6),
+                          (0, 7, 4, 6), (0, 4, 5, 6), (0, 5, 1, 6)]
+
+# Wedges of a hexahedron on both sides of its diagonal plane 0-2-6-4, in the
+# VTK order (the normal of the first triangle pointing out of the wedge)
+_HEXAHEDRON_WEDGES = [(0, 2, 1, 4, 6, 5), (0, 3, 2, 4, 7, 6)]
+
+# VTK cell types
+_VTK_TETRA = 10
+_VTK_HEXAHEDRON = 12
+_VTK_WEDGE = 13
+
+_FOAM_HEADER = """FoamFile
+{
+    version     2.0;
+    format      %(format)s;
+    arch        "LSB;label=32;scalar=64";
+    class       %(cls)s;
+    location    "%(location)s";
+    object      %(object)s;
+}
+
+"""
+
+# Patches of the OpenFOAM cases: (name, axis, side)
+_PATCHES = [("xmin", 0, 0), ("xmax", 0, 1), ("ymin", 1, 0), ("ymax", 1, 1),
+            ("zmin", 2, 0), ("zmax", 2, 1)]
+
+
+def dimensions(cells):
+    """Return the numbers of cells (nx, ny, nz) of a grid of given size."""
+    n = max(1, int(round(cells ** (1.0 / 3))))
+    nz = max(1, int(round(float(cells) / (n * n))))
+    return n, n, nz
+
+
+def pressure(points):
+    points = np.asarray(points)
+    return 1 + points[..., 0] + 2 * points[..., 1] + 3 * points[..., 2]
+
+
+def velocity(points):
+    return np.asarray(points, dtype=float)
+
+
+def _grid_points(dims):
+    """Return the point coordinates of the grid, x varying fastest."""
+    axes = [np.linspace(0, 1, n + 1) for n in dims]
+    z, y, x = np.meshgrid(axes[2], axes[1], axes[0], indexing="ij")
+    return np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+
+
+def _point_index(dims, i, j, k):
+    return i + (dims[0] + 1) * (j + (dims[1] + 1) * k)
+
+
+def _hexahedra(dims):
+    """Return the (N, 8) point indices of the cells, in VTK order."""
+    k, j, i = [a.ravel() for a in np.meshgrid(
+        np.arange(dims[2]), np.arange(dims[1]), np.arange(dims[0]),
+        indexing="ij")]
+    corners = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+               (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]
+    return np.column_stack([_point_index(dims, i + di, j + dj, k + dk)
+                            for di, dj, dk in corners])
+
+
+def _cells(dims, shape):
+    """Return the cells of the grid made of the given shape.
+
+    Returns:
+        list: Tuples ((N, n) point indices in VTK order, VTK cell type).
+    """
+
+    hexes = _hexahedra(dims)
+    if shape == "tetrahedron":
+        tetras = hexes[:, _HEXAHEDRON_TETRAHEDRA].reshape(-1, 4)
+        return [(tetras, _VTK_TETRA)]
+    if shape == "mixed":
+        # Wedges in the odd columns along x, the faces between a hexahedron
+        # and a wedge are whole quadrilaterals
+        split = np.arange(len(hexes)) % dims[0] % 2 == 1
+        wedges = hexes[split][:, _HEXAHEDRON_WEDGES].reshape(-1, 6)
+        return [(hexes[~split], _VTK_HEXAHEDRON), (wedges, _VTK_WEDGE)]
+    if shape != "hexahedron":
+        raise ValueError("Unknown shape %s, expected one of %s"
+                         % (shape, ", ".join(SHAPES)))
+    return [(hexes, _VTK_HEXAHEDRON)]
+
+
+def _write_array(f, array, binary, dtype):
+    """Write the values of the array in the legacy VTK format."""
+    array = np.asarray(array)
+    if binary:
+        f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        f.write("\n")
+    else:
+        fmt = "%d" if np.dtype(dtype).kind == "i" else "%.9g"
+        np.savetxt(f, array.reshape(len(array), -1), fmt=fmt)
+
+
+def write_vtk(filename, cells, structured=False, binary=False,
+              shape="hexahedron"):
+    """Write a legacy VTK file of a grid of approximately given size.
+
+    Args:
+        filename (str): Name of the file.
+        cells (int): Requested number of cells.
+        structured (bool): Write STRUCTURED_GRID instead of
+            UNSTRUCTURED_GRID.
+        binary (bool): Write in the BINARY format instead of ASCII.
+        shape (str): Shape of the cells of the unstructured grid, one of
+            :data:`SHAPES`.
+
+    Returns:
+        int: The actual number of cells.
+    """
+
+    if structured and shape != "hexahedron":
+        raise ValueError("Structured grids are made of hexahedra only")
+    dims = dimensions(cells / float(_CELLS_PER_HEXAHEDRON[shape]))
+    points = _grid_points(dims)
+    groups = _cells(dims, shape)
+    ncells = sum(len(conn) for conn, _ in groups)
+
+    with open(filename, "wb") as f:
+        f.write("# vtk DataFile Version 3.0\n")
+        f.write("Synthetic %dx%dx%d grid\n" % dims)
+        f.write("BINARY\n" if binary else "ASCII\n")
+        if structured:
+            f.write("DATASET STRUCTURED_GRID\n")
+            f.write("DIMENSIONS %d %d %d\n" % tuple(n + 1 for n in dims))
+        else:
+            f.write("DATASET UNSTRUCTURED_GRID\n")
+        f.write("POINTS %d double\n" % len(points))
+        _write_array(f, points, binary, ">f8")
+
+        if not structured:
+            tables = [np.column_stack([np.full(len(conn), conn.shape[1]),
+                                       conn]) for conn, _ in groups]
+            f.write("\nCELLS %d %d\n"
+                    % (ncells, sum(table.size for table in tables)))
+            if binary:
+                # A single block of data, without line breaks in between
+                tables = [np.concatenate([table.ravel() for table in tables])]
+            for table in tables:
+                _write_array(f, table, binary, ">i4")
+            f.write("\nCELL_TYPES %d\n" % ncells)
+            types = np.concatenate([np.full(len(conn), vtk_type)
+                                    for conn, vtk_type in groups])
+            _write_array(f, types, binary, ">i4")
+
+        f.write("\nPOINT_DATA %d\n" % len(points))
+        f.write("SCALARS PPressure double 1\nLOOKUP_TABLE default\n")
+        _write_array(f, pressure(points), binary, ">f8")
+        f.write("\nVECTORS PVelocity double\n")
+        _write_array(f, velocity(points), binary, ">f8")
+
+    return ncells
+
+
+def _foam_faces(dims):
+    """Return the faces of the grid in the OpenFOAM order.
+
+    Returns:
+        tuple: (faces, owner, neighbour, patch sizes), faces as (N, 4)
+            point indices, the internal ones first in the upper triangular
+            order, then the boundary ones patch by patch.
+    """
+
+    nx, ny, nz = dims
+    # Corners of the face normal to each axis, counter-clockwise when viewed
+    # from the positive side
+    quads = [[(0, 0, 0), (0, 1, 0), (0, 1, 1), (0, 0, 1)],
+             [(0, 0, 0), (0, 0, 1), (1, 0, 1), (1, 0, 0)],
+             [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]]
+
+    def faces_at(axis, i, j, k):
+        return np.column_stack([
+            _point_index(dims, i + di, j + dj, k + dk)
+            for di, dj, dk in quads[axis]])
+
+    def cell(i, j, k):
+        return i + nx * (j + ny * k)
+
+    internal, owner, neighbour = [], [], []
+    for axis in range(3):
+        # Faces with a cell on both sides
+        ranges = [np.arange(n) for n in dims]
+        ranges[axis] = np.arange(1, dims[axis])
+        k, j, i = [a.ravel() for a in np.meshgrid(ranges[2], ranges[1],
+                                                  ranges[0], indexing="ij")]
+        shift = [0, 0, 0]
+        shift[axis] = 1
+        internal.append(faces_at(axis, i, j, k))
+        owner.append(cell(i - shift[0], j - shift[1], k - shift[2]))
+        neighbour.append(cell(i, j, k))
+
+    internal = np.concatenate(internal)
+    owner = np.concatenate(owner)
+    neighbour = np.concatenate(neighbour)
+    order = np.lexsort([neighbour, owner])
+    faces, owners = [internal[order]], [owner[order]]
+
+    sizes = []
+    for _, axis, side in _PATCHES:
+        ranges = [np.arange(n) for n in dims]
+        ranges[axis] = np.array([dims[axis] if side else 0])
+        k, j, i = [a.ravel() for a in np.meshgrid(ranges[2], ranges[1],
+                                                  ranges[0], indexing="ij")]
+        patch = faces_at(axis, i, j, k)
+        # Normals point out of the domain
+        faces.append(patch if side else patch[:, ::-1])
+        index = [i, j, k]
+        index[axis] = index[axis] - side
+        owners.append(cell(*index))
+        sizes.append(len(patch))
+
+    return (np.concatenate(faces), np.concatenate(owners), neighbour[order],
+            sizes)
+
+
+def _foam_list(f, array, binary, header):
+    """Write a polyMesh or field list."""
+    f.write(_FOAM_HEADER % header)
+    _foam_values(f, array, binary)
+
+
+def _foam_values(f, array, binary):
+    """Write a list of labels or scalars."""
+    array = np.asarray(array)
+    integer = array.dtype.kind == "i"
+    f.write("%d\n" % len(array))
+    if binary:
+        f.write("(")
+        f.write(np.ascontiguousarray(
+            array, dtype="<i4" if integer else "<f8").tobytes())
+        f.write(")\n")
+    else:
+        f.write("(\n")
+        np.savetxt(f, array, fmt="%d" if integer else "%.9g")
+        f.write(")\n")
+
+
+def write_foam(casedir, cells, binary=False):
+    """Write an OpenFOAM case of a grid of approximately given size.
+
+    The case has the time directories '0' and '1', the fields of '1' are
+    twice the fields of '0'.
+
+    Args:
+        casedir (str): Directory of the case, created if not existing.
+        cells (int): Requested number of cells.
+        binary (bool): Write in the binary format instead of ASCII.
+
+    Returns:
+        int: The actual number of cells.
+    """
+
+    dims = dimensions(cells)
+    points = _grid_points(dims)
+    faces, owner, neighbour, sizes = _foam_faces(dims)
+    fmt = "binary" if binary else "ascii"
+
+    polymesh = os.path.join(casedir, "constant", "polyMesh")
+    if not os.path.isdir(polymesh):
+        os.makedirs(polymesh)
+
+    def header(cls, obj, location="constant/polyMesh"):
+        return {"format": fmt, "cls": cls, "location": location,
+                "object": obj}
+
+    with open(os.path.join(polymesh, "points"), "wb") as f:
+        f.write(_FOAM_HEADER % header("vectorField", "points"))
+        _write_vectors(f, points, binary)
+    with open(os.path.join(polymesh, "faces"), "wb") as f:
+        f.write(_FOAM_HEADER % header("faceCompactList", "faces"))
+        _foam_values(f, np.arange(len(faces) + 1, dtype=np.int32) * 4,
+                     binary)
+        f.write("\n")
+        _foam_values(f, faces.ravel().astype(np.int32), binary)
+    with open(os.path.join(polymesh, "owner"), "wb") as f:
+        _foam_list(f, owner.astype(np.int32), binary,
+                   header("labelList", "owner"))
+    with open(os.path.join(polymesh, "neighbour"), "wb") as f:
+        _foam_list(f, neighbour.astype(np.int32), binary,
+                   header("labelList", "neighbour"))
+
+    with open(os.path.join(polymesh, "boundary"), "wb") as f:
+        f.write(_FOAM_HEADER % dict(header("polyBoundaryMesh", "boundary"),
+                                    format="ascii"))
+        f.write("%d\n(\n" % len(_PATCHES))
+        start = len(neighbour)
+        for (name, _, _), size in zip(_PATCHES, sizes):
+            f.write("    %s\n    {\n        type patch;\n"
+                    "        nFaces %d;\n        startFace %d;\n    }\n"
+                    % (name, size, start))
+            start += size
+        f.write(")\n")
+
+    centers = _grid_points(dims)[_hexahedra(dims)].mean(axis=1)
+    for time, factor in [("0", 1.0), ("1", 2.0)]:
+        timedir = os.path.join(casedir, time)
+        if not os.path.isdir(timedir):
+            os.makedirs(timedir)
+        for name, cls, values in [
+                ("p", "volScalarField", factor * pressure(centers)),
+                ("U", "volVectorField", factor * velocity(centers))]:
+            with open(os.path.join(timedir, name), "wb") as f:
+                f.write(_FOAM_HEADER % header(cls, name, time))
+                f.write("dimensions [0 0 0 0 0 0 0];\n\n")
+                elem = "scalar" if values.ndim == 1 else "vector"
+                f.write("internalField nonuniform List<%s>\n" % elem)
+                if values.ndim == 1:
+                    _foam_values(f, values, binary)
+                else:
+                    _write_vectors(f, values, binary)
+                f.write(";\n\nboundaryField\n{\n")
+                for patch, _, _ in _PATCHES:
+                    f.write("    %s\n    {\n        type zeroGradient;\n"
+                            "    }\n" % patch)
+                f.write("}\n")
+
+    name = os.path.basename(os.path.normpath(casedir))
+    open(os.path.join(casedir, name + ".foam"), "w").close()
+    return int(np.prod(dims))
+
+
+def _write_vectors(f, vectors, binary):
+    """Write a list of vectors, (x y z) per line in ASCII."""
+    vectors = np.asarray(vectors, dtype=float)
+    f.write("%d\n" % len(vectors))
+    if binary:
+        f.write("(")
+        f.write(np.ascontiguousarray(vectors, dtype="<f8").tobytes())
+        f.write(")\n")
+        return
+    f.write("(\n")
+    np.savetxt(f, vectors, fmt="(%.9g %.9g %.9g)")
+    f.write(")\n")
+
+
+def generate(fmt, cells, output):
+    """Generate a mesh in one of the :data:`FORMATS`.
+
+    Args:
+        fmt (str): The format.
+        cells (int): Requested number of cells.
+        output (str): File name for VTK, case directory for OpenFOAM.
+
+    Returns:
+        str: Name of the file to be opened by pvtools.
+    """
+
+    if fmt == "vtk-structured":
+        write_vtk(output, cells, structured=True)
+    elif fmt in ["vtk-ascii", "vtk-binary"]:
+        write_vtk(output, cells, binary=fmt == "vtk-binary")
+    elif fmt == "vtk-tetra":
+        write_vtk(output, cells, binary=True, shape="tetrahedron")
+    elif fmt == "vtk-mixed":
+        write_vtk(output, cells, binary=True, shape="mixed")
+    elif fmt in ["foam-ascii", "foam-binary"]:
+        write_foam(output, cells, binary=fmt == "foam-binary")
+        name = os.path.basename(os.path.normpath(output))
+        return os.path.join(output, name + ".foam")
+    else:
+        raise ValueError("Unknown format %s, expected one of %s"
+                         % (fmt, ", ".join(FORMATS)))
+    return output
+
+
+def main():
+    if len(sys.argv) != 4:
+        sys.exit(__doc__)
+    print(generate(sys.argv[1], int(sys.argv[2]), sys.argv[3]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python2
+
+"""
+Benchmark of the queries on synthetic meshes of increasing size.
+
+The meshes are generated by :mod:`meshgen` into the work directory, and
+reused by the following runs. For each format, size and number of queries,
+the suite times opening the file and the queries: `probe` (one call per
+point), `probe_many`, `line`, `boundary_line` (boxes on a single plane),
+`to_dict` and `to_json` (these two with the default backend). Every repeat
+opens the file anew, so that the one-time costs, such as building the cell
+locator, are included.
+
+The results are written as JSON, and can be compared with the results of
+another version, reporting the operations slower by more than the threshold.
+
+Usage:
+    python benchmarks/suite.py [--sizes 1000 100000 10000000]
+        [--formats vtk-binary vtk-tetra foam-binary] [--queries 1 100]
+        [--backend numpy] [--output results.json] [--compare old.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import meshgen
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        os.pardir)
+sys.path.insert(0, ROOT_DIR)
+
+import pvtools
+
+OPERATIONS = ["open", "probe", "probe_many", "line", "boundary_line",
+              "to_dict", "to_json"]
+
+# Number of points of the sampled lines
+_LINE_POINTS = 100
+
+
+def _variable(fmt):
+    return "p" if fmt.startswith("foam") else "PPressure"
+
+
+def _mesh_file(workdir, fmt, cells):
+    """Return the file of the mesh, generated if not existing yet."""
+    name = "%s-%d" % (fmt, cells)
+    output = os.path.join(workdir, name if fmt.startswith("foam")
+                          else name + ".vtk")
+    filename = (os.path.join(output, name + ".foam")
+                if fmt.startswith("foam") else output)
+    if not os.path.exists(filename):
+        start = time.time()
+        meshgen.generate(fmt, cells, output)
+        sys.stderr.write("Generated %s in %.1f s\n"
+                         % (name, time.time() - start))
+    return filename
+
+
+def _queries(operation, filename, backend, variable, nqueries, rng):
+    """Return a function running the queries on an open data source.
+
+    Operations on whole files (open, to_dict, to_json) get None instead of
+    the data source.
+    """
+
+    points = rng.uniform(0.01, 0.99, (nqueries, 3))
+
+    if operation == "open":
+        return lambda ds: pvtools.DataSource(filename, backend).close()
+    elif operation == "probe":
+        return lambda ds: [ds.probe(variable, point) for point in points]
+    elif operation == "probe_many":
+        return lambda ds: ds.probe_many(variable, points)
+    elif operation == "line":
+        ends = rng.uniform(0.01, 0.99, (nqueries, 3))
+        return lambda ds: [ds.line(variable, (a, b), _LINE_POINTS)
+                           for a, b in zip(points, ends)]
+    elif operation == "boundary_line":
+        boxes = [(None, None, None, x, None, None) for x in points[:, 0]]
+        return lambda ds: [ds.boundary_line(variable, (0.5, 0.5, 0.5),
+                                            (0, 0, 1), box)
+                           for box in boxes]
+    elif operation == "to_dict":
+        return lambda ds: pvtools.to_dict(
+            "probe", filename=filename, variable=variable,
+            point=[(tuple(p), "P%d" % i) for i, p in enumerate(points)])
+    elif operation == "to_json":
+        def run(ds):
+            handle, output = tempfile.mkstemp(suffix=".json")
+            os.close(handle)
+            try:
+                pvtools.to_json(
+                    output, "probe", filename=filename, variable=variable,
+                    point=[(tuple(p), "P%d" % i)
+                           for i, p in enumerate(points)])
+            finally:
+                os.remove(output)
+        return run
+    raise ValueError("Unknown operation %s" % operation)
+
+
+def run_benchmark(filename, backend, variable, operation, nqueries, repeats,
+                  seed=0):
+    """Time the operation.
+
+    Returns:
+        List[float]: Times of the repeats in seconds.
+    """
+
+    rng = np.random.RandomState(seed)
+    run = _queries(operation, filename, backend, variable, nqueries, rng)
+    whole_file = operation in ["open", "to_dict", "to_json"]
+
+    times = []
+    for _ in range(repeats):
+        ds = None if whole_file else pvtools.DataSource(filename, backend)
+        try:
+            start = time.time()
+            run(ds)
+            times.append(time.time() - start)
+        finally:
+            if ds is not None:
+                ds.close()
+    return times
+
+
+def _metadata(backend):
+    try:
+        with open(os.devnull, "w") as devnull:
+            commit = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR,
+                stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "backend": pvtools.backends.select(backend),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def _result_key(result):
+    return (result["format"], result["cells"], result["operation"],
+            result["queries"])
+
+
+def compare(results, baseline, threshold):
+    """Print the ratios of the times to the baseline.
+
+    Returns:
+        int: Number of the operations slower by more than the threshold.
+    """
+
+    old = dict((_result_key(r), r) for r in baseline["results"])
+    regressions = 0
+    for result in results["results"]:
+        key = _result_key(result)
+        if key not in old:
+            continue
+        ratio = result["median"] / max(old[key]["median"], 1e-9)
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        print("%-16s %9d %-14s %6d %8.2fx%s" % (key + (ratio, flag)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the queries on synthetic meshes.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="numbers of cells (up to 10^7)")
+    parser.add_argument("--formats", nargs="+", choices=meshgen.FORMATS,
+                        default=["vtk-binary", "vtk-tetra", "foam-binary"])
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 100],
+                        help="numbers of queries per operation")
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS,
+                        default=OPERATIONS)
+    parser.add_argument("--backend", default="auto",
+                        choices=pvtools.backends.BACKENDS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workdir",
+                        help="directory of the generated meshes, kept for "
+                             "the following runs (temporary by default)")
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pvtools-bench-")
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    results = {"meta": _metadata(args.backend), "results": []}
+    try:
+        for fmt in args.formats:
+            for cells in args.sizes:
+                filename = _mesh_file(workdir, fmt, cells)
+                for operation in args.operations:
+                    counts = [1] if operation == "open" else args.queries
+                    for nqueries in counts:
+                        times = run_benchmark(filename, args.backend,
+                                              _variable(fmt), operation,
+                                              nqueries, args.repeats)
+                        results["results"].append({
+                            "format": fmt, "cells": cells,
+                            "operation": operation, "queries": nqueries,
+                            "median": float(np.median(times)),
+                            "min": min(times), "times": times})
+                        print("%-16s %9d %-14s %6d %10.4f s"
+                              % (fmt, cells, operation, nqueries,
+                                 np.median(times)))
+                        sys.stdout.flush()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nCompared with %s (commit %s):"
+              % (args.compare, baseline["meta"].get("commit")))
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
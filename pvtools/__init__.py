@@ -1,4 +1,7 @@
 
 
-from interface import PVTOOLS_DIR, dsopen, to_dict, to_json
+from interface import PVTOOLS_DIR, dsopen, to_dict, to_json, to_npz
 from datasource import DataSource
+from export import load_npz
+from metadata import inspect
+from profiling import Stats, profile
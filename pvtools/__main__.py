@@ -0,0 +1,57 @@
+#!/usr/bin/env python2
+
+"""
+Command line interface of pvtools.
+
+Usage:
+    python -m pvtools batch spec.json [--profile]
+    python -m pvtools inspect file... [--no-cache]
+"""
+
+import argparse
+import json
+import sys
+
+from . import batch, metadata, profiling
+
+
+def _batch(args):
+    stats = profiling.Stats() if args.profile else None
+    batch.run(args.spec, stats)
+    if stats is not None:
+        sys.stderr.write(stats.summary() + "\n")
+
+
+def _inspect(args):
+    # One line of JSON per file
+    for filename in args.files:
+        info = dict(metadata.inspect(filename, cache=not args.no_cache),
+                    filename=filename)
+        sys.stdout.write(json.dumps(info, sort_keys=True) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pvtools")
+    commands = parser.add_subparsers()
+
+    parser_batch = commands.add_parser(
+        "batch", help="run the queries of a JSON spec, see pvtools.batch")
+    parser_batch.add_argument("spec", help="JSON file of the spec")
+    parser_batch.add_argument("--profile", action="store_true",
+                              help="print the time spent in the stages")
+    parser_batch.set_defaults(command=_batch)
+
+    parser_inspect = commands.add_parser(
+        "inspect", help="print the variables, sizes, bounds and times of the "
+        "files, see pvtools.metadata")
+    parser_inspect.add_argument("files", nargs="+", help="data files")
+    parser_inspect.add_argument("--no-cache", action="store_true",
+                                help="do not use the sidecar files")
+    parser_inspect.set_defaults(command=_inspect)
+
+    args = parser.parse_args(argv)
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+
+"""
+Implements the selection of the backend reading the data files.
+
+Two backends are available: 'paraview', reading the files by Paraview
+readers and querying them by Paraview filters, and 'numpy', using the native
+readers of pvtools. Paraview is imported only when the first data source
+using it is opened, as its initialization takes several seconds.
+"""
+
+import importlib
+import os
+import pkgutil
+
+from . import foam, legacyvtk
+
+BACKENDS = ["auto", "paraview", "numpy"]
+
+# Readers of the numpy backend, indexed by the file extension
+NATIVE_READERS = {
+    ".vtk": legacyvtk.read,
+    ".foam": foam.read,
+    ".openfoam": foam.read,
+}
+
+
+class LazyModule(object):
+    """Module imported when any of its attributes is first accessed.
+
+    Args:
+        name (str): Full name of the module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def paraview_available():
+    """Return True if Paraview can be imported, without importing it."""
+    return pkgutil.find_loader("paraview") is not None
+
+
+def select(backend="auto"):
+    """Return the backend to be used for opening the files.
+
+    Args:
+        backend (str): One of BACKENDS. The 'auto' backend is Paraview if it
+            is installed, and the numpy backend otherwise.
+
+    Returns:
+        str: Either 'paraview' or 'numpy'.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: %s" % backend)
+    if backend != "auto":
+        return backend
+    return "paraview" if paraview_available() else "numpy"
+
+
+def read_native(filename, **options):
+    """Read the file by the native reader of the numpy backend.
+
+    Args:
+        filename (str): Name of the file.
+        **options: Options of the reader, such as the selected arrays.
+
+    Returns:
+        pvtools.mesh.Mesh: The mesh with the data arrays.
+    """
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in NATIVE_READERS:
+        raise ValueError("Unsupported format: %s" % extension)
+    return NATIVE_READERS[extension](filename, **options)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python2
+
+"""
+Implements batch runs of the queries described by a JSON spec.
+
+The spec lists jobs, each being the arguments of :func:`pvtools.to_json`:
+
+    {
+        "options": {"backend": "numpy"},
+        "jobs": [
+            {"name": "pressure", "output": "pressure.json",
+             "function": "probe",
+             "filename": [["case1.foam", "C1"], ["case2.foam", "C2"]],
+             "variable": [["p", "p"]],
+             "point": [[[0.0, 0.5, 0.5], "P1"], [[1.0, 0.5, 0.5], "P2"]]},
+            {"name": "profile", "output": "profile.npz", "function": "line",
+             "filename": "case1.foam", "variable": [["U X", "ux"]],
+             "line": [[[[0, 0, 0], [1, 0, 0]], "L1"]]}
+        ]
+    }
+
+Each argument is a list of [argument, key] pairs, or a single string or
+number. The results of each job are written to its output, JSON or npz by
+the extension, in the format of :func:`pvtools.to_json` or
+:func:`pvtools.to_npz`. The options are passed to
+:class:`pvtools.DataSource`.
+
+The whole batch is planned at once: every file is opened only once for all
+the jobs, with the arrays of all their variables, the identical queries of
+the jobs are run only once, the variables queried on the same geometry are
+obtained together and all the probed points sharing the rest of the
+arguments are sampled in a single pass. The results of each file are
+written as soon as the file is processed.
+
+The batch is run from the command line by `python -m pvtools batch spec.json`.
+"""
+
+import collections
+import itertools
+import json
+import os
+
+import numpy as np
+
+from . import interface, profiling
+from .datasource import DataSource, required_arrays
+from .export import JsonWriter, NpzWriter
+
+# Query of a job on one file
+_Task = collections.namedtuple(
+    "_Task", ["job", "filename_key", "function", "variables", "names",
+              "geometries", "include_in_key"])
+
+
+def _tuples(value):
+    """Convert the JSON lists to tuples, recursively."""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def load(spec):
+    """Return the spec, given as a dict or as the name of a JSON file."""
+    if isinstance(spec, basestring):
+        with open(spec) as f:
+            return json.load(f)
+    return spec
+
+
+def plan(spec):
+    """Group the queries of the jobs by files.
+
+    Args:
+        spec (dict or str): The spec, see :py:mod:`pvtools.batch`.
+
+    Returns:
+        collections.OrderedDict: Lists of the tasks indexed by the files, in
+            the order the files first appear in the jobs.
+    """
+
+    files = collections.OrderedDict()
+    names = set()
+    for job in load(spec)["jobs"]:
+        job = dict(job)
+        name = job.pop("name")
+        if name in names:
+            raise ValueError("Duplicate job %s" % name)
+        names.add(name)
+        job.pop("output", None)
+        function = job.pop("function")
+
+        kwargs = {}
+        for arg, value in job.iteritems():
+            if isinstance(value, list):
+                kwargs[arg] = [(_tuples(v), _tuples(k)) for v, k in value]
+            else:
+                kwargs[arg] = value
+        filename = kwargs.pop("filename")
+        job_files, _, query = interface.plan_query(function, filename,
+                                                   **kwargs)
+        for filename, filename_key in job_files:
+            files.setdefault(os.path.realpath(filename), []).append(
+                _Task(name, filename_key, *query))
+    return files
+
+
+def _query_file(ds, tasks):
+    """Run the tasks on the open data source.
+
+    Returns:
+        dict: Flat dicts of the results indexed by the jobs.
+    """
+
+    # Unique geometries, each with all the variables queried on it. The
+    # probed points are grouped by the rest of the arguments.
+    calls = collections.OrderedDict()
+    probes = collections.OrderedDict()
+    for task in tasks:
+        for combination in task.geometries:
+            args = dict((name, arg) for name, (arg, _)
+                        in zip(task.names, combination))
+            if task.function == "probe":
+                point = tuple(args.pop("point"))
+                group = probes.setdefault(
+                    repr(sorted(args.items())),
+                    (args, collections.OrderedDict(), set()))
+                group[1][point] = None
+                group[2].update(v for v, _ in task.variables)
+            else:
+                key = (task.function, repr(sorted(args.items())))
+                calls.setdefault(key, (args, set()))[1].update(
+                    v for v, _ in task.variables)
+
+    values = {}
+    for key, (args, variables) in calls.iteritems():
+        values[key] = getattr(ds, key[0])(sorted(variables), **args)
+    for key, (args, points, variables) in probes.iteritems():
+        res = ds.probe_many(sorted(variables), list(points), **args)
+        for i, point in enumerate(points):
+            values[("probe", repr(sorted(dict(args, point=point).items())))] \
+                = dict((variable, None if res[variable] is None
+                        or np.isnan(res[variable][i])
+                        else res[variable][i]) for variable in variables)
+
+    results = collections.defaultdict(dict)
+    for task in tasks:
+        for combination in task.geometries:
+            args = dict((name, arg) for name, (arg, _)
+                        in zip(task.names, combination))
+            if task.function == "probe":
+                args["point"] = tuple(args["point"])
+            vals = values[(task.function, repr(sorted(args.items())))]
+            for variable, variable_key in task.variables:
+                key = tuple(itertools.compress(
+                    [task.filename_key, variable_key]
+                    + [k for _, k in combination], task.include_in_key))
+                results[task.job][key] = vals[variable]
+    return results
+
+
+def iter_results(spec, stats=None):
+    """Run the batch, yielding the results of each file.
+
+    Args:
+        spec (dict or str): The spec, see :py:mod:`pvtools.batch`.
+        stats (pvtools.profiling.Stats): If given, the stages are recorded
+            there, see :py:mod:`pvtools.profiling`.
+
+    Yields:
+        tuple: (job, results) for each file and job querying it, the results
+            as a flat dict, see :func:`pvtools.to_dict`.
+    """
+
+    spec = load(spec)
+    options = spec.get("options", {})
+    for filename, tasks in plan(spec).iteritems():
+        variables = [v for task in tasks for v, _ in task.variables]
+        with profiling.stage("file", stats, filename=filename):
+            ds = DataSource(filename, **dict(
+                {"arrays": required_arrays(variables)}, **options))
+            try:
+                results = _query_file(ds, tasks)
+            finally:
+                ds.close()
+        for job in collections.OrderedDict.fromkeys(t.job for t in tasks):
+            yield job, results[job]
+
+
+def run(spec, stats=None):
+    """Run the batch and write the results of the jobs to their outputs.
+
+    Args:
+        spec (dict or str): The spec, see :py:mod:`pvtools.batch`.
+        stats (pvtools.profiling.Stats): See :func:`iter_results`.
+    """
+
+    spec = load(spec)
+    writers, files = {}, []
+    try:
+        for job in spec["jobs"]:
+            output = job.get("output", job["name"] + ".json")
+            if os.path.splitext(output)[1].lower() == ".npz":
+                writers[job["name"]] = NpzWriter(output)
+            else:
+                files.append(open(output, "w"))
+                writers[job["name"]] = JsonWriter(files[-1])
+
+        for job, results in iter_results(spec, stats):
+            # Sorted, so that the results of the same key prefix are together
+            for key in sorted(results):
+                writers[job].write(key, results[key])
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for f in files:
+            f.close()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python2
+
+"""
+Implements the persistent cache of the query results.
+
+The results of the queries on one file are stored as a single entry, in a
+binary pickle (numpy arrays are stored as raw data). The entries are keyed
+by the absolute path of the file, the sizes and modification times of all
+the files the data are read from, and by the query, so the entries of a
+modified file or of an OpenFOAM case with a new time directory are not found
+anymore and eventually evicted.
+
+The cache directory can be shared by several processes: the entries are
+written to temporary files and atomically renamed, the least recently used
+entries are removed when the total size exceeds the limit.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from . import metadata
+
+# Version of the stored entries, part of the keys
+_CACHE_VERSION = 1
+
+_SUFFIX = ".pickle"
+
+# Default limit of the total size of the entries (bytes)
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+def _normalize(value):
+    """Convert the query arguments to a canonical hashable form.
+
+    Lists, tuples and numpy arrays of the same values are considered equal,
+    as are ints and floats.
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def source_files(filename):
+    """Return the files the data of the given file are read from.
+
+    Args:
+        filename (str): Name of the opened file.
+
+    Returns:
+        List[str]: The file itself, or all the files in the case directory
+            for OpenFOAM cases.
+    """
+
+    filename = os.path.abspath(filename)
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in [".foam", ".openfoam"]:
+        return [filename]
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(os.path.dirname(filename)):
+        dirnames.sort()
+        for name in sorted(filenames):
+            # Sidecar files written by pvtools do not change the data
+            if (not name.endswith(".npz") and not name.endswith(_SUFFIX)
+                    and not name.endswith(metadata.SIDECAR_SUFFIX)):
+                files.append(os.path.join(dirpath, name))
+    return files
+
+
+class ResultCache(object):
+    """Persistent cache of the query results.
+
+    Args:
+        directory (str): Directory of the cache, created if not existing.
+        max_size (int): Limit of the total size of the entries in bytes.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def key(self, filename, *query):
+        """Return the key of the query results on the given file.
+
+        Args:
+            filename (str): Name of the queried file.
+            *query: Anything describing the query, compared after
+                normalization (see :func:`_normalize`).
+        """
+
+        state = []
+        for path in source_files(filename):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            state.append((path, stat.st_size, stat.st_mtime))
+
+        description = repr((_CACHE_VERSION, os.path.abspath(filename), state,
+                            _normalize(query)))
+        return hashlib.sha1(description).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key):
+        """Return the stored value, or None if not present."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """Store the value and evict the old entries if the cache is full."""
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmppath, self._path(key))
+        except:
+            os.remove(tmppath)
+            raise
+        self._evict()
+
+    def _entries(self):
+        """Return (mtime, size, path) of all the entries."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Remove the least recently used entries exceeding the size limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another process
+                pass
+            total -= size
+
+    def size(self):
+        """Return the total size of the entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        """Remove all the entries."""
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,452 @@
+#!/usr/bin/env python2
+
+"""
+Implements the query daemon keeping the data sources open between scripts.
+
+The daemon listens on a Unix socket, keeps the recently used data sources
+open (up to a number of them and a memory limit, the least recently used
+being closed first) and answers the queries of the clients, which may stay
+connected between their queries:
+
+    $ python -m pvtools.daemon /tmp/pvtools.sock --max-open 4
+
+    client = pvtools.daemon.Client("/tmp/pvtools.sock")
+    client.probe("case.foam", "p", (0.1, 0.2, 0.3))
+    client.to_dict("probe", filename="case.foam", variable="p", point=...)
+
+Repeated queries of the same file then pay neither the start of the
+interpreter and Paraview, nor the loading of the file. A data source is
+reopened when its files change on the disk.
+
+The messages are frames of bytes prefixed by their length. The requests and
+the headers of the results are pickled, the numeric arrays are sent as raw
+bytes following their header, so that large results are neither pickled nor
+copied. Unpickling executes code, so the socket is accessible only to the
+user running the daemon.
+"""
+
+import argparse
+import collections
+import cPickle as pickle
+import os
+import select
+import socket
+import stat
+import struct
+import traceback
+
+import numpy as np
+
+from . import interface, metadata
+from .datasource import DataSource
+
+_LENGTH = struct.Struct("!Q")
+
+# Methods of DataSource the clients can call
+_METHODS = ["probe", "probe_many", "line", "boundary_line", "integrate",
+            "average", "minmax", "flux", "extract", "times", "get_variables"]
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_LENGTH.pack(len(payload)))
+    sock.sendall(payload)
+
+
+def _recv_into(sock, view):
+    """Fill the memoryview from the socket."""
+    pos = 0
+    while pos < len(view):
+        count = sock.recv_into(view[pos:], len(view) - pos)
+        if not count:
+            raise EOFError("Connection closed")
+        pos += count
+
+
+def _recv_frame(sock):
+    """Receive a frame, or return None if the connection is closed."""
+    header = bytearray(_LENGTH.size)
+    try:
+        _recv_into(sock, memoryview(header))
+    except EOFError:
+        return None
+    payload = bytearray(_LENGTH.unpack(bytes(header))[0])
+    _recv_into(sock, memoryview(payload))
+    return bytes(payload)
+
+
+def _send_message(sock, message):
+    _send_frame(sock, pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+
+def _recv_message(sock):
+    frame = _recv_frame(sock)
+    return None if frame is None else pickle.loads(frame)
+
+
+def _send_item(sock, key, value):
+    """Send a result, the numeric arrays as raw bytes."""
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        value = np.ascontiguousarray(value)
+        _send_message(sock, ("item", key, None,
+                             (value.dtype.str, value.shape)))
+        sock.sendall(_LENGTH.pack(value.nbytes))
+        sock.sendall(buffer(value))
+    else:
+        _send_message(sock, ("item", key, value, None))
+
+
+def _recv_item(sock, message):
+    """Return the (key, value) of the result announced by the message."""
+    _, key, value, layout = message
+    if layout is not None:
+        dtype, shape = layout
+        value = np.empty(shape, dtype=np.dtype(dtype))
+        header = bytearray(_LENGTH.size)
+        _recv_into(sock, memoryview(header))
+        _recv_into(sock, memoryview(value.reshape(-1).view(np.uint8)))
+    return key, value
+
+
+def _remove_stale_socket(path):
+    """Remove the socket left by a daemon which is no longer running.
+
+    Raises:
+        RuntimeError: If a daemon is listening on the socket, or the path is
+            not a socket.
+    """
+
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError("%s exists and is not a socket" % path)
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:
+        # Nobody listening
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError("A daemon is already running on %s" % path)
+
+
+def _memory_usage():
+    """Return the resident memory of the process in bytes, None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE")
+
+
+class SourcePool(object):
+    """Open data sources, the least recently used closed first.
+
+    Args:
+        max_open (int): Maximal number of the open data sources.
+        max_memory (int): Memory of the process (bytes) above which the data
+            sources are closed, but the last used one. Not limited if None.
+    """
+
+    def __init__(self, max_open=8, max_memory=None):
+        self.max_open = max_open
+        self.max_memory = max_memory
+        self._sources = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._sources)
+
+    def get(self, filename, **options):
+        """Return the data source of the file, opened with the options.
+
+        The data source is reopened if the file changed since it was opened.
+        """
+
+        key = (os.path.realpath(filename), repr(sorted(options.items())))
+        signature = metadata.signature(filename)
+        entry = self._sources.pop(key, None)
+        if entry is not None and entry[1] != signature:
+            entry[0].close()
+            entry = None
+        if entry is None:
+            entry = (DataSource(filename, **options), signature)
+        self._sources[key] = entry
+        self.evict()
+        return entry[0]
+
+    def evict(self):
+        """Close the data sources exceeding the limits."""
+        while len(self._sources) > max(self.max_open, 1):
+            self._close_oldest()
+        while (self.max_memory is not None and len(self._sources) > 1
+               and _memory_usage() > self.max_memory):
+            self._close_oldest()
+
+    def _close_oldest(self):
+        _, (ds, _) = self._sources.popitem(last=False)
+        ds.close()
+
+    def close(self):
+        """Close all the data sources."""
+        while self._sources:
+            self._close_oldest()
+
+
+class Server(object):
+    """Daemon answering the queries on a Unix socket.
+
+    Args:
+        socket_path (str): Path of the socket to be created.
+        max_open (int): See :class:`SourcePool`.
+        max_memory (int): See :class:`SourcePool`.
+    """
+
+    def __init__(self, socket_path, max_open=8, max_memory=None):
+        self.socket_path = socket_path
+        self.pool = SourcePool(max_open, max_memory)
+        self._running = False
+
+    def serve_forever(self):
+        """Answer the clients, until shut down.
+
+        The clients may stay connected between their requests, the requests
+        of all the connected clients are answered one after another as they
+        arrive. A socket left by a daemon no longer running is replaced.
+
+        Raises:
+            RuntimeError: If another daemon is running on the socket.
+        """
+
+        _remove_stale_socket(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen(5)
+
+        self._running = True
+        connections = []
+        try:
+            while self._running:
+                readable, _, _ = select.select([listener] + connections,
+                                               [], [])
+                for sock in readable:
+                    if sock is listener:
+                        connections.append(listener.accept()[0])
+                    elif not self._serve_request(sock):
+                        connections.remove(sock)
+                        sock.close()
+                    if not self._running:
+                        break
+        finally:
+            for conn in connections:
+                conn.close()
+            listener.close()
+            os.remove(self.socket_path)
+            self.pool.close()
+
+    def _serve_request(self, conn):
+        """Answer a request of the client.
+
+        Returns:
+            bool: False if the connection was closed.
+        """
+
+        try:
+            request = _recv_message(conn)
+            if request is None:
+                return False
+            try:
+                self._handle(conn, request)
+            except (socket.error, EOFError):
+                raise
+            except Exception:
+                _send_message(conn, ("error", traceback.format_exc()))
+            else:
+                _send_message(conn, ("end",))
+        except (socket.error, EOFError):
+            return False
+        return True
+
+    def _handle(self, conn, request):
+        """Answer the request, sending the results as they are available.
+
+        Requests are tuples (operation, arguments...):
+            ('call', filename, options, method, args, kwargs)
+                Call the DataSource method on the file, opened with the
+                options. A dict result is sent item by item.
+            ('to_dict', options, function, filename, kwargs)
+                Run :func:`pvtools.to_dict`, the results of each file are
+                sent as soon as the file is processed.
+            ('status',)
+                Send the number of the open data sources and the memory.
+            ('shutdown',)
+                Stop the daemon.
+        """
+
+        operation = request[0]
+        if operation == "call":
+            filename, options, method, args, kwargs = request[1:]
+            if method not in _METHODS:
+                raise ValueError("Unsupported method %s" % method)
+            result = getattr(self.pool.get(filename, **options), method)(
+                *args, **kwargs)
+            if isinstance(result, dict):
+                _send_message(conn, ("dict",))
+                for key, value in result.iteritems():
+                    _send_item(conn, (key,), value)
+            else:
+                _send_item(conn, (), result)
+        elif operation == "to_dict":
+            options, function, filename, kwargs = request[1:]
+            for file_res in interface.query_datasources(
+                    function, filename,
+                    lambda path: self.pool.get(path, **options), **kwargs):
+                for key, value in file_res.iteritems():
+                    _send_item(conn, key, value)
+        elif operation == "status":
+            _send_item(conn, (), {"open": len(self.pool),
+                                  "memory": _memory_usage()})
+        elif operation == "shutdown":
+            self._running = False
+        else:
+            raise ValueError("Unknown request %s" % operation)
+
+
+class Client(object):
+    """Client of the query daemon.
+
+    The methods mirror those of :class:`pvtools.DataSource` and
+    :func:`pvtools.to_dict`, taking the file name in addition. Errors of the
+    daemon are raised as RuntimeError with the original traceback.
+
+    Args:
+        socket_path (str): Path of the socket of the daemon.
+        **options: Options of the data sources, such as the backend, see
+            :py:meth:`pvtools.datasource.DataSource.__init__`.
+    """
+
+    def __init__(self, socket_path, **options):
+        self.options = options
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, request):
+        """Send the request and return the received results.
+
+        Returns:
+            tuple: (is_dict, results), the results as a dict indexed by the
+                keys of the items.
+        """
+
+        _send_message(self._sock, request)
+        results, is_dict = {}, False
+        while True:
+            message = _recv_message(self._sock)
+            if message is None:
+                raise RuntimeError("Connection to the daemon closed")
+            if message[0] == "item":
+                key, value = _recv_item(self._sock, message)
+                results[key] = value
+            elif message[0] == "dict":
+                is_dict = True
+            elif message[0] == "error":
+                raise RuntimeError("Query failed in the daemon:\n%s"
+                                   % message[1])
+            else:
+                return is_dict, results
+
+    def call(self, filename, method, *args, **kwargs):
+        """Call the method of the data source of the file.
+
+        Args:
+            filename (str): Name of the file.
+            method (str): Name of the :class:`pvtools.DataSource` method,
+                such as 'probe'.
+            *args, **kwargs: Arguments of the method.
+        """
+
+        is_dict, results = self._request(
+            ("call", os.path.abspath(filename), self.options, method, args,
+             kwargs))
+        if is_dict:
+            return dict((key[0], value) for key, value in results.iteritems())
+        return results[()]
+
+    def probe(self, filename, *args, **kwargs):
+        """See :py:meth:`pvtools.DataSource.probe`."""
+        return self.call(filename, "probe", *args, **kwargs)
+
+    def probe_many(self, filename, *args, **kwargs):
+        """See :py:meth:`pvtools.DataSource.probe_many`."""
+        return self.call(filename, "probe_many", *args, **kwargs)
+
+    def line(self, filename, *args, **kwargs):
+        """See :py:meth:`pvtools.DataSource.line`."""
+        return self.call(filename, "line", *args, **kwargs)
+
+    def boundary_line(self, filename, *args, **kwargs):
+        """See :py:meth:`pvtools.DataSource.boundary_line`."""
+        return self.call(filename, "boundary_line", *args, **kwargs)
+
+    def to_dict(self, function, filename, **kwargs):
+        """See :func:`pvtools.to_dict`.
+
+        The files are queried by the daemon one after another.
+        """
+
+        kwargs = dict(kwargs)
+        if isinstance(filename, list):
+            filename = [(os.path.abspath(f), key) for f, key in filename]
+        else:
+            filename = os.path.abspath(filename)
+        return self._request(("to_dict", self.options, function, filename,
+                              kwargs))[1]
+
+    def status(self):
+        """Return the number of the open data sources and the memory used."""
+        return self._request(("status",))[1][()]
+
+    def shutdown(self):
+        """Stop the daemon."""
+        self._request(("shutdown",))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer pvtools queries on a Unix socket, keeping the "
+                    "data sources open.")
+    parser.add_argument("socket", help="path of the socket")
+    parser.add_argument("--max-open", type=int, default=8,
+                        help="maximal number of the open data sources")
+    parser.add_argument("--max-memory", type=float,
+                        help="memory limit in MB, the least recently used "
+                             "data sources are closed above it")
+    args = parser.parse_args()
+
+    max_memory = (None if args.max_memory is None
+                  else int(args.max_memory * 2**20))
+    try:
+        Server(args.socket, args.max_open, max_memory).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,102 @@
 Implements DataSource class for accessing datafiles through Paraview.
 """
 
+import collections
 import os
 import sys
 from contextlib import contextmanager
 import cStringIO
+from time import sleep
 
 import numpy as np
-import paraview.simple as pvs
-import vtk.numpy_interface.dataset_adapter as dsa
+
+from . import backends, foam, locator, profiling, reduction
+from .mesh import LazyDict, split_cells
+from .surface import Surface
+
+# Paraview is imported only when needed, see pvtools.backends
+pvs = backends.LazyModule("paraview.simple")
+dsa = backends.LazyModule("vtk.numpy_interface.dataset_adapter")
+vtk = backends.LazyModule("vtk")
+numpy_support = backends.LazyModule("vtk.util.numpy_support")
 
 
 _COORDS = {"X": 0, "Y": 1, "Z": 2}
 
 
+# Number of points of the lines the reductions are computed on by default
+_LINE_POINTS = 100
+
+# Default tolerance of the adaptive lines, relative to the range of the values
+_LINE_TOLERANCE = 1e-3
+
+# Maximal number of halvings of the initial intervals of the adaptive lines
+_MAX_REFINEMENTS = 10
+
+# Arrays computed by the Calculator filters of the reductions
+_CALCULATED = "pvtools(%s)"
+
+_REGION_KINDS = ["line", "plane", "box", "patch"]
+
+# Meshes of the numpy backend having time directories
+_FOAM_MESHES = (foam.FoamMesh, foam.DecomposedMesh)
+
+
+def required_arrays(variables):
+    """Return the names of the data arrays needed to query the variables.
+
+    Args:
+        variables (str or List[str]): Names of the variables, as taken by
+            :py:meth:`DataSource.probe`.
+
+    Returns:
+        List[str]: Sorted names of the arrays. The component suffixes are
+            removed, but the full names are kept as well, as arrays of such
+            names can exist too. Coordinates need no array.
+    """
+
+    if isinstance(variables, basestring):
+        variables = [variables]
+    arrays = set()
+    for variable in variables:
+        if variable in _COORDS:
+            continue
+        arrays.add(variable)
+        if variable[-2:] in [" X", " Y", " Z"]:
+            arrays.add(variable[:-2])
+    return sorted(arrays)
+
+
+def _foam_reader(filename):
+    """Return the Paraview OpenFOAM reader of the case.
+
+    Decomposed cases are read from the processor directories, unless the
+    case is reconstructed, as by :func:`pvtools.foam.read`. The time zero is
+    listed as by :meth:`pvtools.foam.FoamCase.times`.
+    """
+    reader = pvs.OpenFOAMReader(FileName=filename, SkipZeroTime=0)
+    if foam.processor_dirs(filename):
+        reader.CaseType = "Decomposed Case"
+    return reader
+
+
+def _configure_foam_reader(reader, arrays, regions, cell_to_point):
+    """Select the data read by the Paraview OpenFOAM reader.
+
+    See :py:meth:`DataSource.__init__` for the arguments.
+    """
+
+    if arrays is not None:
+        for name in ["CellArrays", "PointArrays", "LagrangianArrays"]:
+            prop = getattr(reader, name)
+            setattr(reader, name, [array for array in prop.Available
+                                   if array in arrays])
+    if regions is not None:
+        reader.MeshRegions = list(regions)
+    if cell_to_point is not None:
+        reader.Createcelltopointfiltereddata = int(bool(cell_to_point))
+
+
 @contextmanager
 def _nostdout():
     save_stdout = sys.stdout
@@ -27,110 +110,494 @@ def _nostdout():
 
 def _to_vtkarray(pvobject):
     """Convert object to VTKArray, which we known how to work with."""
-    if isinstance(pvobject, dsa.VTKCompositeDataArray):
+    if isinstance(pvobject, np.ndarray):
+        # VTKArray, or plain array from the numpy backend
+        return pvobject
+    elif isinstance(pvobject, dsa.VTKCompositeDataArray):
         arrs = pvobject.GetArrays()
         if len(arrs) != 1:
             raise ValueError("Cannot deal with VTKCompositeDataArray of length %s."
                              % len(arrs))
         else:
             return arrs[0]
-    elif isinstance(pvobject, dsa.VTKArray):
-        return pvobject
     else:
         raise ValueError("Cannot deal with %s." % type(pvobject))
 
 
-def _get_variable_array(pvobject, variable, skip_invalid=True):
-    """Get numerical array for given variable.
+def _fetch(pvobject, time=None):
+    """Fetch the output of the pipeline object and wrap it for numpy access.
 
-    Returns:
-         numpy.ndarray: Array of the variable values. If it does not exist,
-                        returns None.
+    Args:
+        pvobject: Pipeline object to be fetched.
+        time (float): Time of the data. If None, the pipeline is updated at
+            the time it was updated last.
     """
 
+    if time is not None:
+        with profiling.stage("update"):
+            pvobject.UpdatePipeline(time=time)
+
     # Paraview prints unwanted messages, such as "use append poly data filter".
     # We might possibly lose something of interest here.
-    with _nostdout():
+    with profiling.stage("fetch") as fetch, _nostdout():
         rawdata = pvs.servermanager.Fetch(pvobject)
+        if fetch.enabled:
+            fetch.nbytes = rawdata.GetActualMemorySize() * 1024
+
+    with profiling.stage("wrap"):
+        return dsa.WrapDataObject(rawdata)
+
+
+def _magnitude(vectors, dtype=None):
+    """Return the magnitudes of the (N, 3) vectors.
+
+    Only the result is allocated, squared and rooted in place. It is of the
+    type of the vectors by default.
+    """
+    result = np.einsum("ij,ij->i", vectors, vectors, dtype=dtype,
+                       casting="same_kind")
+    return np.sqrt(result, out=result)
+
 
-    data = dsa.WrapDataObject(rawdata)
+def _has_variable(arrays, variable):
+    """Return True if the arrays contain the variable or its vector."""
+    names = arrays.keys()
+    return variable in names or (variable[-2:] in [" X", " Y", " Z"]
+                                 and variable[:-2] in names)
 
-    if variable in data.PointData.keys():
+
+def _check_loc(loc):
+    """Raise ValueError unless loc is a location of the data or None."""
+    if loc not in [None, "point", "cell"]:
+        raise ValueError("Unknown location %s, expected 'point' or 'cell'"
+                         % loc)
+
+
+def _variable_arrays(data, variable, loc=None):
+    """Return the arrays of the data the variable is to be taken from.
+
+    Args:
+        data: Wrapped data object, as returned by :func:`_fetch`.
+        variable (str): Name of the variable.
+        loc (str): 'point' or 'cell' for the point or the cell data. By
+            default the point data, or the cell data if only they contain the
+            variable.
+    """
+
+    _check_loc(loc)
+    cell_data = getattr(data, "CellData", None)
+    if loc == "cell":
+        return cell_data if cell_data is not None else {}
+    if (loc is None and cell_data is not None
+            and not _has_variable(data.PointData, variable)
+            and _has_variable(cell_data, variable)):
+        return cell_data
+    return data.PointData
+
+
+def _extract_variable(data, variable, skip_invalid=True, copy=True,
+                      dtype=None, loc=None):
+    """Get numerical array for given variable from already fetched data.
+
+    Args:
+        data: Wrapped data object, as returned by :func:`_fetch`.
+        variable (str): Name of the variable.
+        skip_invalid (bool): If True, values at the points marked as invalid
+            are left out. Otherwise, they are replaced by NaN.
+        copy (bool): If False, the array is a read-only view of the fetched
+            data where possible (scalars and vector components of data
+            without invalid points), rather than a copy.
+        dtype (numpy.dtype): Type of the returned array. By default, the type
+            of the data, or float64 if the invalid points are replaced by NaN.
+        loc (str): See :func:`_variable_arrays`. The coordinates are those of
+            the points in any case.
+
+    Returns:
+         numpy.ndarray: Array of the variable values. If it does not exist,
+                        returns None.
+    """
+
+    arrays = _variable_arrays(data, variable, loc)
+    if variable in arrays.keys():
         # Scalar or vector
-        results = _to_vtkarray(data.PointData[variable])
+        results = _to_vtkarray(arrays[variable])
 
         if results.ndim == 2 and results.shape[1] == 3:
             # Vector: Calculate its magnitude
-            results = np.sqrt(np.sum(results**2, axis=1))
+            results = _magnitude(results, dtype)
     elif variable in ["X", "Y", "Z"]:
         # Coordinate
         idx = _COORDS[variable]
         results = _to_vtkarray(data.Points)[:, idx]
     elif (variable[-2:] in [" X", " Y", " Z"]
-          and variable[:-2] in data.PointData.keys()):
+          and variable[:-2] in arrays.keys()):
         # Vector component
         idx = _COORDS[variable[-1]]
-        results = _to_vtkarray(data.PointData[variable[:-2]])[:, idx]
+        results = _to_vtkarray(arrays[variable[:-2]])[:, idx]
     else:
         return None
 
-    if skip_invalid and "vtkValidPointMask" in data.PointData.keys():
-        valid = data.PointData["vtkValidPointMask"]
-        results = results[valid == 1]
+    if "vtkValidPointMask" in data.PointData.keys():
+        invalid = _to_vtkarray(data.PointData["vtkValidPointMask"]) != 1
+        # Masking copies, so it is left out when all the points are valid
+        if skip_invalid:
+            if invalid.any():
+                results = results[~invalid]
+        else:
+            dtype = float if dtype is None else dtype
+            if invalid.any():
+                results = np.array(results, dtype=dtype)
+                results[invalid] = np.nan
+
+    if copy:
+        return np.array(results, dtype=dtype)
+    view = np.asarray(results, dtype=dtype)
+    if view.base is not None:
+        # Shared with the fetched data, or with the mesh of the numpy backend
+        view.flags.writeable = False
+    return view
+
+
+def _extract_variables(data, variables, skip_invalid=True, copy=True,
+                       dtype=None, loc=None):
+    """Get numerical arrays for one or more variables from fetched data.
+
+    Returns:
+        If variables is a single name, the same as :func:`_extract_variable`.
+        If it is a list of names, dict mapping the names to the arrays.
+    """
+
+    with profiling.stage("extract"):
+        if isinstance(variables, basestring):
+            return _extract_variable(data, variables, skip_invalid, copy,
+                                     dtype, loc)
+        else:
+            return dict((variable, _extract_variable(
+                data, variable, skip_invalid, copy, dtype, loc))
+                for variable in variables)
+
+
+def _get_variable_array(pvobject, variable, skip_invalid=True, time=None,
+                        copy=True, dtype=None, loc=None):
+    """Get numerical array for given variable.
+
+    The data are fetched only once even if several variables are requested.
+
+    Args:
+        pvobject: Pipeline object to be fetched.
+        variable (str or List[str]): Name of the variable or list of names.
+        skip_invalid (bool): See :func:`_extract_variable`.
+        time (float): See :func:`_fetch`.
+        copy (bool): See :func:`_extract_variable`.
+        dtype (numpy.dtype): See :func:`_extract_variable`.
+        loc (str): See :func:`_extract_variable`.
+
+    Returns:
+         numpy.ndarray: Array of the variable values. If it does not exist,
+                        returns None. If a list of variables is given,
+                        dict of such arrays indexed by the variable names.
+    """
+
+    return _extract_variables(_fetch(pvobject, time), variable, skip_invalid,
+                              copy, dtype, loc)
+
+
+def _value_columns(values, npoints):
+    """Return the probed values as columns of a (npoints, n) array.
+
+    Args:
+        values: Values as returned by :py:meth:`DataSource.probe_many`. The
+            missing variables are skipped.
+    """
+    if not isinstance(values, dict):
+        values = {None: values}
+    columns = [np.asarray(array, dtype=float).reshape(npoints, -1)
+               for _, array in sorted(values.items()) if array is not None]
+    return np.hstack(columns or [np.zeros((npoints, 0))])
+
+
+class _MeshData(object):
+    """Mesh of the numpy backend with the attribute names of the VTK dataset
+    adapter, see :class:`pvtools.locator.PointSamples`."""
+
+    def __init__(self, mesh):
+        self.Points = mesh.points
+        self.PointData = mesh.point_data
+        self.CellData = mesh.cell_data
+
+
+class _CellsData(object):
+    """Data of the selected cells, with the cell centres as the points.
+
+    The attribute names follow the VTK dataset adapter, see
+    :class:`pvtools.locator.PointSamples`. Only the rows of the selected
+    cells are gathered from the arrays.
+
+    Args:
+        data: Mesh of the numpy backend, or the wrapped output of the
+            Paraview CellCenters filter, whose point data are the cell data.
+        centres (numpy.ndarray): (N, 3) centres of all the cells.
+        cells (numpy.ndarray): Indices of the selected cells.
+    """
+
+    def __init__(self, data, centres, cells):
+        self.Points = centres[cells]
+        arrays = getattr(data, "cell_data", None)
+        if arrays is None:
+            arrays = data.PointData
+        self.PointData = {}
+        self.CellData = LazyDict(dict(
+            (name, lambda name=name: _to_vtkarray(arrays[name])[cells])
+            for name in arrays.keys()))
+
+
+def _single_value(array):
+    """Return the only element of the array, or None if it is empty."""
+    if array is None or len(array) == 0:
+        return None
+    elif len(array) != 1:
+        raise Exception("Unexpected length of the array.")
+    else:
+        return array[0]
+
+
+def _points_source():
+    """Create a source producing a point cloud, see :func:`_set_points`."""
+    return pvs.TrivialProducer()
+
+
+def _set_points(source, points):
+    """Set the (N, 3) array of the points produced by the source.
+
+    The coordinates are handed to the VTK object of the source as a VTK
+    array, so this requires the built-in session of pvpython or of the
+    Python interpreter, where the client and the server are one process.
+    """
+
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=1))
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(vtk_points)
+    source.GetClientSideObject().SetOutput(polydata)
+    # The proxy is not aware of the changed data otherwise
+    source.SMProxy.MarkModified(source.SMProxy)
+
+
+def _resample_with_dataset(pv_input, destination):
+    """Sample pv_input at the points of destination.
+
+    The property names of the filter changed between Paraview versions,
+    both variants are handled here.
+    """
+
+    pvs.SetActiveSource(pv_input)
+    resample = pvs.ResampleWithDataset()
+    if "DestinationMesh" in resample.ListProperties():
+        resample.SourceDataArrays = pv_input
+        resample.DestinationMesh = destination
+    else:
+        resample.Input = pv_input
+        resample.Source = destination
+    return resample
+
+
+def _pass_arrays(pv_input, loc):
+    """Keep only the point or only the cell arrays of the input.
+
+    The sampling filters pass the cell arrays of their input as point arrays,
+    so this selects which of the arrays of the same name are sampled.
+    """
+
+    passed = pvs.PassArrays(Input=pv_input)
+    if loc == "cell":
+        passed.PointDataArrays = []
+        passed.CellDataArrays = list(pv_input.CellData.keys())
+    else:
+        passed.PointDataArrays = list(pv_input.PointData.keys())
+        passed.CellDataArrays = []
+    return passed
+
+
+def _threshold_valid(pv_input):
+    """Keep the cells of the input whose points are all valid.
+
+    The property names of the filter changed between Paraview versions,
+    both variants are handled here.
+    """
+
+    threshold = pvs.Threshold(Input=pv_input)
+    threshold.Scalars = ["POINTS", "vtkValidPointMask"]
+    if "LowerThreshold" in threshold.ListProperties():
+        threshold.LowerThreshold = 1
+        threshold.UpperThreshold = 1
+    else:
+        threshold.ThresholdRange = [1, 1]
+    return threshold
+
+
+def _set_box(box, bounding_box, bounds):
+    """Set the implicit box function to the bounding box.
+
+    The missing bounds are taken from the data bounds (xmin, xmax, ymin, ...),
+    with a margin, so that the cells on the boundary are inside.
+    """
+
+    size = max(bounds[2 * i + 1] - bounds[2 * i] for i in range(3))
+    lower = [bounds[2 * i] - size if b is None else b
+             for i, b in enumerate(bounding_box[:3])]
+    upper = [bounds[2 * i + 1] + size if b is None else b
+             for i, b in enumerate(bounding_box[3:])]
+    box.Position = lower
+    lengths = [hi - lo for lo, hi in zip(lower, upper)]
+    if "Length" in box.ListProperties():
+        box.Length = lengths
+    else:
+        box.Scale = lengths
+
 
-    return np.array(results) if (results is not None) else None
+def _patch_region(reader, name):
+    """Return the mesh region of the OpenFOAM reader of the patch."""
+    available = reader.MeshRegions.Available
+    for region in ["patch/" + name, name]:
+        if region in available:
+            return region
+    raise ValueError("No patch %s in the case" % name)
 
 
-def _add_clip(pv_input, origin, normal):
-    clip = pvs.Clip(Input=pv_input)
-    clip.ClipType = 'Plane'
-    clip.ClipType.Origin = origin
-    clip.ClipType.Normal = normal
-    return clip
+def _integrated_value(data, variable):
+    """Get the integral of the variable from the IntegrateVariables output.
 
-def _add_bounding_box(pv_input, bounding_box):
-    (minx, miny, minz, maxx, maxy, maxz) = bounding_box
-    latest = pv_input
+    Vector magnitudes and coordinates are integrated as the arrays of the
+    Calculator filters, see :py:meth:`DataSource._reduction_input`.
+    """
+
+    name = _CALCULATED % variable
+    if name in data.PointData.keys():
+        values = _to_vtkarray(data.PointData[name])
+    else:
+        values = _extract_variable(data, variable, loc="point")
+    value = _single_value(values)
+    return None if value is None else float(value)
 
-    if minx: latest = _add_clip(latest, [minx, 0, 0], [1, 0, 0])
-    if miny: latest = _add_clip(latest, [0, miny, 0], [0, 1, 0])
-    if minz: latest = _add_clip(latest, [0, 0, minz], [0, 0, 1])
-    if maxx: latest = _add_clip(latest, [maxx, 0, 0], [-1, 0, 0])
-    if maxy: latest = _add_clip(latest, [0, maxy, 0], [0, -1, 0])
-    if maxz: latest = _add_clip(latest, [0, 0, maxz], [0, 0, -1])
 
-    return latest
+def _integrated_measure(data):
+    """Get the length, area or volume from the IntegrateVariables output."""
+    for name in ["Volume", "Area", "Length"]:
+        if name in data.CellData.keys():
+            value = _single_value(_to_vtkarray(data.CellData[name]))
+            if value:
+                return float(value)
+    return 0.0
+
+
+def _fetch_surface(pvobject, time=None):
+    """Fetch the polygonal surface produced by the pipeline object.
+
+    The surface is expected to consist of polygons only, so that the cell
+    data are those of the polygons.
+
+    Returns:
+        tuple: (:class:`pvtools.surface.Surface`, point data, cell data)
+    """
+
+    data = _fetch(pvobject, time)
+    polys = np.asarray(_to_vtkarray(data.Polygons))
+    offsets, connectivity = split_cells(polys,
+                                        data.VTKObject.GetNumberOfPolys())
+    surface = Surface(_to_vtkarray(data.Points), offsets, connectivity)
+    return surface, data.PointData, data.CellData
 
 
 class DataSource:
     """Class for accessing datafiles through Paraview"""
 
     reader = None
+    mesh = None
+    backend = None
     fullpath = None
+    time = None
+    stats = None
 
-    def __init__(self, filename):
+    def __init__(self, filename, backend="auto", cache_index=False,
+                 stats=None, arrays=None, regions=None, cell_to_point=None):
         """Open the data source.
 
         Args:
             filename (str): Name of the file to be opened.
+            backend (str): One of 'auto', 'paraview' or 'numpy'.
+                The numpy backend reads the file by the native readers
+                implemented in pvtools (see :py:mod:`pvtools.legacyvtk` and
+                :py:mod:`pvtools.foam`), without Paraview. The 'auto' backend
+                is Paraview if installed, numpy otherwise.
+            cache_index (bool): Only for the numpy backend. If True, the cell
+                locator used for probing is stored in a sidecar file next to
+                the data file, and loaded from it when the file is reopened.
+            stats (pvtools.profiling.Stats): If given, the stages of opening
+                the file and of all the queries are recorded there, see
+                :py:mod:`pvtools.profiling`.
+            arrays (List[str]): Names of the data arrays to be read, all by
+                default. The other arrays are not loaded at all (the Paraview
+                reader of legacy VTK files reads all the arrays regardless).
+                See :func:`required_arrays` for the arrays of given variables.
+            regions (List[str]): Only for OpenFOAM cases, the mesh regions to
+                be read by the Paraview reader, such as 'internalMesh' or
+                the patch names. The internal mesh only by default. The numpy
+                backend reads only the internal mesh.
+            cell_to_point (bool): Only for OpenFOAM cases, whether the cell
+                data are interpolated to the points. True by default.
+
+        The data are queried at the last time available when the file is
+        opened (:py:attr:`time`), unless a time is given to the query.
         """
 
         if not os.path.isfile(filename):
             raise ValueError("File %s does not exist" % filename)
+        backend = backends.select(backend)
 
+        self.stats = stats
         extension = os.path.splitext(filename)[1].lower()
-        if extension == ".vtk":
-            self.reader = pvs.LegacyVTKReader(FileNames=[filename])
-        elif extension in [".foam", ".openfoam"]:
-            self.reader = pvs.OpenFOAMReader(FileName=filename)
-            self.reader.UpdatePipeline(time=self.reader.TimestepValues[-1])
-        else:
-            raise ValueError("Unsupported format: %s" % extension)
+        is_foam = extension in [".foam", ".openfoam"]
+        if regions is not None and (
+                not is_foam or (backend == "numpy"
+                                and list(regions) != ["internalMesh"])):
+            raise ValueError("Regions other than the internal mesh of "
+                             "OpenFOAM cases are not supported by the %s "
+                             "backend" % backend)
 
+        with self._stage("open", filename=filename):
+            if backend == "numpy":
+                options = {"arrays": arrays}
+                if is_foam and cell_to_point is not None:
+                    options["cell_to_point"] = cell_to_point
+                self.mesh = backends.read_native(filename, **options)
+                if isinstance(self.mesh, _FOAM_MESHES):
+                    self.time = float(self.mesh.time)
+            elif extension == ".vtk":
+                self.reader = pvs.LegacyVTKReader(FileNames=[filename])
+            elif is_foam:
+                self.reader = _foam_reader(filename)
+                # Before the first update, so that nothing else is read
+                _configure_foam_reader(self.reader, arrays, regions,
+                                       cell_to_point)
+                self.time = self.times()[-1]
+                with profiling.stage("update"):
+                    self.reader.UpdatePipeline(time=self.time)
+            else:
+                raise ValueError("Unsupported format: %s" % extension)
+
+        self.backend = backend
         self.fullpath = os.path.abspath(filename)
+        self._cache_index = cache_index
+        self._locator = None
+        self._time_mesh = None
+        self._filters = collections.OrderedDict()
+        self._surface = None
+        self._curves = None
+        self._region = None
 
     def __str__(self):
-        if self.reader:
+        if self.reader or self.mesh:
             status = "open, \"%s\"" % self.fullpath
         else:
             status = "closed"
@@ -140,12 +607,179 @@ class DataSource:
     def close(self):
         """Close the data source."""
 
-        pvs.Delete(self.reader)
+        # Downstream filters are to be deleted first
+        for proxies in reversed(self._filters.values()):
+            for proxy in reversed(proxies):
+                pvs.Delete(proxy)
+        self._filters.clear()
+
+        if self.reader:
+            pvs.Delete(self.reader)
         self.reader = None
+        self.mesh = None
+        self._locator = None
+        self._time_mesh = None
+        self._surface = None
+        self._curves = None
+        self._region = None
         self.fullpath = None
 
+    def _pooled(self, key, create):
+        """Return the filters of the given query type, created on first use.
+
+        The filters are reused by all the queries of the same type, only
+        their properties are updated. They are deleted by :py:meth:`close`.
+
+        Args:
+            key: Identifier of the query type.
+            create (callable): Function without arguments returning the list
+                of the filters, in the order of the pipeline.
+        """
+        if key not in self._filters:
+            with profiling.stage("filters", query=key):
+                self._filters[key] = create()
+        return self._filters[key]
+
+    def _sampled(self, loc):
+        """Return the input of the Paraview sampling filters.
+
+        Args:
+            loc (str): 'point' or 'cell' to sample only the point or the cell
+                arrays, the reader itself (both of them) if None.
+        """
+
+        _check_loc(loc)
+        if loc is None:
+            return self.reader
+
+        def create():
+            pvs.SetActiveSource(self.reader)
+            return [_pass_arrays(self.reader, loc)]
+
+        return self._pooled(("arrays", loc), create)[0]
+
+    def _stage(self, name, **args):
+        """Return context manager timing a stage of the queries.
+
+        The stage is recorded to :py:attr:`stats` if given, otherwise to the
+        stats of the enclosing :func:`pvtools.profiling.profile`, if any.
+        """
+        return profiling.stage(name, self.stats, **args)
+
+    def _sample(self, points, time=None):
+        """Sample the mesh of the numpy backend at the points.
+
+        The cell locator is built on the first call and reused afterwards,
+        for all the times.
+        """
+
+        if self._locator is None:
+            sidecar = (self.fullpath + ".locator.npz" if self._cache_index
+                       else None)
+            with profiling.stage("locator"):
+                self._locator = locator.build(self.mesh, sidecar)
+        with profiling.stage("sample", npoints=len(points)):
+            return self._locator.sample(points, self._mesh_at(time))
+
+    def _mesh_at(self, time):
+        """Return the mesh of the numpy backend with the data of given time.
+
+        Only the mesh of the last queried time is kept besides the one
+        opened, the fields of the previous times are released.
+        """
+
+        if time is None or not isinstance(self.mesh, _FOAM_MESHES):
+            return self.mesh
+
+        case = self.mesh.case
+        names = case.times()
+        name = names[np.argmin([abs(float(n) - time) for n in names])]
+        if name == self.mesh.time:
+            return self.mesh
+
+        if self._time_mesh is None or self._time_mesh.time != name:
+            if self._time_mesh is not None:
+                case.release(self._time_mesh.time)
+            self._time_mesh = case.mesh(name, self.mesh.arrays,
+                                        self.mesh.cell_to_point)
+        return self._time_mesh
+
+    def _boundary_at(self, time):
+        """Return the boundary surface and its data at given time.
+
+        The surface of the last queried time is kept, as is the slice of the
+        last queried plane.
+
+        Returns:
+            tuple: (surface, point data, cell data), the cell data being
+                those of the cells owning the surface faces.
+        """
+
+        key = None if self.reader is None else self._query_time(time)
+        if self._surface is None or self._surface[0] != key:
+            if self.reader is None:
+                with profiling.stage("surface"):
+                    offsets, connectivity, owners = self.mesh.boundary_faces(
+                        with_owners=True)
+                    surface = Surface(self.mesh.points, offsets, connectivity)
+                data = owners
+            else:
+                def create():
+                    pvs.SetActiveSource(self.reader)
+                    merge = pvs.MergeBlocks(Input=self.reader)
+                    return [merge, pvs.ExtractSurface(Input=merge)]
+
+                extract = self._pooled("boundary_surface", create)[-1]
+                with profiling.stage("surface"):
+                    surface, point_data, cell_data = _fetch_surface(extract,
+                                                                    key)
+                data = (point_data, cell_data)
+            self._surface = (key, surface, data)
+            self._curves = None
+
+        _, surface, data = self._surface
+        if self.reader is not None:
+            return (surface,) + data
+
+        mesh, owners = self._mesh_at(time), data
+        cell_data = LazyDict(dict(
+            (name, lambda name=name: np.asarray(mesh.cell_data[name])[owners])
+            for name in mesh.cell_data.keys()))
+        return surface, mesh.point_data, cell_data
+
+    def _query_time(self, time):
+        """Return the time the Paraview pipeline is to be updated at."""
+        return self.time if time is None else time
+
+    def _refresh(self):
+        """Update the list of available times from the disk."""
+        if self.reader is not None:
+            if hasattr(pvs, "ReloadFiles"):
+                pvs.ReloadFiles(self.reader)
+            else:
+                self.reader.UpdatePipelineInformation()
+
     # Information queries
 
+    def times(self):
+        """Return the times available in the data source.
+
+        Returns:
+            List[float]: Sorted times, empty for data without time.
+        """
+
+        if self.mesh is not None:
+            if isinstance(self.mesh, _FOAM_MESHES):
+                return [float(name) for name in self.mesh.case.times()]
+            return []
+
+        values = getattr(self.reader, "TimestepValues", [])
+        try:
+            return [float(t) for t in values]
+        except TypeError:
+            # Single time is not returned as a list
+            return [float(values)]
+
     def get_variables(self, loc):
         """Return list of variables defined in the data source.
 
@@ -154,6 +788,9 @@ class DataSource:
         Returns:
               List[str]: List of the present variables.
         """
+        if self.mesh is not None:
+            return self.mesh.get_variables(loc)
+
         if loc == 'point':
             return self.reader.PointData.keys()
         elif loc == 'cell':
@@ -163,7 +800,7 @@ class DataSource:
 
     # Data access methods
 
-    def probe(self, variable, point):
+    def probe(self, variable, point, time=None, loc=None):
         """Return the value of a variable at a given point.
 
         Args:
@@ -172,64 +809,318 @@ class DataSource:
                 Components of the vector are available by adding a suffix
                 ' X', ' Y' or ' Z' to the vector name.
                 Physical coordinates are available under the name 'X', 'Y' or 'Z'.
+                A list of names can be given as well, in which case all the
+                variables are obtained from a single pipeline evaluation.
             point (tuple): x, y and z coordinates.
+            time (float): Time of the data. By default, the time the data
+                source was opened at (:py:attr:`time`).
+            loc (str): 'point' for the point data, interpolated within the
+                cells, or 'cell' for the cell data, the value of the cell
+                containing the point. By default the point data, or the cell
+                data for the variables defined only at the cells (e.g. the
+                OpenFOAM fields opened with `cell_to_point=False`).
 
         Returns:
             float: Queried value or None.
                 None is returned if the variable does not exist or the point is not
                 defined at the given point.
+                If a list of variables is given, dict of the values indexed
+                by the variable names.
         """
+        with self._stage("probe", variable=variable):
+            if self.mesh is not None:
+                arrays = _extract_variables(self._sample([point], time),
+                                            variable, loc=loc)
+            else:
+                source = self._sampled(loc)
 
+                def create():
+                    pvs.SetActiveSource(source)
+                    return [pvs.ProbeLocation(
+                        ProbeType="Fixed Radius Point Source")]
 
-        pvs.SetActiveSource(self.reader)
-        prob_loc = pvs.ProbeLocation(ProbeType="Fixed Radius Point Source")
-        prob_loc.ProbeType.Center = point
-        array = _get_variable_array(prob_loc, variable)
+                prob_loc, = self._pooled(("probe", loc), create)
+                prob_loc.ProbeType.Center = point
+                arrays = _get_variable_array(prob_loc, variable,
+                                             time=self._query_time(time))
 
-        pvs.Delete(prob_loc)
+            if isinstance(arrays, dict):
+                return dict((k, _single_value(v))
+                            for k, v in arrays.iteritems())
+            else:
+                return _single_value(arrays)
 
-        if array is None or len(array) == 0:
-            return None
-        elif len(array) != 1:
-            raise Exception("Unexpected length of the array.")
-        else:
-            return array[0]
+    def probe_many(self, variable, points, time=None, copy=True, dtype=None,
+                   loc=None):
+        """Return the values of a variable at many points at once.
+
+        Unlike calling :py:meth:`DataSource.probe` repeatedly, all the points
+        are sampled in a single pass through the pipeline.
+
+        Args:
+            variable (str or List[str]): Name of the variable.
+                See :py:meth:`DataSource.probe` for details.
+            points (array_like): Array of shape (N, 3) with the coordinates
+                of the points.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+            copy (bool): If False, the arrays may be read-only views of the
+                fetched data, see :py:meth:`DataSource.field`.
+            dtype (numpy.dtype): Type of the arrays, float64 by default.
+            loc (str): Point or cell data, see :py:meth:`DataSource.probe`.
+
+        Returns:
+            numpy.ndarray: Array of length N with the queried values, or None,
+                if the variable does not exist. Points outside of the
+                domain get NaN. If a list of variables is given, dict of
+                such arrays indexed by the variable names.
+        """
+        with self._stage("probe_many", variable=variable):
+            points = np.asarray(points, dtype=float).reshape(-1, 3)
+
+            if self.mesh is not None:
+                return _extract_variables(self._sample(points, time), variable,
+                                          False, copy, dtype, loc)
+
+            sampled = self._sampled(loc)
 
-    def line(self, variable, line, npoints=100, only_inside=True):
+            def create():
+                source = _points_source()
+                return [source, _resample_with_dataset(sampled, source)]
+
+            source, resample = self._pooled(("probe_many", loc), create)
+            _set_points(source, points)
+            return _get_variable_array(resample, variable, skip_invalid=False,
+                                       time=self._query_time(time), copy=copy,
+                                       dtype=dtype)
+
+    def probe_series(self, variable, point, times=None, follow=False,
+                     poll_interval=1.0, timeout=None):
+        """Generate the values of a variable at a given point in time.
+
+        The mesh is loaded only once, only the data of each time are read.
+
+        Args:
+            variable (str or List[str]): Name of the variable.
+                See :py:meth:`DataSource.probe` for details.
+            point (tuple): x, y and z coordinates.
+            times (List[float]): Times of the data. All the available times
+                by default.
+            follow (bool): If True, the time directories written after the
+                given times (e.g. by a running simulation) are waited for and
+                probed as they appear. A time is probed once the next poll
+                still finds it, so that its files are completely written.
+            poll_interval (float): Seconds between the checks for new times.
+            timeout (float): In the follow mode, stop when no new time
+                appears for this many seconds. Never by default.
+
+        Yields:
+            tuple: (time, value), value as returned by
+                :py:meth:`DataSource.probe`. For data without time, the only
+                value is yielded with time None.
+        """
+
+        if times is None:
+            times = self.times() or [None]
+
+        last = None
+        for time in times:
+            yield time, self.probe(variable, point, time)
+            last = time
+
+        if not follow:
+            return
+
+        seen = set()
+        idle = 0.0
+        while timeout is None or idle < timeout:
+            sleep(poll_interval)
+            self._refresh()
+            new = [t for t in self.times() if last is None or t > last]
+
+            # Newest time could be still being written
+            ready = [t for t in new if t in seen]
+            seen = set(new)
+            for time in ready:
+                yield time, self.probe(variable, point, time)
+                last = time
+
+            idle = 0.0 if new else idle + poll_interval
+
+    def line(self, variable, line, npoints=100, only_inside=True, time=None,
+             adaptive=False, tol=None, copy=True, dtype=None, loc=None):
         """Return a list of the variable values along the line.
 
         Args:
-            variable (str): Name of the variable.
+            variable (str or List[str]): Name of the variable.
                 See :py:meth:`DataSource.probe` for details.
             line (tuple): Tuple (point1, point2), where point1 and point2 are
                 three-float tuples representing the coordinates of the start
                 and end point of the line.
-            npoints (int): Number of points along the line.
+            npoints (int): Number of points along the line. With adaptive
+                sampling, the number of the initial points.
             only_inside (bool): True if the values outside of the defined data
                 should be excluded. Otherwise, return NaN for these points.
                 If True, length of the returned array could differ from npoints.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+            adaptive (bool): If True, the intervals between the initial
+                points are halved until the values at their midpoints differ
+                from the linear interpolation of their ends by at most tol.
+                The intervals crossing the domain boundary are halved as
+                well, to find the boundary. Each interval is halved at most
+                ten times.
+            tol (float): Tolerance of the adaptive sampling, in the units of
+                the variables. By default, 0.001 of the range of the values
+                at the initial points.
+            copy (bool): If False, the arrays may be read-only views of the
+                fetched data, see :py:meth:`DataSource.field`.
+            dtype (numpy.dtype): Type of the arrays. By default, the type of
+                the data, or float64 if the values outside are NaN.
+            loc (str): Point or cell data, see :py:meth:`DataSource.probe`.
+                The cell data are piecewise constant, so the adaptive
+                sampling refines the intervals down to the cell faces.
 
         Returns:
             numpy.ndarray: Variable values or None, if the variable
-                does not exist.
+                does not exist. If a list of variables is given, dict of
+                such arrays indexed by the variable names.
+                With adaptive sampling, tuple (points, values), where points
+                is the (N, 3) array of the coordinates of the samples, ordered
+                along the line.
+        """
+        if adaptive:
+            return self._adaptive_line(variable, line, npoints, only_inside,
+                                       time, tol, dtype, loc)
+
+        with self._stage("line", variable=variable):
+            if self.mesh is not None:
+                points = np.linspace(0, 1, npoints)[:, np.newaxis]
+                points = ((1 - points) * np.asarray(line[0], dtype=float)
+                          + points * np.asarray(line[1], dtype=float))
+                return _extract_variables(self._sample(points, time), variable,
+                                          only_inside, copy, dtype, loc)
+
+            sampled = self._sampled(loc)
+
+            def create():
+                pvs.SetActiveSource(sampled)
+                return [pvs.PlotOverLine(
+                    Source="High Resolution Line Source")]
+
+            pol, = self._pooled(("line", loc), create)
+            pol.Source.Resolution = npoints - 1
+            pol.Source.Point1 = line[0]
+            pol.Source.Point2 = line[1]
+
+            array = _get_variable_array(pol, variable, only_inside,
+                                        self._query_time(time), copy, dtype)
+            return array
+
+    def _adaptive_line(self, variable, line, npoints, only_inside, time,
+                       tol, dtype, loc):
+        """Sample the line adaptively, see :py:meth:`DataSource.line`.
+
+        All the midpoints of a refinement level are probed at once.
         """
-        pvs.SetActiveSource(self.reader)
-        pol = pvs.PlotOverLine(Source="High Resolution Line Source")
-        pol.Source.Resolution = npoints - 1
-        pol.Source.Point1 = line[0]
-        pol.Source.Point2 = line[1]
 
-        array = _get_variable_array(pol, variable, only_inside)
-        return array
+        start = np.asarray(line[0], dtype=float)
+        end = np.asarray(line[1], dtype=float)
+
+        def sample(params):
+            points = (start + params[:, np.newaxis] * (end - start))
+            return self.probe_many(variable, points, time, dtype=dtype,
+                                   loc=loc)
+
+        with self._stage("adaptive_line", variable=variable):
+            params = np.linspace(0, 1, npoints)
+            probed = [sample(params)]
+            columns = _value_columns(probed[0], npoints)
+            if tol is None:
+                finite = columns[np.isfinite(columns)]
+                tol = (_LINE_TOLERANCE * (finite.max() - finite.min())
+                       if len(finite) else 0.0)
+
+            # Intervals to be halved, as indices of their ends
+            left = np.arange(npoints - 1)
+            right = left + 1
+            for _ in range(_MAX_REFINEMENTS):
+                if not len(left):
+                    break
+                mids = (params[left] + params[right]) / 2
+                probed.append(sample(mids))
+                values = _value_columns(probed[-1], len(mids))
+                new = len(params) + np.arange(len(mids))
+                params = np.concatenate([params, mids])
+                columns = np.vstack([columns, values])
+
+                with np.errstate(invalid="ignore"):
+                    error = np.abs(
+                        values - (columns[left] + columns[right]) / 2)
+                    # Ends on both sides of the domain boundary
+                    inside = ~np.all(np.isnan(columns), axis=1)
+                    crossing = ((inside[left] != inside[new])
+                                | (inside[new] != inside[right]))
+                    refine = crossing | np.any(error > tol, axis=1)
+                left, right = (np.concatenate([left[refine], new[refine]]),
+                               np.concatenate([new[refine], right[refine]]))
+
+            order = np.argsort(params, kind="mergesort")
+            if only_inside:
+                order = order[~np.all(np.isnan(columns[order]), axis=1)]
+            points = start + params[order, np.newaxis] * (end - start)
+
+            if not isinstance(probed[0], dict):
+                if probed[0] is None:
+                    return points, None
+                return points, np.concatenate(probed)[order]
+            return points, dict(
+                (name, None if array is None else np.concatenate(
+                    [values[name] for values in probed])[order])
+                for name, array in probed[0].iteritems())
+
+    def field(self, variable, time=None, copy=True, dtype=None):
+        """Return the values of a variable at all the points of the data.
+
+        For OpenFOAM cases, only a single mesh region (the internal mesh by
+        default) is supported by the Paraview backend.
+
+        Args:
+            variable (str or List[str]): Name of the variable.
+                See :py:meth:`DataSource.probe` for details.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+            copy (bool): If False, the arrays of the scalars, the vector
+                components and the coordinates are read-only views of the
+                fetched data (or of the data read by the numpy backend)
+                instead of copies. The views keep the whole fetched data
+                alive, and are valid only until the data source is closed.
+            dtype (numpy.dtype): Type of the arrays, that of the data by
+                default. For vectors, the magnitudes are computed directly in
+                this type, e.g. float32 halves their memory.
+
+        Returns:
+            numpy.ndarray: Array of the values at the points, or None, if the
+                variable does not exist. If a list of variables is given,
+                dict of such arrays indexed by the variable names.
+        """
+        with self._stage("field", variable=variable):
+            if self.mesh is not None:
+                mesh = self._mesh_at(time)
+                return _extract_variables(_MeshData(mesh), variable,
+                                          copy=copy, dtype=dtype, loc="point")
 
+            # The reader output is fetched directly, as merging the blocks
+            # would copy all the data
+            return _get_variable_array(self.reader, variable,
+                                       time=self._query_time(time), copy=copy,
+                                       dtype=dtype, loc="point")
 
     def boundary_line(self, variable, plane_point, plane_normal,
-                      bounding_box=None):
+                      bounding_box=None, time=None, copy=True, dtype=None,
+                      loc=None):
         """ Return a list of the variable values along the intersection of the
         domain boundary with a plane.
 
         Args:
-            variable (str): Name of the variable.
+            variable (str or List[str]): Name of the variable.
                 See :py:meth:`DataSource.probe` for details.
             plane_point (tuple): three-float tuple representing the point on
                 the plane.
@@ -238,22 +1129,401 @@ class DataSource:
             bounding_box (tuple): Tuple (minx, miny, minz, maxx, maxy, maxz),
                 where the values are the limits of the bounding box. Each point
                 can be replaced by None if the appropriate bound is missing.
-
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+            copy (bool): If False, the arrays may be read-only views of the
+                sampled data, see :py:meth:`DataSource.field`.
+            dtype (numpy.dtype): Type of the arrays, that of the data by
+                default.
+            loc (str): Point or cell data, see :py:meth:`DataSource.probe`.
+                The cell data are those of the cells the boundary faces
+                belong to.
 
         Returns:
             numpy.ndarray: Variable values or None, if the variable
-                does not exist.
+                does not exist. If a list of variables is given, dict of
+                such arrays indexed by the variable names.
+        """
+        with self._stage("boundary_line", variable=variable):
+            surface, point_data, cell_data = self._boundary_at(time)
+
+            plane = (tuple(plane_point), tuple(plane_normal))
+            if self._curves is None or self._curves[0] != plane:
+                with profiling.stage("slice"):
+                    self._curves = (plane,
+                                    surface.slice(plane_point, plane_normal))
+            curves = self._curves[1]
+
+            if bounding_box:
+                with profiling.stage("clip"):
+                    curves = curves.clip(bounding_box)
+            return _extract_variables(curves.sample(point_data, cell_data),
+                                      variable, copy=copy, dtype=dtype,
+                                      loc=loc)
+
+    def extract(self, variable, bounding_box=None, time=None, dtype=None):
+        """Return the values of a variable at all the cells in a box.
+
+        The cells are those whose centres lie in the box. Their values are
+        obtained in a single pass, as a single array fetch for the Paraview
+        backend.
+
+        Args:
+            variable (str or List[str]): Name of the variable, see
+                :py:meth:`DataSource.probe`. Only the cell data are
+                available, the coordinates are those of the cell centres.
+            bounding_box (tuple): (minx, miny, minz, maxx, maxy, maxz), None
+                for the missing bounds. All the cells by default.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+            dtype (numpy.dtype): Type of the arrays, that of the data by
+                default.
+
+        Returns:
+            tuple: (centres, values), centres being the (N, 3) array of the
+                cell centres and values the array of length N, or None, if
+                the variable does not exist. If a list of variables is given,
+                dict of such arrays indexed by the variable names.
+        """
+
+        bounding_box = bounding_box or (None,) * 6
+        lower = np.array([-np.inf if b is None else b
+                          for b in bounding_box[:3]], dtype=float)
+        upper = np.array([np.inf if b is None else b
+                          for b in bounding_box[3:]], dtype=float)
+
+        with self._stage("extract", variable=variable):
+            if self.mesh is not None:
+                mesh = self._mesh_at(time)
+                centres = np.asarray(self.mesh.cell_centers)
+                cells = np.nonzero(np.all((centres >= lower)
+                                          & (centres <= upper), axis=1))[0]
+                data = _CellsData(mesh, centres, cells)
+            else:
+                # Cells crossing the box, reduced to their centres carrying
+                # the cell data as point data
+                def create():
+                    pvs.SetActiveSource(self.reader)
+                    extract = pvs.ExtractCellsByRegion(Input=self.reader,
+                                                       IntersectWith="Box")
+                    extract.Extractintersected = 1
+                    return [extract, pvs.CellCenters(Input=extract)]
+
+                extract, centers = self._pooled("extract", create)
+                _set_box(extract.IntersectWith, bounding_box,
+                         self.reader.GetDataInformation().GetBounds())
+                data = _fetch(centers, self._query_time(time))
+                centres = np.asarray(_to_vtkarray(data.Points))
+                cells = np.nonzero(np.all((centres >= lower)
+                                          & (centres <= upper), axis=1))[0]
+                data = _CellsData(data, centres, cells)
+
+            values = _extract_variables(data, variable, dtype=dtype)
+            return data.Points, values
+
+    # Reductions
+
+    def _region_of(self, region):
+        """Return the region of the numpy backend, see :py:mod:`reduction`.
+
+        The region of the last query is kept, and reused for all the times.
+        """
+
+        key = repr(region)
+        if self._region is None or self._region[0] != key:
+            kind = region[0]
+            with profiling.stage("region", kind=kind):
+                if kind == "line":
+                    npoints = region[3] if len(region) > 3 else _LINE_POINTS
+                    points = np.linspace(0, 1, npoints)[:, np.newaxis]
+                    points = ((1 - points) * np.asarray(region[1], dtype=float)
+                              + points * np.asarray(region[2], dtype=float))
+                    result = reduction.line(self._sample(points))
+                elif kind == "plane":
+                    result = reduction.plane(self.mesh, region[1], region[2])
+                elif kind == "box":
+                    result = reduction.box(self.mesh, region[1])
+                else:
+                    result = reduction.patch(self.mesh, region[1])
+            self._region = (key, result)
+        return self._region[1]
+
+    def _region_filter(self, region):
+        """Return the Paraview filter producing the region."""
+
+        kind = region[0]
+        if kind == "line":
+            def create():
+                pvs.SetActiveSource(self.reader)
+                pol = pvs.PlotOverLine(Source="High Resolution Line Source")
+                # The polyline is split into segments, so that only the
+                # segments with an end outside of the domain are left out
+                segments = pvs.Triangulate(Input=pol)
+                return [pol, segments, _threshold_valid(segments)]
+
+            pol, _, valid = self._pooled("line_region", create)
+            npoints = region[3] if len(region) > 3 else _LINE_POINTS
+            pol.Source.Resolution = npoints - 1
+            pol.Source.Point1 = region[1]
+            pol.Source.Point2 = region[2]
+            return valid
+        elif kind == "plane":
+            def create():
+                pvs.SetActiveSource(self.reader)
+                return [pvs.Slice(Input=self.reader, SliceType="Plane")]
+
+            plane, = self._pooled("plane_region", create)
+            plane.SliceType.Origin = region[1]
+            plane.SliceType.Normal = region[2]
+            return plane
+        elif kind == "box":
+            def create():
+                pvs.SetActiveSource(self.reader)
+                return [pvs.ExtractCellsByRegion(Input=self.reader,
+                                                 IntersectWith="Box")]
+
+            extract, = self._pooled("box_region", create)
+            _set_box(extract.IntersectWith, region[1],
+                     self.reader.GetDataInformation().GetBounds())
+            return extract
+
+        # The patches are read by a reader of their own, so that the data
+        # of the other queries remain the internal mesh only
+        if (os.path.splitext(self.fullpath)[1].lower()
+                not in [".foam", ".openfoam"]):
+            raise ValueError("Patches are defined only for OpenFOAM cases")
+
+        def create():
+            reader = _foam_reader(self.fullpath)
+            merge = pvs.MergeBlocks(Input=reader)
+            return [reader, merge, pvs.ExtractSurface(Input=merge)]
+
+        reader, _, surface = self._pooled("patch_region", create)
+        reader.MeshRegions = [_patch_region(reader, region[1])]
+        return surface
+
+    def _reduction_input(self, source, variables, key):
+        """Append Calculator filters evaluating the variables not stored as
+        arrays (vector magnitudes and coordinates) to the source.
+
+        The results are named by :data:`_CALCULATED`.
+        """
+
+        point_data = self.reader.PointData
+        functions = []
+        for variable in variables:
+            if variable in _COORDS:
+                functions.append((variable, "coords" + variable))
+            elif (variable in point_data.keys()
+                  and point_data[variable].GetNumberOfComponents() == 3):
+                functions.append((variable, "mag(%s)" % variable))
+
+        def create():
+            filters = []
+            for variable, function in functions:
+                filters.append(pvs.Calculator(
+                    Input=filters[-1] if filters else source,
+                    Function=function,
+                    ResultArrayName=_CALCULATED % variable))
+            return filters
+
+        filters = self._pooled((key, tuple(functions)), create)
+        return filters[-1] if filters else source
+
+    def _reduce_paraview(self, operation, variables, region, time):
+        """Compute the reductions of the variables in the Paraview pipeline.
+
+        Only the reduced values are fetched from the pipeline.
+
+        Returns:
+            dict: Results indexed by the variable names.
+        """
+
+        kind = region[0]
+        source = self._region_filter(region)
+        time = self._query_time(time)
+
+        if operation == "minmax":
+            # The ranges are a part of the data information
+            source = self._reduction_input(source, variables, kind)
+            with profiling.stage("update"):
+                source.UpdatePipeline(time=time)
+            point_data = source.PointData
+            results = {}
+            for variable in variables:
+                name, component = _CALCULATED % variable, 0
+                if name not in point_data.keys():
+                    name = variable
+                    if (name not in point_data.keys()
+                            and variable[-2:] in [" X", " Y", " Z"]):
+                        name = variable[:-2]
+                        component = _COORDS[variable[-1]]
+                results[variable] = None
+                if name in point_data.keys():
+                    low, high = point_data[name].GetRange(component)
+                    if low <= high:
+                        results[variable] = (float(low), float(high))
+            return results
+
+        if operation == "flux":
+            if kind == "plane":
+                normal = np.asarray(region[2], dtype=float)
+                normal = normal / np.sqrt(np.dot(normal, normal))
+            else:
+                def create():
+                    return [pvs.GenerateSurfaceNormals(Input=source,
+                                                       Splitting=0)]
+
+                source, = self._pooled(("flux_normals", kind), create)
+                point_data = self.reader.PointData
+
+                def create_calculators():
+                    filters = []
+                    for variable in variables:
+                        if variable in point_data.keys():
+                            filters.append(pvs.Calculator(
+                                Input=filters[-1] if filters else source,
+                                Function="dot(%s, Normals)" % variable,
+                                ResultArrayName=_CALCULATED % variable))
+                    return filters
+
+                filters = self._pooled(("flux", kind, tuple(variables)),
+                                       create_calculators)
+                source = filters[-1] if filters else source
+        else:
+            source = self._reduction_input(source, variables, kind)
+
+        key = ("integrate", kind, operation == "flux", tuple(variables))
+        integrate, = self._pooled(key, lambda: [pvs.IntegrateVariables(
+            Input=source)])
+        data = _fetch(integrate, time)
+
+        results = {}
+        for variable in variables:
+            if operation == "flux" and kind == "plane":
+                vector = (_to_vtkarray(data.PointData[variable])
+                          if variable in data.PointData.keys() else None)
+                results[variable] = (None if vector is None else
+                                     float(np.dot(vector[0], normal)))
+                continue
+            value = _integrated_value(data, variable)
+            if operation == "average" and value is not None:
+                measure = _integrated_measure(data)
+                value = value / measure if measure else None
+            results[variable] = value
+        return results
+
+    def _reduce(self, operation, variable, region, time):
+        """Compute the reduction of the variables over the region.
+
+        See :py:meth:`DataSource.integrate` for the arguments.
+        """
+
+        if region[0] not in _REGION_KINDS:
+            raise ValueError("Unknown region %s, expected one of %s"
+                             % (region[0], ", ".join(_REGION_KINDS)))
+        if operation == "flux" and region[0] not in ["plane", "patch"]:
+            raise ValueError("Flux is defined only through planes and "
+                             "patches")
+        variables = ([variable] if isinstance(variable, basestring)
+                     else list(variable))
+
+        with self._stage(operation, variable=variable):
+            if self.mesh is not None:
+                part = self._region_of(region)
+                samples = part.sample(self._mesh_at(time))
+                results = {}
+                with profiling.stage("reduce"):
+                    for name in variables:
+                        if operation == "flux":
+                            vectors = (samples.PointData[name]
+                                       if name in samples.PointData else None)
+                            results[name] = (
+                                None if vectors is None or vectors.ndim != 2
+                                else part.flux(vectors))
+                            continue
+                        values = _extract_variable(samples, name,
+                                                   skip_invalid=False)
+                        results[name] = (
+                            None if values is None
+                            else getattr(part, operation)(values))
+            else:
+                results = self._reduce_paraview(operation, variables, region,
+                                                time)
+
+        if isinstance(variable, basestring):
+            return results[variable]
+        return results
+
+    def integrate(self, variable, region, time=None):
+        """Return the integral of a variable over a region.
+
+        The reduction is computed inside the pipeline, only its result is
+        fetched. The data are interpolated linearly within the cells, as by
+        the other queries.
+
+        Args:
+            variable (str or List[str]): Name of the variable.
+                See :py:meth:`DataSource.probe` for details.
+            region (tuple): The region, one of:
+                ('line', point1, point2) or ('line', point1, point2, npoints)
+                    Line sampled at npoints points (100 by default), the parts
+                    outside of the domain are left out.
+                ('plane', point, normal)
+                    Intersection of the domain with the plane.
+                ('box', bounding_box)
+                    Cells lying wholly in the box, given as in
+                    :py:meth:`DataSource.boundary_line`.
+                ('patch', name)
+                    Boundary patch of an OpenFOAM case.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+
+        Returns:
+            float: The integral, or None if the variable does not exist.
+                If a list of variables is given, dict of the values indexed
+                by the variable names.
         """
-        pvs.SetActiveSource(self.reader)
+        return self._reduce("integrate", variable, region, time)
+
+    def average(self, variable, region, time=None):
+        """Return the average of a variable over a region.
+
+        The average is the integral divided by the length, area or volume of
+        the region, see :py:meth:`DataSource.integrate` for the arguments.
 
-        poic = pvs.PlotOnIntersectionCurves(Input=self.reader)
-        poic.SliceType = 'Plane'
-        poic.SliceType.Origin = plane_point
-        poic.SliceType.Normal = plane_normal
+        Returns:
+            float: The average, or None if the variable does not exist or the
+                region is empty. If a list of variables is given, dict of the
+                values indexed by the variable names.
+        """
+        return self._reduce("average", variable, region, time)
 
-        latest = poic
-        if bounding_box:
-            latest = _add_bounding_box(latest, bounding_box)
+    def minmax(self, variable, region, time=None):
+        """Return the extrema of a variable over a region.
 
-        array = _get_variable_array(latest, variable, True)
-        return array
+        The extrema are taken over the points of the region, see
+        :py:meth:`DataSource.integrate` for the arguments.
+
+        Returns:
+            tuple: (min, max), or None if the variable does not exist or the
+                region is empty. If a list of variables is given, dict of the
+                values indexed by the variable names.
+        """
+        return self._reduce("minmax", variable, region, time)
+
+    def flux(self, variable, region, time=None):
+        """Return the flux of a vector variable through a plane or a patch.
+
+        Args:
+            variable (str or List[str]): Name of the vector variable, such as
+                the velocity (volumetric flow rate) or the mass flux.
+            region (tuple): ('plane', point, normal) or ('patch', name), see
+                :py:meth:`DataSource.integrate`. The flux is in the direction
+                of the plane normal, and outwards of the domain through the
+                patch.
+            time (float): Time of the data, see :py:meth:`DataSource.probe`.
+
+        Returns:
+            float: The flux, or None if the variable does not exist or is not
+                a vector. If a list of variables is given, dict of the values
+                indexed by the variable names.
+        """
+        return self._reduce("flux", variable, region, time)
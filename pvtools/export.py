@@ -0,0 +1,216 @@
+#!/usr/bin/env python2
+
+"""
+Implements the streaming writers of the query results.
+
+The results are written one by one as they are computed, so that the whole
+set of results never needs to be held in memory. The writers take the flat
+keys (tuples) of :func:`pvtools.interface.to_dict` and store the results
+hierarchically: as nested objects in JSON, or as entries named by the keys
+joined by '/' in the npz (zip) archive.
+
+The npz archives are not compressed, so that the arrays can be
+memory-mapped by :func:`load_npz`.
+"""
+
+import json
+import struct
+import zipfile
+import cStringIO
+
+import numpy as np
+
+# Entry name of the result stored without any key
+_ROOT_NAME = "__root__"
+
+_INDENT = "    "
+
+
+def _plain(value):
+    """Convert the numpy values to plain Python objects for JSON."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _json_key(key):
+    """Convert the key to a JSON string, as json.dump does with dict keys."""
+    if isinstance(key, basestring):
+        return json.dumps(key)
+    if isinstance(key, (bool, type(None), int, long, float)):
+        return json.dumps(json.dumps(key))
+    raise TypeError("Key %r is not a string" % (key,))
+
+
+class JsonWriter(object):
+    """Writer of the results to a hierarchical JSON object.
+
+    Results sharing a part of the key must be written one after another,
+    which is the case when they are written in the sorted order of the keys.
+
+    Args:
+        f (file): Open file the JSON is written to.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self._keys = []
+        self._counts = []
+        self._root = False
+
+    def _start(self):
+        if not self._counts:
+            self.f.write("{")
+            self._counts.append(0)
+
+    def _item(self, key):
+        """Write the separator and the key of a new item."""
+        if self._counts[-1]:
+            self.f.write(",")
+        self._counts[-1] += 1
+        self.f.write("\n" + _INDENT * len(self._counts) + _json_key(key)
+                     + ": ")
+
+    def _close_level(self):
+        self._keys.pop()
+        self._counts.pop()
+        self.f.write("\n" + _INDENT * len(self._counts) + "}")
+
+    def write(self, key, value):
+        """Write the result of the given key."""
+
+        key = tuple(key)
+        if not key:
+            # The only result, stored as the whole document
+            self.f.write(json.dumps(_plain(value)))
+            self._root = True
+            return
+
+        self._start()
+        common = 0
+        while (common < min(len(self._keys), len(key) - 1)
+               and self._keys[common] == key[common]):
+            common += 1
+        while len(self._keys) > common:
+            self._close_level()
+        for part in key[common:-1]:
+            self._item(part)
+            self.f.write("{")
+            self._keys.append(part)
+            self._counts.append(0)
+
+        self._item(key[-1])
+        self.f.write(json.dumps(_plain(value)))
+
+    def close(self):
+        """Finish the JSON document."""
+        if self._root:
+            self.f.write("\n")
+            return
+        self._start()
+        while self._keys:
+            self._close_level()
+        self.f.write("\n}\n" if self._counts[0] else "}\n")
+
+
+class NpzWriter(object):
+    """Writer of the results to an uncompressed npz archive.
+
+    Each result is stored as an entry named by the key components joined
+    by '/'. Results with None value are not stored.
+
+    Args:
+        filename (str): Name of the archive to be created.
+    """
+
+    def __init__(self, filename):
+        self.zipfile = zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED,
+                                       allowZip64=True)
+
+    def write(self, key, value):
+        """Write the result of the given key."""
+        if value is None:
+            return
+
+        name = "/".join(str(part) for part in key) or _ROOT_NAME
+        buf = cStringIO.StringIO()
+        np.lib.format.write_array(buf, np.asanyarray(value))
+        self.zipfile.writestr(name + ".npy", buf.getvalue())
+
+    def close(self):
+        self.zipfile.close()
+
+
+def _entry_offset(f, info):
+    """Return the position of the data of the zip entry in the file."""
+    f.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader,
+                           f.read(zipfile.sizeFileHeader))
+    return (info.header_offset + zipfile.sizeFileHeader
+            + header[zipfile._FH_FILENAME_LENGTH]
+            + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+
+def _read_entry(f, filename, info, mmap):
+    """Read the array of the npz entry, memory-mapped if possible."""
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        with zipfile.ZipFile(filename) as zf:
+            return np.lib.format.read_array(
+                cStringIO.StringIO(zf.read(info.filename)))
+
+    f.seek(_entry_offset(f, info))
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not supported: %s"
+                         % info.filename)
+    if not mmap or not shape:
+        count = int(np.prod(shape))
+        array = np.fromfile(f, dtype=dtype, count=count)
+        return array.reshape(shape, order="F" if fortran_order else "C")
+
+    return np.memmap(filename, dtype=dtype, mode="r", offset=f.tell(),
+                     shape=shape, order="F" if fortran_order else "C")
+
+
+def load_npz(filename, mmap=True):
+    """Load the results written by :class:`NpzWriter`.
+
+    Args:
+        filename (str): Name of the archive.
+        mmap (bool): If True, the arrays are memory-mapped instead of read.
+
+    Returns:
+        dict: Hierarchical dict of the results, as stored by
+            :func:`pvtools.interface.to_json`. Keys are strings. Scalar
+            results are returned as floats.
+    """
+
+    res = {}
+    with zipfile.ZipFile(filename) as zf:
+        infos = zf.infolist()
+
+    with open(filename, "rb") as f:
+        for info in infos:
+            name = info.filename
+            if name.endswith(".npy"):
+                name = name[:-4]
+            array = _read_entry(f, filename, info, mmap)
+            value = array.item() if array.ndim == 0 else array
+
+            if name == _ROOT_NAME:
+                return value
+            parts = name.split("/")
+            level = res
+            for part in parts[:-1]:
+                level = level.setdefault(part, {})
+            level[parts[-1]] = value
+
+    return res
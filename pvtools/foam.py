@@ -0,0 +1,1275 @@
+#!/usr/bin/env python2
+
+"""
+Implements reader of OpenFOAM cases in pure numpy.
+
+The mesh is read from constant/polyMesh, the fields from the time
+directories. Both ASCII and binary formats are supported, as well as
+compressed (.gz) files. Reading is lazy: the mesh arrays are read when first
+needed and cached, and only the fields which are actually accessed are read.
+
+As in the Paraview OpenFOAM reader, the point data are obtained by
+interpolation of the cell data, with the boundary points taking the values
+of the boundary faces.
+
+Decomposed cases (processor* directories without the reconstructed mesh) are
+read as the union of the processor subdomains, which are read concurrently.
+As in Paraview, the points on the processor boundaries are duplicated and
+the point data are interpolated within each subdomain.
+"""
+
+import gzip
+import multiprocessing
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from .mesh import (Mesh, LazyDict, VTK_HEXAHEDRON, VTK_POLYHEDRON,
+                   expand_ranges, split_cells)
+
+
+_FIELD_CLASSES = {
+    "volScalarField": "scalar",
+    "volVectorField": "vector",
+    "volSphericalTensorField": "sphericalTensor",
+    "volSymmTensorField": "symmTensor",
+    "volTensorField": "tensor",
+}
+
+_NCOMPONENTS = {
+    "label": 1,
+    "scalar": 1,
+    "vector": 3,
+    "sphericalTensor": 1,
+    "symmTensor": 6,
+    "tensor": 9,
+}
+
+# Patch types not taken into account when interpolating to the points
+_SKIPPED_PATCHES = ["empty", "processor", "processorCyclic"]
+
+# Directories of the subdomains of decomposed cases
+_PROCESSOR_DIR = re.compile(r"processor(\d+)$")
+
+_WORD_END = re.compile(r"[\s;{}()\[\]\"]")
+_LIST_END = re.compile(r"\)\s*\)")
+_LIST_START = re.compile(r"(\d+)\s*([({])")
+_ELEMENT_TYPE = re.compile(r"List<(\w+)>")
+
+# Sizes of the mesh noted by OpenFOAM in the header of the owner file
+_MESH_NOTE = re.compile(r"nPoints:\s*(\d+)\s+nCells:\s*(\d+)")
+
+
+def _open(path):
+    """Open the file for reading, possibly the gzipped version of it."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    elif os.path.isfile(path):
+        return open(path, "rb")
+    elif os.path.isfile(path + ".gz"):
+        return gzip.open(path + ".gz", "rb")
+    else:
+        raise ValueError("File %s does not exist" % path)
+
+
+class _Parser(object):
+    """Parser of the OpenFOAM dictionary format.
+
+    Args:
+        content (str): Content of the file.
+        header (dict): FoamFile header. If None, it is parsed from the content.
+    """
+
+    def __init__(self, content, header=None):
+        self.content = content
+        self.pos = 0
+
+        if header is None:
+            start = content.find("FoamFile")
+            if start < 0:
+                raise ValueError("Missing FoamFile header")
+            self.pos = start + len("FoamFile")
+            self.skip()
+            self.expect("{")
+            header = self.parse_dict()
+        self.header = header
+
+        self.binary = header.get("format", ["ascii"])[0] == "binary"
+        arch = " ".join(header.get("arch", [""]))
+        self.byteorder = ">" if "MSB" in arch else "<"
+        label = re.search(r"label=(\d+)", arch)
+        scalar = re.search(r"scalar=(\d+)", arch)
+        self.label_size = int(label.group(1)) // 8 if label else 4
+        self.scalar_size = int(scalar.group(1)) // 8 if scalar else 8
+
+    def skip(self):
+        """Skip whitespace and comments."""
+        content = self.content
+        while self.pos < len(content):
+            c = content[self.pos]
+            if c.isspace():
+                self.pos += 1
+            elif content.startswith("//", self.pos):
+                end = content.find("\n", self.pos)
+                self.pos = len(content) if end < 0 else end + 1
+            elif content.startswith("/*", self.pos):
+                end = content.find("*/", self.pos)
+                self.pos = len(content) if end < 0 else end + 2
+            else:
+                return
+
+    def peek(self):
+        self.skip()
+        return self.content[self.pos] if self.pos < len(self.content) else ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected '%s' at position %d" % (char, self.pos))
+        self.pos += 1
+
+    def read_word(self):
+        self.skip()
+        match = _WORD_END.search(self.content, self.pos)
+        end = match.start() if match else len(self.content)
+        if end == self.pos:
+            raise ValueError("Unexpected '%s' at position %d"
+                             % (self.content[self.pos], self.pos))
+        word = self.content[self.pos:end]
+        self.pos = end
+        return word
+
+    def parse_dict(self):
+        """Parse dictionary entries up to the closing brace or end of file."""
+
+        entries = {}
+        while True:
+            c = self.peek()
+            if c == "}":
+                self.pos += 1
+                return entries
+            elif c == "":
+                return entries
+
+            if c == "\"":
+                # Quoted key, such as a regular expression of patch names
+                end = self.content.index("\"", self.pos + 1)
+                key = self.content[self.pos + 1:end]
+                self.pos = end + 1
+            else:
+                key = self.read_word()
+            if key.startswith("#"):
+                # Directives such as #include are not supported, skip them
+                end = self.content.find("\n", self.pos)
+                self.pos = len(self.content) if end < 0 else end
+                continue
+
+            if self.peek() == "{":
+                self.pos += 1
+                entries[key] = self.parse_dict()
+            else:
+                entries[key] = self.parse_value()
+
+    def parse_value(self):
+        """Parse the items of an entry, up to the terminating semicolon."""
+
+        items = []
+        elem = "scalar"
+        while True:
+            c = self.peek()
+            if c == ";":
+                self.pos += 1
+                return items
+            elif c in ["", "}"]:
+                return items
+            elif c == "(":
+                items.append(self.parse_parens())
+            elif c == "[":
+                end = self.content.index("]", self.pos)
+                items.append(self.content[self.pos:end + 1])
+                self.pos = end + 1
+            elif c == "\"":
+                end = self.content.index("\"", self.pos + 1)
+                items.append(self.content[self.pos + 1:end])
+                self.pos = end + 1
+            else:
+                word = self.read_word()
+                match = _ELEMENT_TYPE.match(word)
+                if match:
+                    elem = match.group(1)
+                if word.isdigit() and self.peek() in ["(", "{"]:
+                    items.append(self.read_list(int(word), elem))
+                else:
+                    items.append(word)
+
+    def parse_parens(self):
+        """Parse parenthesized group of words, such as a vector."""
+
+        self.expect("(")
+        items = []
+        while True:
+            c = self.peek()
+            if c == ")":
+                self.pos += 1
+                return items
+            elif c == "(":
+                items.append(self.parse_parens())
+            elif c == "":
+                raise ValueError("Unexpected end of file")
+            else:
+                items.append(self.read_word())
+
+    def read_list(self, count, elem):
+        """Read a list with given number of elements.
+
+        Args:
+            count (int): Number of elements, already read.
+            elem (str): Type of elements: 'label', 'scalar', 'vector',
+                'sphericalTensor', 'symmTensor', 'tensor' or 'face'.
+
+        Returns:
+            numpy.ndarray: Array of shape (count,) or (count, ncomponents).
+                Face lists are returned as a tuple (offsets, connectivity).
+        """
+
+        c = self.peek()
+        ncomp = _NCOMPONENTS.get(elem, 1)
+
+        if c == "{":
+            # Uniform list
+            self.pos += 1
+            if self.peek() == "(":
+                value = np.array(self.parse_parens(), dtype=float)
+            else:
+                value = float(self.read_word())
+            self.expect("}")
+            return np.tile(value, (count, 1)) if ncomp > 1 else np.full(
+                count, value)
+
+        self.expect("(")
+        if count == 0:
+            self.expect(")")
+            if elem == "face":
+                return np.zeros(1, dtype=int), np.zeros(0, dtype=int)
+            return np.zeros((0, ncomp) if ncomp > 1 else 0)
+
+        if self.binary:
+            if elem == "face":
+                raise ValueError("Binary face lists are supported only in "
+                                 "the faceCompactList format")
+            if elem == "label":
+                dtype = np.dtype("%si%d" % (self.byteorder, self.label_size))
+            else:
+                dtype = np.dtype("%sf%d" % (self.byteorder, self.scalar_size))
+            nbytes = count * ncomp * dtype.itemsize
+            array = np.frombuffer(self.content, dtype=dtype,
+                                  count=count * ncomp, offset=self.pos)
+            self.pos += nbytes
+            self.expect(")")
+        else:
+            if ncomp == 1 and elem != "face":
+                end = self.content.index(")", self.pos)
+                text = self.content[self.pos:end]
+                self.pos = end + 1
+            else:
+                match = _LIST_END.search(self.content, self.pos)
+                if match is None:
+                    raise ValueError("Unterminated list at position %d"
+                                     % self.pos)
+                text = self.content[self.pos:match.start() + 1]
+                text = text.replace("(", " ").replace(")", " ")
+                self.pos = match.end()
+
+            if elem == "face":
+                flat = np.array(text.split(), dtype=int)
+                return split_cells(flat, count)
+
+            dtype = int if elem == "label" else float
+            try:
+                array = np.array(text.split(), dtype=dtype)
+            except ValueError:
+                # List of words, such as inGroups of the patches
+                return text.split()
+
+        if len(array) != count * ncomp:
+            raise ValueError("Unexpected number of values in the list")
+        return array.reshape(count, ncomp) if ncomp > 1 else array
+
+
+def _read_header(path):
+    """Read only the FoamFile header of the file.
+
+    Returns:
+        dict: The header entries, or None if the header is missing.
+    """
+
+    with _open(path) as f:
+        content = f.read(4096)
+
+    try:
+        return _Parser(content).header
+    except ValueError:
+        return None
+
+
+def _read_file(path):
+    """Read the file and return the parser positioned after the header."""
+    with _open(path) as f:
+        return _Parser(f.read())
+
+
+def _read_list_file(path, elem):
+    """Read the polyMesh file containing single list."""
+
+    parser = _read_file(path)
+    if parser.header.get("class", [""])[0] == "faceCompactList":
+        offsets = _read_next_list(parser, "label")
+        connectivity = _read_next_list(parser, "label")
+        return offsets.astype(int), connectivity.astype(int)
+    return _read_next_list(parser, elem)
+
+
+def _read_next_list(parser, elem):
+    match = _LIST_START.search(parser.content, parser.pos)
+    if match is None:
+        raise ValueError("Missing list")
+    parser.pos = match.start(2)
+    return parser.read_list(int(match.group(1)), elem)
+
+
+def _to_array(value):
+    """Convert the parsed field value entry to numpy array.
+
+    Returns:
+        tuple: (uniform, array). If uniform is True, array is the single value.
+    """
+
+    if not value:
+        raise ValueError("Empty field value")
+    kind = value[0]
+    if kind == "uniform":
+        array = np.array(value[1], dtype=float)
+        return True, array
+    elif kind == "nonuniform":
+        array = value[-1]
+        if not isinstance(array, np.ndarray):
+            raise ValueError("Unsupported nonuniform value")
+        return False, array
+    else:
+        raise ValueError("Unsupported field value: %s" % kind)
+
+
+class FoamField(object):
+    """Values of a volume field on the cells and on the boundary patches.
+
+    Attributes:
+        internal (numpy.ndarray): Values in the cells.
+        patches (dict): Values on the boundary faces, indexed by the patch
+            names, as tuples (uniform, array). If uniform is True, array
+            is the single value of all the faces. A patch without explicit
+            values is not present.
+    """
+
+    def __init__(self, internal, patches):
+        self.internal = internal
+        self.patches = patches
+
+
+def read_field(path, ncells):
+    """Read the volume field file.
+
+    Args:
+        path (str): Path to the field file.
+        ncells (int): Number of cells in the mesh, used to expand the
+            uniform internal field.
+
+    Returns:
+        FoamField: The field values.
+    """
+
+    parser = _read_file(path)
+    elem = _FIELD_CLASSES.get(parser.header.get("class", [""])[0])
+    if elem is None:
+        raise ValueError("%s is not a volume field" % path)
+    ncomp = _NCOMPONENTS[elem]
+
+    entries = parser.parse_dict()
+
+    def expand(value, count):
+        uniform, array = _to_array(value)
+        if uniform:
+            array = (np.tile(array, (count, 1)) if ncomp > 1
+                     else np.full(count, float(array)))
+        return array
+
+    internal = expand(entries["internalField"], ncells)
+
+    patches = {}
+    for name, patch in entries.get("boundaryField", {}).iteritems():
+        if isinstance(patch, dict) and "value" in patch:
+            try:
+                patches[name] = _to_array(patch["value"])
+            except ValueError:
+                # Such as macro expansions, the patch is then treated
+                # as if it had no value
+                pass
+
+    return FoamField(internal, patches)
+
+
+def _cell_faces(owner, neighbour, ncells):
+    """Group the faces by cells.
+
+    Returns:
+        tuple: (offsets, faces, is_owner), where faces[offsets[i]:offsets[i+1]]
+            are the faces of cell i and is_owner tells whether the cell is
+            the owner of the face.
+    """
+
+    nfaces, ninternal = len(owner), len(neighbour)
+    cells = np.concatenate([owner, neighbour])
+    faces = np.concatenate([np.arange(nfaces), np.arange(ninternal)])
+    is_owner = np.arange(nfaces + ninternal) < nfaces
+
+    order = np.argsort(cells, kind="mergesort")
+    offsets = np.zeros(ncells + 1, dtype=int)
+    offsets[1:] = np.cumsum(np.bincount(cells, minlength=ncells))
+    return offsets, faces[order], is_owner[order]
+
+
+def _case_dir(casefile):
+    """Return the case directory of the case file or directory."""
+    if os.path.isdir(casefile):
+        return os.path.abspath(casefile)
+    return os.path.dirname(os.path.abspath(casefile))
+
+
+def processor_dirs(casefile):
+    """Return the processor directories of a decomposed case.
+
+    Returns:
+        List[str]: The directories, sorted by the processor numbers. Empty
+            if the case is not decomposed, or if it is reconstructed
+            (constant/polyMesh exists in the case directory).
+    """
+
+    casedir = _case_dir(casefile)
+    if os.path.isdir(os.path.join(casedir, "constant", "polyMesh")):
+        return []
+    dirs = []
+    for name in os.listdir(casedir):
+        match = _PROCESSOR_DIR.match(name)
+        if match and os.path.isdir(os.path.join(casedir, name)):
+            dirs.append((int(match.group(1)), os.path.join(casedir, name)))
+    return [path for _, path in sorted(dirs)]
+
+
+class FoamCase(object):
+    """OpenFOAM case accessed directly through the files.
+
+    Args:
+        casefile (str): Name of the case file (.foam or .openfoam) or of
+            the case directory.
+    """
+
+    def __init__(self, casefile):
+        self.casedir = _case_dir(casefile)
+        self._cache = {}
+
+    def _cached(self, key, function):
+        if key not in self._cache:
+            self._cache[key] = function()
+        return self._cache[key]
+
+    def _polymesh(self, name):
+        return os.path.join(self.casedir, "constant", "polyMesh", name)
+
+    # Time directories
+
+    def times(self):
+        """Return names of the time directories, sorted by the time value."""
+
+        times = []
+        for name in os.listdir(self.casedir):
+            try:
+                value = float(name)
+            except ValueError:
+                continue
+            if os.path.isdir(os.path.join(self.casedir, name)):
+                times.append((value, name))
+        return [name for _, name in sorted(times)]
+
+    def field_names(self, time, arrays=None):
+        """Return names of the volume fields present in the time directory.
+
+        Args:
+            time (str): Name of the time directory.
+            arrays (List[str]): If given, only these fields are looked for.
+        """
+
+        timedir = os.path.join(self.casedir, time)
+        names = []
+        for filename in sorted(os.listdir(timedir)):
+            path = os.path.join(timedir, filename)
+            name = filename[:-3] if filename.endswith(".gz") else filename
+            if arrays is not None and name not in arrays:
+                continue
+            if not os.path.isfile(path):
+                continue
+            header = _read_header(path)
+            if header and header.get("class", [""])[0] in _FIELD_CLASSES:
+                names.append(name)
+        return names
+
+    # Mesh arrays, read when first needed
+
+    @property
+    def points(self):
+        return self._cached("points", lambda: _read_list_file(
+            self._polymesh("points"), "vector"))
+
+    @property
+    def faces(self):
+        """tuple: (offsets, connectivity) of the faces."""
+        return self._cached("faces", lambda: _read_list_file(
+            self._polymesh("faces"), "face"))
+
+    @property
+    def owner(self):
+        return self._cached("owner", lambda: _read_list_file(
+            self._polymesh("owner"), "label").astype(int))
+
+    @property
+    def neighbour(self):
+        return self._cached("neighbour", lambda: _read_list_file(
+            self._polymesh("neighbour"), "label").astype(int))
+
+    @property
+    def boundary(self):
+        """List[tuple]: Patches as tuples (name, type, start, size)."""
+
+        def read_boundary():
+            parser = _read_file(self._polymesh("boundary"))
+            match = _LIST_START.search(parser.content, parser.pos)
+            parser.pos = match.start(2)
+            parser.expect("(")
+            patches = []
+            for _ in range(int(match.group(1))):
+                name = parser.read_word()
+                parser.expect("{")
+                entries = parser.parse_dict()
+                patches.append((name, entries["type"][0],
+                                int(entries["startFace"][0]),
+                                int(entries["nFaces"][0])))
+            return patches
+
+        return self._cached("boundary", read_boundary)
+
+    @property
+    def num_cells(self):
+        def count():
+            ncells = self.owner.max() + 1 if len(self.owner) else 0
+            if len(self.neighbour):
+                ncells = max(ncells, self.neighbour.max() + 1)
+            return int(ncells)
+
+        return self._cached("ncells", count)
+
+    @property
+    def cell_faces(self):
+        """tuple: Faces grouped by cells, see :func:`_cell_faces`."""
+        return self._cached("cell_faces", lambda: _cell_faces(
+            self.owner, self.neighbour, self.num_cells))
+
+    @property
+    def cell_points(self):
+        """tuple: (offsets, points) of the points of each cell."""
+
+        def compute():
+            face_offsets, face_points = self.faces
+            cf_offsets, cf_faces, _ = self.cell_faces
+            cf_cells = np.repeat(np.arange(self.num_cells),
+                                 np.diff(cf_offsets))
+            sizes = np.diff(face_offsets)[cf_faces]
+
+            npoints = len(self.points)
+            cells = np.repeat(cf_cells, sizes)
+            points = face_points[expand_ranges(face_offsets[cf_faces], sizes)]
+            keys = np.unique(cells * npoints + points)
+
+            offsets = np.zeros(self.num_cells + 1, dtype=int)
+            offsets[1:] = np.cumsum(np.bincount(keys // npoints,
+                                                minlength=self.num_cells))
+            return offsets, keys % npoints
+
+        return self._cached("cell_points", compute)
+
+    @property
+    def cell_centers(self):
+        """numpy.ndarray: Approximate cell centers (average of the points)."""
+
+        def compute():
+            offsets, points = self.cell_points
+            cells = np.repeat(np.arange(self.num_cells), np.diff(offsets))
+            counts = np.diff(offsets)[:, np.newaxis]
+            return np.column_stack([
+                np.bincount(cells, weights=self.points[points, i],
+                            minlength=self.num_cells)
+                for i in range(3)]) / counts
+
+        return self._cached("cell_centers", compute)
+
+    # Fields
+
+    def read_field(self, name, time):
+        """Read the volume field from the given time directory.
+
+        Returns:
+            FoamField: The field values.
+        """
+        return read_field(os.path.join(self.casedir, time, name),
+                          self.num_cells)
+
+    def release(self, time):
+        """Drop the cached fields of the given time."""
+        for key in list(self._cache):
+            if isinstance(key, tuple) and key[:2] == ("field", time):
+                del self._cache[key]
+
+    def mesh(self, time=None, arrays=None, cell_to_point=True):
+        """Return the mesh with the fields of the given time.
+
+        Args:
+            time (str): Name of the time directory. The last one by default.
+            arrays (List[str]): Names of the fields to be provided. All the
+                fields by default.
+            cell_to_point (bool): If False, the fields are provided only as
+                cell data, without interpolation to the points.
+
+        Returns:
+            FoamMesh: The mesh. The fields are read when first accessed.
+        """
+
+        if time is None:
+            times = self.times()
+            if not times:
+                raise ValueError("No time directory in case %s"
+                                 % self.casedir)
+            time = times[-1]
+        return FoamMesh(self, time, arrays, cell_to_point)
+
+
+class FoamMesh(Mesh):
+    """Internal mesh of an OpenFOAM case at a given time.
+
+    The cells of hexahedral shape are represented as VTK_HEXAHEDRON, all other
+    cells as VTK_POLYHEDRON.
+
+    Args:
+        case (FoamCase): The case.
+        time (str): Name of the time directory.
+        arrays (List[str]): Names of the fields to be provided, all by
+            default.
+        cell_to_point (bool): If False, the point data are empty.
+    """
+
+    def __init__(self, case, time, arrays=None, cell_to_point=True):
+        self.case = case
+        self.time = time
+        self.arrays = arrays
+        self.cell_to_point = cell_to_point
+
+        names = case.field_names(time, arrays)
+        cell_data = LazyDict(dict(
+            (name, self._cell_loader(name)) for name in names))
+        point_data = LazyDict(dict(
+            (name, self._point_loader(name))
+            for name in (names if cell_to_point else [])))
+        Mesh.__init__(self, point_data, cell_data)
+
+        for name in ["points", "faces", "owner", "neighbour", "boundary"]:
+            path = case._polymesh(name)
+            for filename in [path, path + ".gz"]:
+                if os.path.isfile(filename):
+                    self.source_files.append(filename)
+
+    def _cell_loader(self, name):
+        return lambda: self._field(name).internal
+
+    def _point_loader(self, name):
+        return lambda: self._cell_to_point(self._field(name))
+
+    def _field(self, name):
+        return self.case._cached(("field", self.time, name),
+                                 lambda: self.case.read_field(name, self.time))
+
+    @property
+    def points(self):
+        return self.case.points
+
+    @property
+    def num_cells(self):
+        return self.case.num_cells
+
+    def _get_cells(self):
+        # Shared by the meshes of all the times
+        return self.case._cached("cells", lambda: _foam_cells(self.case))
+
+    @property
+    def cell_types(self):
+        return self._get_cells()[0]
+
+    @property
+    def offsets(self):
+        return self._get_cells()[1]
+
+    @property
+    def connectivity(self):
+        return self._get_cells()[2]
+
+    def polyhedron_faces(self, cell):
+        face_offsets, face_points = self.case.faces
+        cf_offsets, cf_faces, cf_owner = self.case.cell_faces
+        faces = []
+        for i in range(cf_offsets[cell], cf_offsets[cell + 1]):
+            face = cf_faces[i]
+            points = face_points[face_offsets[face]:face_offsets[face + 1]]
+            faces.append(points if cf_owner[i] else points[::-1])
+        return faces
+
+    def cell_faces(self, cells=None):
+        face_offsets, face_points = self.case.faces
+        cf_offsets, cf_faces, cf_owner = self.case.cell_faces
+        if cells is None:
+            cells = np.arange(self.num_cells)
+        cells = np.asarray(cells, dtype=int)
+
+        entries = expand_ranges(cf_offsets[cells], np.diff(cf_offsets)[cells])
+        faces = cf_faces[entries]
+        sizes = np.diff(face_offsets)[faces]
+        offsets = np.zeros(len(faces) + 1, dtype=int)
+        offsets[1:] = np.cumsum(sizes)
+
+        # Faces of the neighbours are reversed to point outwards
+        position = np.arange(offsets[-1]) - np.repeat(offsets[:-1], sizes)
+        position = np.where(np.repeat(cf_owner[entries], sizes), position,
+                            np.repeat(sizes, sizes) - 1 - position)
+        points = face_points[np.repeat(face_offsets[faces], sizes) + position]
+        owners = np.repeat(cells, np.diff(cf_offsets)[cells])
+        return offsets, points, owners
+
+    def patch_faces(self, name):
+        for patch, _, start, size in self.case.boundary:
+            if patch == name:
+                face_offsets, face_points = self.case.faces
+                offsets = face_offsets[start:start + size + 1]
+                return (offsets - offsets[0],
+                        face_points[offsets[0]:offsets[-1]])
+        raise ValueError("No patch %s in case %s" % (name, self.case.casedir))
+
+    @property
+    def cell_centers(self):
+        return self.case.cell_centers
+
+    def boundary_faces(self, with_owners=False):
+        # The boundary faces are numbered after the internal ones
+        face_offsets, face_points = self.case.faces
+        ninternal = len(self.case.neighbour)
+        start = face_offsets[ninternal]
+        faces = (face_offsets[ninternal:] - start, face_points[start:])
+        if with_owners:
+            return faces + (self.case.owner[ninternal:],)
+        return faces
+
+    def _cell_to_point(self, field):
+        """Interpolate the field to the points.
+
+        The values are weighted by the inverse distance of the cell centers
+        from the points. Points on the boundary take the values of the
+        adjacent boundary faces instead, weighted in the same manner.
+        """
+
+        case = self.case
+        points = case.points
+        values = field.internal
+        vector = values.ndim == 2
+
+        offsets, cell_points = case.cell_points
+        cells = np.repeat(np.arange(case.num_cells), np.diff(offsets))
+        result = _weighted_average(points, cell_points,
+                                   case.cell_centers[cells], values[cells])
+
+        # Boundary faces
+        face_offsets, face_points = case.faces
+        bfaces, bvalues = [], []
+        for name, ptype, start, size in case.boundary:
+            if ptype in _SKIPPED_PATCHES or size == 0:
+                continue
+            faces = np.arange(start, start + size)
+            if name in field.patches:
+                uniform, array = field.patches[name]
+                if uniform:
+                    array = np.tile(array, (size, 1)) if vector else np.full(
+                        size, float(array))
+            else:
+                array = values[case.owner[faces]]
+            bfaces.append(faces)
+            bvalues.append(array)
+
+        if bfaces:
+            bfaces = np.concatenate(bfaces)
+            bvalues = np.concatenate(bvalues)
+            sizes = np.diff(face_offsets)[bfaces]
+            fpoints = face_points[expand_ranges(face_offsets[bfaces], sizes)]
+            fcenters = np.column_stack([
+                np.bincount(np.repeat(np.arange(len(bfaces)), sizes),
+                            weights=points[fpoints, i]) / sizes
+                for i in range(3)])
+
+            faces = np.repeat(np.arange(len(bfaces)), sizes)
+            bresult, mask = _weighted_average(points, fpoints, fcenters[faces],
+                                              bvalues[faces], with_mask=True)
+            result[mask] = bresult[mask]
+
+        return result
+
+
+class DecomposedCase(object):
+    """Decomposed OpenFOAM case, the union of its processor subdomains.
+
+    Args:
+        casefile (str): Name of the case file (.foam or .openfoam) or of
+            the case directory.
+        workers (int): Number of threads reading the subdomains
+            concurrently. The number of CPUs by default.
+
+    Attributes:
+        processors (List[FoamCase]): Cases of the subdomains.
+    """
+
+    def __init__(self, casefile, workers=None):
+        self.casedir = _case_dir(casefile)
+        self.processors = [FoamCase(path)
+                           for path in processor_dirs(self.casedir)]
+        if not self.processors:
+            raise ValueError("No processor directory in case %s"
+                             % self.casedir)
+        self.workers = workers or multiprocessing.cpu_count()
+
+    def map(self, function, items):
+        """Apply the function to the items concurrently.
+
+        Threads are used, the reading and the numpy operations release
+        the GIL for most of their time.
+
+        Returns:
+            list: The results, in the order of the items.
+        """
+
+        items = list(items)
+        workers = min(self.workers, len(items))
+        if workers < 2:
+            return [function(item) for item in items]
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+
+    def times(self):
+        """Return names of the time directories, see :class:`FoamCase`.
+
+        The times of the first subdomain are taken for the whole case.
+        """
+        return self.processors[0].times()
+
+    def field_names(self, time, arrays=None):
+        """Return names of the volume fields, see :class:`FoamCase`."""
+        return self.processors[0].field_names(time, arrays)
+
+    def release(self, time):
+        """Drop the cached fields of the given time."""
+        for processor in self.processors:
+            processor.release(time)
+
+    def mesh(self, time=None, arrays=None, cell_to_point=True):
+        """Return the mesh with the fields of the given time.
+
+        See :py:meth:`FoamCase.mesh` for the arguments.
+
+        Returns:
+            DecomposedMesh: The mesh. The fields are read when first accessed.
+        """
+
+        if time is None:
+            times = self.times()
+            if not times:
+                raise ValueError("No time directory in case %s"
+                                 % self.casedir)
+            time = times[-1]
+        return DecomposedMesh(self, time, arrays, cell_to_point)
+
+
+class DecomposedMesh(Mesh):
+    """Internal mesh of a decomposed OpenFOAM case at a given time.
+
+    The points and cells of the subdomains follow one another, in the order
+    of the processors. The arrays are concatenated when first needed, the
+    subdomains being read concurrently.
+
+    Args:
+        case (DecomposedCase): The case.
+        time (str): Name of the time directory.
+        arrays (List[str]): Names of the fields to be provided, all by
+            default.
+        cell_to_point (bool): If False, the point data are empty.
+
+    Attributes:
+        parts (List[FoamMesh]): Meshes of the subdomains.
+    """
+
+    def __init__(self, case, time, arrays=None, cell_to_point=True):
+        self.case = case
+        self.time = time
+        self.arrays = arrays
+        self.cell_to_point = cell_to_point
+        self.parts = [FoamMesh(processor, time, arrays, cell_to_point)
+                      for processor in case.processors]
+        self._cache = {}
+
+        cell_data = LazyDict(dict(
+            (name, self._loader("cell_data", name))
+            for name in self.parts[0].cell_data.keys()))
+        point_data = LazyDict(dict(
+            (name, self._loader("point_data", name))
+            for name in self.parts[0].point_data.keys()))
+        Mesh.__init__(self, point_data, cell_data)
+        for part in self.parts:
+            self.source_files.extend(part.source_files)
+
+    def _loader(self, kind, name):
+        return lambda: np.concatenate(self.case.map(
+            lambda part: getattr(part, kind)[name], self.parts))
+
+    def _cached(self, key, function):
+        if key not in self._cache:
+            self._cache[key] = function()
+        return self._cache[key]
+
+    @property
+    def point_offsets(self):
+        """numpy.ndarray: Index of the first point of each subdomain,
+        followed by the total number of points."""
+        return self._cached("point_offsets", lambda: np.cumsum(
+            [0] + [len(part.points) for part in self.parts]))
+
+    @property
+    def cell_offsets(self):
+        """numpy.ndarray: Index of the first cell of each subdomain,
+        followed by the total number of cells."""
+        return self._cached("cell_offsets", lambda: np.cumsum(
+            [0] + [part.num_cells for part in self.parts]))
+
+    @property
+    def points(self):
+        return self._cached("points", lambda: np.concatenate(self.case.map(
+            lambda part: part.points, self.parts)))
+
+    @property
+    def num_cells(self):
+        return int(self.cell_offsets[-1])
+
+    def _get_cells(self):
+        def compute():
+            parts = self.case.map(lambda part: (part.cell_types, part.offsets,
+                                                part.connectivity),
+                                  self.parts)
+            starts = np.cumsum([0] + [len(cells[2]) for cells in parts])
+            return (np.concatenate([cells[0] for cells in parts]),
+                    np.concatenate([[0]] + [
+                        cells[1][1:] + start
+                        for cells, start in zip(parts, starts)]).astype(int),
+                    np.concatenate([cells[2] + start for cells, start
+                                    in zip(parts, self.point_offsets)]))
+
+        return self._cached("cells", compute)
+
+    @property
+    def cell_types(self):
+        return self._get_cells()[0]
+
+    @property
+    def offsets(self):
+        return self._get_cells()[1]
+
+    @property
+    def connectivity(self):
+        return self._get_cells()[2]
+
+    def locate_cells(self, cells):
+        """Return the subdomains of the cells and their indices there."""
+        cells = np.asarray(cells, dtype=int)
+        parts = np.searchsorted(self.cell_offsets, cells, side="right") - 1
+        return parts, cells - self.cell_offsets[parts]
+
+    def polyhedron_faces(self, cell):
+        parts, local = self.locate_cells([cell])
+        start = self.point_offsets[parts[0]]
+        return [face + start for face
+                in self.parts[parts[0]].polyhedron_faces(local[0])]
+
+    def _join_faces(self, faces, parts):
+        """Concatenate the faces of the subdomains.
+
+        Args:
+            faces (List[tuple]): (offsets, connectivity, ...) of the faces of
+                each subdomain, the rest being the local cell indices.
+            parts (List[int]): The subdomains of the faces.
+        """
+
+        starts = np.cumsum([0] + [len(f[1]) for f in faces])
+        result = (np.concatenate([[0]] + [
+                      f[0][1:] + start for f, start in zip(faces, starts)]
+                  ).astype(int),
+                  np.concatenate([f[1] + self.point_offsets[part]
+                                  for f, part in zip(faces, parts)]
+                                 or [[]]).astype(int))
+        if faces and len(faces[0]) > 2:
+            result += (np.concatenate([f[2] + self.cell_offsets[part]
+                                       for f, part in zip(faces, parts)]),)
+        return result
+
+    def cell_faces(self, cells=None):
+        if cells is None:
+            cells = np.arange(self.num_cells)
+        parts, local = self.locate_cells(cells)
+        used = sorted(set(parts))
+        faces = self.case.map(
+            lambda part: self.parts[part].cell_faces(local[parts == part]),
+            used)
+        if not faces:
+            return (np.zeros(1, dtype=int), np.zeros(0, dtype=int),
+                    np.zeros(0, dtype=int))
+        return self._join_faces(faces, used)
+
+    def patch_faces(self, name):
+        faces, parts = [], []
+        for i, part in enumerate(self.parts):
+            if name in [patch[0] for patch in part.case.boundary]:
+                faces.append(part.patch_faces(name))
+                parts.append(i)
+        if not faces:
+            raise ValueError("No patch %s in case %s"
+                             % (name, self.case.casedir))
+        return self._join_faces(faces, parts)
+
+    @property
+    def cell_centers(self):
+        return self._cached("cell_centers", lambda: np.concatenate(
+            self.case.map(lambda part: part.cell_centers, self.parts)))
+
+    def boundary_faces(self, with_owners=False):
+        # The faces of the processor patches are inside the domain
+        faces = []
+        for part in self.parts:
+            face_offsets, face_points = part.case.faces
+            boundary = np.concatenate(
+                [np.arange(start, start + size) for _, ptype, start, size
+                 in part.case.boundary
+                 if ptype not in ["processor", "processorCyclic"]]
+                or [[]]).astype(int)
+            sizes = np.diff(face_offsets)[boundary]
+            offsets = np.zeros(len(boundary) + 1, dtype=int)
+            offsets[1:] = np.cumsum(sizes)
+            faces.append((offsets, face_points[expand_ranges(
+                face_offsets[boundary], sizes)], part.case.owner[boundary]))
+        faces = self._join_faces(faces, range(len(self.parts)))
+        return faces if with_owners else faces[:2]
+
+
+def _weighted_average(points, point_ids, centers, values, with_mask=False):
+    """Average the values to the points, weighted by the inverse distance.
+
+    Args:
+        points (numpy.ndarray): Coordinates of all the points.
+        point_ids (numpy.ndarray): Point index of each contribution.
+        centers (numpy.ndarray): Position of each contribution.
+        values (numpy.ndarray): Value of each contribution.
+        with_mask (bool): Return also the mask of the points with any
+            contribution.
+    """
+
+    npoints = len(points)
+    dist = np.sqrt(np.sum((points[point_ids] - centers)**2, axis=1))
+    weights = 1.0 / np.maximum(dist, 1e-30)
+    total = np.bincount(point_ids, weights=weights, minlength=npoints)
+    mask = total > 0
+    total[~mask] = 1.0
+
+    if values.ndim == 2:
+        result = np.column_stack([
+            np.bincount(point_ids, weights=weights * values[:, i],
+                        minlength=npoints)
+            for i in range(values.shape[1])]) / total[:, np.newaxis]
+    else:
+        result = np.bincount(point_ids, weights=weights * values,
+                             minlength=npoints) / total
+
+    return (result, mask) if with_mask else result
+
+
+def _foam_cells(case):
+    """Convert the OpenFOAM cells to VTK-style cells.
+
+    Cells with six quadrilateral faces forming a hexahedron are converted
+    to VTK_HEXAHEDRON, the rest is kept as VTK_POLYHEDRON, whose points are
+    all the points of the cell.
+
+    Returns:
+        tuple: (cell_types, offsets, connectivity)
+    """
+
+    ncells = case.num_cells
+    face_offsets, face_points = case.faces
+    cf_offsets, cf_faces, cf_owner = case.cell_faces
+    cp_offsets, cp_points = case.cell_points
+
+    face_sizes = np.diff(face_offsets)
+    nfaces = np.diff(cf_offsets)
+    quads = np.bincount(np.repeat(np.arange(ncells), nfaces),
+                        weights=(face_sizes[cf_faces] == 4), minlength=ncells)
+    candidates = np.nonzero((nfaces == 6) & (quads == 6)
+                            & (np.diff(cp_offsets) == 8))[0]
+
+    # Face points of the candidate cells, oriented inwards
+    entries = cf_offsets[candidates][:, np.newaxis] + np.arange(6)
+    faces = face_points[face_offsets[cf_faces[entries]][:, :, np.newaxis]
+                        + np.arange(4)]
+    owner = cf_owner[entries]
+    faces[owner] = faces[owner][:, ::-1]
+
+    # First face is the bottom; the top point above each bottom point is
+    # its neighbour along an edge of a side face
+    bottom = faces[:, 0, :]
+    sides = faces[:, 1:, :]
+    in_bottom = (sides[:, :, :, np.newaxis]
+                 == bottom[:, np.newaxis, np.newaxis, :])
+    is_bottom = in_bottom.any(axis=3)
+
+    top = np.full((len(candidates), 4), -1, dtype=int)
+    for shift in [1, -1]:
+        other = np.roll(sides, shift, axis=2)
+        other_bottom = np.roll(is_bottom, shift, axis=2)
+        for i in range(4):
+            mask = in_bottom[:, :, :, i] & ~other_bottom
+            found = np.where(mask, other, -1).max(axis=(1, 2))
+            top[:, i] = np.maximum(top[:, i], found)
+
+    hexes = np.column_stack([bottom, top])
+    valid = (top >= 0).all(axis=1)
+    valid &= (np.diff(np.sort(hexes, axis=1), axis=1) != 0).all(axis=1)
+    hex_cells = candidates[valid]
+
+    # Assemble the connectivity
+    is_hex = np.zeros(ncells, dtype=bool)
+    is_hex[hex_cells] = True
+    sizes = np.where(is_hex, 8, np.diff(cp_offsets))
+    offsets = np.zeros(ncells + 1, dtype=int)
+    offsets[1:] = np.cumsum(sizes)
+
+    connectivity = np.zeros(offsets[-1], dtype=int)
+    connectivity[(offsets[hex_cells][:, np.newaxis]
+                  + np.arange(8)).ravel()] = hexes[valid].ravel()
+    poly = np.nonzero(~is_hex)[0]
+    connectivity[expand_ranges(offsets[poly], sizes[poly])] = cp_points[
+        expand_ranges(cp_offsets[poly], sizes[poly])]
+
+    cell_types = np.where(is_hex, VTK_HEXAHEDRON, VTK_POLYHEDRON).astype(
+        np.uint8)
+    return cell_types, offsets, connectivity
+
+
+def _case_metadata(case):
+    """Return (npoints, ncells, lower, upper) of the mesh of the case."""
+
+    counts = None
+    try:
+        header = _read_header(case._polymesh("owner"))
+        counts = _MESH_NOTE.search(" ".join((header or {}).get("note", [])))
+    except ValueError:
+        # Missing owner file, reported when the mesh is read below
+        pass
+    # The points are read anyway for the bounds
+    points = case.points
+    ncells = int(counts.group(2)) if counts else case.num_cells
+    if not len(points):
+        return 0, ncells, None, None
+    return len(points), ncells, points.min(axis=0), points.max(axis=0)
+
+
+def read_metadata(casefile, workers=None):
+    """Read the description of the data in the OpenFOAM case.
+
+    Only the headers of the fields of the last time are read. Of the mesh,
+    only the points are read for the bounds, the number of cells is taken
+    from the header of the owner file if noted there.
+
+    Args:
+        casefile (str): Name of the case file (.foam or .openfoam) or of
+            the case directory.
+        workers (int): Number of threads reading the subdomains of
+            a decomposed case, see :class:`DecomposedCase`.
+
+    Returns:
+        dict: See :func:`pvtools.legacyvtk.read_metadata`, with the sorted
+            'times' in addition.
+    """
+
+    if processor_dirs(casefile):
+        case = DecomposedCase(casefile, workers)
+        sizes = case.map(_case_metadata, case.processors)
+    else:
+        case = FoamCase(casefile)
+        sizes = [_case_metadata(case)]
+
+    times = case.times()
+    names = case.field_names(times[-1]) if times else []
+    lower = [size[2] for size in sizes if size[0]]
+    upper = [size[3] for size in sizes if size[0]]
+    bounds = None
+    if lower:
+        bounds = tuple(float(b) for b in list(np.min(lower, axis=0))
+                       + list(np.max(upper, axis=0)))
+    return {"point_variables": list(names), "cell_variables": list(names),
+            "num_points": sum(size[0] for size in sizes),
+            "num_cells": sum(size[1] for size in sizes), "bounds": bounds,
+            "times": [float(time) for time in times]}
+
+
+def read(casefile, time=None, arrays=None, cell_to_point=True, workers=None):
+    """Read the OpenFOAM case.
+
+    Decomposed cases are read from the processor directories, unless the
+    case is reconstructed.
+
+    Args:
+        casefile (str): Name of the case file (.foam or .openfoam) or of
+            the case directory.
+        time (str): Name of the time directory. The last one by default.
+        arrays (List[str]): Names of the fields to be provided. All the
+            fields by default.
+        cell_to_point (bool): If False, the fields are provided only as cell
+            data, see :py:meth:`FoamCase.mesh`.
+        workers (int): Number of threads reading the subdomains of
+            a decomposed case, see :class:`DecomposedCase`.
+
+    Returns:
+        FoamMesh: The internal mesh, DecomposedMesh for decomposed cases.
+            The fields are read when first accessed.
+    """
+
+    if processor_dirs(casefile):
+        return DecomposedCase(casefile, workers).mesh(time, arrays,
+                                                      cell_to_point)
+    return FoamCase(casefile).mesh(time, arrays, cell_to_point)
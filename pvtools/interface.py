@@ -4,29 +4,37 @@
 High-level access function of pvtools package.
 """
 
+import collections
+import functools
 import os
 from contextlib import contextmanager
 import inspect
 import itertools
-import json
+import multiprocessing
+import sys
+import traceback
 
 import numpy as np
-import paraview.simple as pvs
 
-from .datasource import DataSource
+from . import profiling
+from .cache import ResultCache
+from .datasource import DataSource, required_arrays
+from .export import JsonWriter, NpzWriter
 
 PVTOOLS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                            os.pardir)
 
 @contextmanager
-def dsopen(filename):
+def dsopen(filename, **kwargs):
     """Return the DataSource object for the given filename.
 
     Args:
         filename (str): Name of the file to be opened.
+        **kwargs: Options of the data source, such as the backend, see
+            :py:meth:`pvtools.datasource.DataSource.__init__`.
     """
 
-    ds = DataSource(filename)
+    ds = DataSource(filename, **kwargs)
     yield ds
     ds.close()
 
@@ -42,17 +50,161 @@ def _standardize_args(argdict):
 
     return stdargs
 
-def to_dict(function, filename, **kwargs):
+def _probe_many_to_dict(ds, filename_key, variables, names, combinations,
+                        include_in_key, res):
+    """Probe all the points at once and store the values in res.
+
+    The keys and values are the same as obtained by calling
+    :py:meth:`DataSource.probe` for each point separately.
+
+    Args:
+        names (List[str]): Names of the geometry arguments, the point being
+            the first one.
+        combinations (List[tuple]): Combinations of the geometry arguments
+            differing only in the point.
+    """
+
+    coords = [combination[0][0] for combination in combinations]
+    other_args = dict((name, arg) for name, (arg, _)
+                      in zip(names[1:], combinations[0][1:]))
+    values = ds.probe_many([variable for variable, _ in variables], coords,
+                           **other_args)
+
+    for variable, variable_key in variables:
+        for i, combination in enumerate(combinations):
+            if values[variable] is None or np.isnan(values[variable][i]):
+                val = None
+            else:
+                val = values[variable][i]
+
+            keys = tuple(itertools.compress(
+                [filename_key, variable_key] + [t[1] for t in combination],
+                include_in_key))
+            res[keys] = val
+
+def _file_to_dict(function, probe_many, filename, filename_key, variables,
+                  names, geometries, include_in_key):
+    """Query one file and return the results as a flat dict.
+
+    Args:
+        function (str): Name of the DataSource method.
+        probe_many (bool): If True, the points of the geometries differing
+            only in the point are probed at once.
+        filename (str): File to be opened.
+        filename_key: Key of the file in the results.
+        variables (List[tuple]): Variables and their keys.
+        names (List[str]): Names of the geometry arguments of the method.
+        geometries (List[tuple]): Combinations of the geometry arguments,
+            each being a tuple of (argument, key) pairs.
+        include_in_key (List[bool]): Which keys are included in the results.
+    """
+
+    # Only the arrays of the queried variables are read
+    arrays = required_arrays([variable for variable, _ in variables])
+    with dsopen(filename, arrays=arrays) as ds:
+        return _query_datasource(ds, function, probe_many, filename_key,
+                                 variables, names, geometries, include_in_key)
+
+def _query_datasource(ds, function, probe_many, filename_key, variables,
+                      names, geometries, include_in_key):
+    """Query an open data source, see :func:`_file_to_dict`."""
+
+    res = {}
+    if probe_many:
+        groups = collections.OrderedDict()
+        for combination in geometries:
+            groups.setdefault(repr(combination[1:]), []).append(combination)
+        for combinations in groups.values():
+            _probe_many_to_dict(ds, filename_key, variables, names,
+                                combinations, include_in_key, res)
+        return res
+
+    # Variable is the first argument of all the methods, the rest
+    # describes the geometry. All the variables of one geometry
+    # are queried at once.
+    method = getattr(DataSource, function)
+    variable_names = [t[0] for t in variables]
+    for geometry_combination in geometries:
+        geometry_args = dict((name, t[0]) for name, t
+                             in zip(names, geometry_combination))
+        vals = method(ds, variable_names, **geometry_args)
+
+        for variable, variable_key in variables:
+            combination_keys = tuple(itertools.compress(
+                [filename_key, variable_key]
+                + [t[1] for t in geometry_combination],
+                include_in_key))
+
+            res[combination_keys] = vals[variable]
+
+    return res
+
+def _run_task(task, profile=False):
+    """Run _file_to_dict in a worker process.
+
+    The exceptions are reported with the name of the failed file and the
+    original traceback, which is otherwise lost between the processes.
+    If profile is True, the stats of the worker are returned along with
+    the results.
+    """
+    try:
+        if not profile:
+            return _file_to_dict(*task)
+        with profiling.profile() as stats:
+            with profiling.stage("file", filename=task[2]):
+                res = _file_to_dict(*task)
+        return res, stats
+    except Exception:
+        raise RuntimeError("Processing of file %s failed:\n%s"
+                           % (task[2], traceback.format_exc()))
+
+def _init_worker():
+    """Start a new Paraview session in the worker process.
+
+    Workers are forked from the main process, the session inherited from it
+    (if Paraview was already imported there) is not to be shared.
+    """
+    if "paraview.simple" in sys.modules:
+        pvs = sys.modules["paraview.simple"]
+        pvs.Disconnect()
+        pvs.Connect()
+
+def _split(seq, nparts):
+    """Split the list to at most nparts contiguous non-empty parts."""
+    nparts = max(1, min(nparts, len(seq)))
+    bounds = np.linspace(0, len(seq), nparts + 1).astype(int)
+    return [seq[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def to_dict(function, filename, workers=1, cache=None, stats=None,
+            **kwargs):
     """Return a dict with the data obtained by a method of DataSource object.
 
     This function serves as a wrapper around the methods of the DataSource class,
     allowing querying all elements of the product of the parameter sets.
+    All the variables queried on the same geometry (point, line, ...) are
+    obtained from a single pipeline evaluation. When probing several points,
+    they are all sampled at once using
+    :py:meth:`pvtools.datasource.DataSource.probe_many`.
 
     Args:
-        function (str): One of: 'probe', 'line'
+        function (str): One of: 'probe', 'line', 'boundary_line', or the
+            reductions 'integrate', 'average', 'minmax' and 'flux'.
         filename (List[tuple]): Files to be processes, in the format as the rest
             of the arguments (see below). The filename is then passed to
             :py:meth:`pvtools.datasource.DataSource.__init__`.
+        workers (int): Number of worker processes. If greater than one, the
+            files are distributed to a pool of processes, each with its own
+            Paraview session. When there are fewer files than workers, the
+            queries of each file are split among the workers as well.
+            Errors are raised as RuntimeError naming the failed file.
+        cache (str or pvtools.cache.ResultCache): Directory of the persistent
+            result cache, or the cache object. If given, the results of each
+            file are stored there and reused by later calls with the same
+            arguments, until any of the data files is modified. The cache
+            can be shared by concurrently running processes.
+        stats (pvtools.profiling.Stats): If given, the stages of processing
+            of each file are recorded there, including those run by the
+            workers. See :py:mod:`pvtools.profiling`.
         **kwargs: Arguments as taken by the desired method.
             Each argument is to be given as a list of tuples. Each element of the
             list is a 2-tuple, where the first element is the argument passed
@@ -78,10 +230,36 @@ def to_dict(function, filename, **kwargs):
         ...       point=[((0.0, 0.5, 0.5), "P1"), ((1.0, 0.5, 0.5), "P2")]))
         {('uz', 'P1'): 1.0, ('p', 'P2'): 20.0, ('p', 'P1'): 10.0, ('uz', 'P2'): 2.0}
     """
-    if function not in ["probe", "line", "boundary_line"]:
+    res = {}
+    for file_res in _iter_results(function, filename, workers, cache, stats,
+                                  kwargs):
+        res.update(file_res)
+    return res
+
+def plan_query(function, filename, **kwargs):
+    """Expand the arguments of :func:`to_dict` to the queries of the files.
+
+    The arguments are checked, without opening the files.
+
+    Args:
+        function (str): See :func:`to_dict`.
+        filename (List[tuple]): See :func:`to_dict`.
+        **kwargs: See :func:`to_dict`.
+
+    Returns:
+        tuple: (files, probe_many, query). files is the list of
+            (file name, key) pairs, probe_many tells whether the points are
+            probed together, and query is the tuple (function, variables,
+            argument names, geometries, include_in_key) run on each file,
+            the geometries being the combinations of the (argument, key)
+            pairs.
+    """
+
+    if function not in ["probe", "line", "boundary_line", "integrate",
+                        "average", "minmax", "flux"]:
         raise ValueError("Unsupported function %s" % function)
 
-    kwargs.update({"filename": filename})
+    kwargs = dict(kwargs, filename=filename)
     kwargs = _standardize_args(kwargs)
 
     method = getattr(DataSource, function)
@@ -96,25 +274,148 @@ def to_dict(function, filename, **kwargs):
         if arg not in kwargs:
             raise ValueError("Missing argument: %s." % arg)
 
-    arg_lists = [kwargs[arg_name]
-                 for arg_name in (["filename"] + arg_spec.args[1:])
+    # Adaptive lines return their sample points as well, which do not fit
+    # the flat results
+    if any(arg for arg, _ in kwargs.get("adaptive", [])):
+        raise ValueError("Adaptive lines are not supported here, call "
+                         "DataSource.line() directly")
+
+    arg_names = [arg_name for arg_name in (["filename"] + arg_spec.args[1:])
                  if arg_name in kwargs]
+    arg_lists = [kwargs[arg_name] for arg_name in arg_names]
     include_in_key = [len(arg_list) > 1 for arg_list in arg_lists]
 
-    res = {}
-    for filename, filename_key in kwargs["filename"]:
-        with dsopen(filename) as ds:
-            for arg_tuple_combination in itertools.product(*arg_lists[1:]):
-                combination_args = [t[0] for t in arg_tuple_combination]
-                val = method(ds, *combination_args)
+    # Several points are probed in one pass, see DataSource.probe_many
+    probe_many = (function == "probe" and len(kwargs["point"]) > 1)
 
-                combination_keys = tuple(itertools.compress(
-                    [filename_key] + [t[1] for t in arg_tuple_combination],
-                    include_in_key))
+    geometries = list(itertools.product(*arg_lists[2:]))
+    files = kwargs["filename"]
+    query = (function, kwargs["variable"], arg_names[2:], geometries,
+             include_in_key)
+    return files, probe_many, query
 
-                res[combination_keys] = val
+def query_datasources(function, filename, get_datasource, **kwargs):
+    """Yield the results of :func:`to_dict` queried on open data sources.
 
-    return res
+    The queries are planned as by :func:`to_dict`, but the files are not
+    opened here. The data source of each file is returned by get_datasource
+    and left open, so that e.g. the query daemon can keep it for the next
+    queries.
+
+    Args:
+        function (str): See :func:`to_dict`.
+        filename (List[tuple]): See :func:`to_dict`.
+        get_datasource (callable): Function returning the open
+            :class:`pvtools.DataSource` of the file name given.
+        **kwargs: See :func:`to_dict`.
+
+    Yields:
+        dict: Flat dict of the results for each file, in the given order.
+    """
+
+    files, probe_many, query = plan_query(function, filename, **kwargs)
+    function, variables, names, geometries, include_in_key = query
+    for path, filename_key in files:
+        yield _query_datasource(get_datasource(path), function, probe_many,
+                                filename_key, variables, names, geometries,
+                                include_in_key)
+
+def _iter_results(function, filename, workers, cache, stats, kwargs):
+    """Yield the results of to_dict, as a flat dict for each file.
+
+    The files are yielded in the given order as soon as they are processed.
+    See :func:`to_dict` for the arguments.
+    """
+
+    files, probe_many, query = plan_query(function, filename, **kwargs)
+    if stats is None:
+        stats = profiling.recording()
+
+    if cache is None:
+        for file_res in _query_files(files, probe_many, query, workers,
+                                     stats):
+            yield file_res
+        return
+
+    # Only the files without stored results are queried
+    if isinstance(cache, basestring):
+        cache = ResultCache(cache)
+    keys = [cache.key(filename, filename_key, *query)
+            for filename, filename_key in files]
+    missing = set(i for i, key in enumerate(keys) if key not in cache)
+    new_res = _query_files([f for i, f in enumerate(files) if i in missing],
+                           probe_many, query, workers, stats)
+
+    for i, (filename, filename_key) in enumerate(files):
+        if i not in missing:
+            with profiling.stage("cache_get", stats, filename=filename):
+                file_res = cache.get(keys[i])
+            if file_res is not None:
+                yield file_res
+                continue
+            # Evicted by another process in the meantime
+            file_res = next(_query_files([(filename, filename_key)],
+                                         probe_many, query, 1, stats))
+        else:
+            file_res = next(new_res)
+        with profiling.stage("cache_put", stats, filename=filename):
+            cache.put(keys[i], file_res)
+        yield file_res
+
+def _query_files(files, probe_many, query, workers, stats=None):
+    """Run the query on all the files.
+
+    Args:
+        files (List[tuple]): Files and their keys.
+        probe_many (bool): See :func:`_file_to_dict`.
+        query (tuple): Function, variables, names, geometries and
+            include_in_key arguments of :func:`_file_to_dict`.
+        workers (int): Number of worker processes.
+        stats (pvtools.profiling.Stats): Stats to record to, if any.
+
+    Yields:
+        dict: Flat dict of the results for each file, in the given order.
+    """
+
+    function, variables, names, geometries, include_in_key = query
+    if workers <= 1 or not files:
+        for filename, filename_key in files:
+            with profiling.stage("file", stats, filename=filename):
+                file_res = _file_to_dict(function, probe_many, filename,
+                                         filename_key, variables, names,
+                                         geometries, include_in_key)
+            yield file_res
+        return
+
+    # Split the queries of each file only if there are not enough files
+    # to keep all the workers busy
+    nparts = -(-workers // len(files))
+    tasks = [(i, (function, probe_many, filename, filename_key, variables,
+                  names, part, include_in_key))
+             for i, (filename, filename_key) in enumerate(files)
+             for part in _split(geometries, nparts)]
+
+    pool = multiprocessing.Pool(min(workers, len(tasks)),
+                                initializer=_init_worker)
+    try:
+        run = functools.partial(_run_task, profile=stats is not None)
+        parts = pool.imap(run, [task for _, task in tasks])
+        current, file_res = 0, {}
+        for (i, _), part_res in itertools.izip(tasks, parts):
+            if stats is not None:
+                part_res, part_stats = part_res
+                stats.merge(part_stats)
+            if i != current:
+                yield file_res
+                current, file_res = i, {}
+            file_res.update(part_res)
+        yield file_res
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
 
 def _insert_to_hdict(hdict, key, val):
     if len(key) == 1:
@@ -136,28 +437,60 @@ def _hierarchize(fdict):
         _insert_to_hdict(hdict, key, val)
     return hdict
 
-def to_json(json_file, function, filename, **kwargs):
+def _write_results(writer, function, filename, workers, cache, stats,
+                   kwargs):
+    """Write the results of each file by the writer as soon as available."""
+    for file_res in _iter_results(function, filename, workers, cache, stats,
+                                  kwargs):
+        # Sorted, so that the results of the same key prefix are together
+        for key in sorted(file_res):
+            writer.write(key, file_res[key])
+    writer.close()
+
+def to_json(json_file, function, filename, workers=1, cache=None,
+            stats=None, **kwargs):
     """Save the data obtained by a method of DataSource object to a json file.
 
     This function works just as :func:`to_dict`, except
     the result is directly saved to json file, and the numpy arrays (if present)
     are converted to plain lists. Furthermore, the dict is stored not as a flat
     one (indexed by tuples), but as a hierarchical one.
+    The results of each file are written as soon as the file is processed,
+    so the results of all the files are never held in memory at once.
 
     Args:
         json_file (str): name of the json file to be created.
         function (str): See :func:`to_dict`.
         filename (List[tuple]): See :func:`to_dict`.
+        workers (int): See :func:`to_dict`.
+        cache (str or pvtools.cache.ResultCache): See :func:`to_dict`.
+        stats (pvtools.profiling.Stats): See :func:`to_dict`.
         **kwargs: See :func:`to_dict`.
     """
 
-    res = to_dict(function, filename, **kwargs)
+    with open(json_file, 'w') as f:
+        _write_results(JsonWriter(f), function, filename, workers, cache,
+                       stats, kwargs)
 
-    for k, v in res.iteritems():
-        if isinstance(v, np.ndarray):
-            res[k] = v.tolist()
+def to_npz(npz_file, function, filename, workers=1, cache=None, stats=None,
+           **kwargs):
+    """Save the data obtained by a method of DataSource object to a npz file.
 
-    res = _hierarchize(res)
+    This function works just as :func:`to_json`, except the results are
+    stored in a binary, uncompressed npz archive, each as an array named
+    by its keys joined by '/' (e.g. 'C1/p/L1'). Results with None value are
+    not stored. The archive can be read by :func:`pvtools.export.load_npz`,
+    which memory-maps the arrays, or by numpy.load.
 
-    with open(json_file, 'w') as f:
-        json.dump(res, f, indent=4)
+    Args:
+        npz_file (str): name of the npz file to be created.
+        function (str): See :func:`to_dict`.
+        filename (List[tuple]): See :func:`to_dict`.
+        workers (int): See :func:`to_dict`.
+        cache (str or pvtools.cache.ResultCache): See :func:`to_dict`.
+        stats (pvtools.profiling.Stats): See :func:`to_dict`.
+        **kwargs: See :func:`to_dict`.
+    """
+
+    _write_results(NpzWriter(npz_file), function, filename, workers, cache,
+                   stats, kwargs)
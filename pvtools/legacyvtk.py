@@ -0,0 +1,411 @@
+#!/usr/bin/env python2
+
+"""
+Implements reader of the legacy VTK files in pure numpy.
+
+Supported datasets are STRUCTURED_POINTS, STRUCTURED_GRID, RECTILINEAR_GRID
+and UNSTRUCTURED_GRID, both in ASCII and BINARY format. Binary data are not
+parsed, but memory-mapped, so that only the headers are read when the file
+is opened and the data are loaded from the disk on access.
+"""
+
+import numpy as np
+
+from .mesh import StructuredMesh, UnstructuredMesh, cell_sizes, split_cells
+
+# Legacy binary files are always big-endian
+_DTYPES = {
+    "bit": None,
+    "unsigned_char": ">u1",
+    "char": ">i1",
+    "unsigned_short": ">u2",
+    "short": ">i2",
+    "unsigned_int": ">u4",
+    "int": ">i4",
+    "unsigned_long": ">u8",
+    "long": ">i8",
+    "float": ">f4",
+    "double": ">f8",
+    "vtkidtype": ">i4",
+    "vtktypeint64": ">i8",
+    "vtktypeuint64": ">u8",
+}
+
+
+def _dtype(name):
+    dtype = _DTYPES.get(name.lower())
+    if dtype is None:
+        raise ValueError("Unsupported data type: %s" % name)
+    return np.dtype(dtype)
+
+
+class _Reader(object):
+    """Sequential reader of the file sections.
+
+    Keywords are read line by line, data sections are either parsed (ASCII)
+    or memory-mapped (BINARY).
+    """
+
+    def __init__(self, filename, f, binary):
+        self.filename = filename
+        self.f = f
+        self.binary = binary
+
+    def next_line(self):
+        """Return the next non-empty line split to words, or None at EOF."""
+        while True:
+            line = self.f.readline()
+            if not line:
+                return None
+            words = line.split()
+            if words:
+                return words
+
+    def expect_line(self):
+        words = self.next_line()
+        if words is None:
+            raise ValueError("Unexpected end of file %s" % self.filename)
+        return words
+
+    def read_array(self, count, dtype, ascii_dtype=None):
+        """Read count values of the given type.
+
+        Args:
+            count (int): Number of values.
+            dtype (numpy.dtype): Type of the values in the binary file.
+            ascii_dtype (numpy.dtype): Type of the parsed ASCII values.
+                Same as dtype by default.
+        """
+
+        if self.binary:
+            offset = self.f.tell()
+            nbytes = count * dtype.itemsize
+            if count == 0:
+                array = np.zeros(0, dtype=dtype)
+            else:
+                array = np.memmap(self.filename, dtype=dtype, mode="r",
+                                  offset=offset, shape=(count,))
+            self.f.seek(offset + nbytes)
+            return array
+        else:
+            if ascii_dtype is None:
+                ascii_dtype = dtype.newbyteorder("=")
+
+            tokens = []
+            while len(tokens) < count:
+                line = self.f.readline()
+                if not line:
+                    raise ValueError("Unexpected end of file %s"
+                                     % self.filename)
+                tokens.extend(line.split())
+
+            if len(tokens) != count:
+                raise ValueError("Unexpected number of values in %s"
+                                 % self.filename)
+            return np.array(tokens, dtype=float).astype(ascii_dtype)
+
+    def skip_array(self, count, dtype):
+        """Skip count values of the given type, without parsing them."""
+
+        if self.binary:
+            self.f.seek(count * dtype.itemsize, 1)
+        else:
+            ntokens = 0
+            while ntokens < count:
+                line = self.f.readline()
+                if not line:
+                    raise ValueError("Unexpected end of file %s"
+                                     % self.filename)
+                ntokens += len(line.split())
+
+
+def _read_attributes(reader, count, words, data, arrays=None, names=None):
+    """Read data arrays of one POINT_DATA or CELL_DATA section.
+
+    Args:
+        reader (_Reader): Reader positioned after the section keyword.
+        count (int): Number of points or cells.
+        words (List[str]): Line following the section keyword.
+        data (dict): Dict where the arrays are stored.
+        arrays (List[str]): Names of the arrays to be read, the others are
+            skipped. All by default.
+        names (list): If given, the names of all the arrays of the section,
+            read or skipped, are appended to it.
+
+    Returns:
+        List[str]: First line not belonging to the section, or None at EOF.
+    """
+
+    def read(name, ntuples, ncomp, dtype, ascii_dtype=None, scale=None):
+        """Read the array of the given shape, if it is selected."""
+        if names is not None:
+            names.append(name)
+        if arrays is not None and name not in arrays:
+            reader.skip_array(ntuples * ncomp, dtype)
+            return
+        array = reader.read_array(ntuples * ncomp, dtype, ascii_dtype)
+        if scale is not None:
+            array = array / scale
+        data[name] = array if ncomp == 1 else array.reshape(ntuples, ncomp)
+
+    while words is not None:
+        keyword = words[0].upper()
+        if keyword == "SCALARS":
+            name, dtype = words[1], _dtype(words[2])
+            ncomp = int(words[3]) if len(words) > 3 else 1
+            # The lookup table line is optional
+            pos = reader.f.tell()
+            line = reader.expect_line()
+            if line[0].upper() != "LOOKUP_TABLE":
+                reader.f.seek(pos)
+            read(name, count, ncomp, dtype)
+        elif keyword in ["VECTORS", "NORMALS"]:
+            read(words[1], count, 3, _dtype(words[2]))
+        elif keyword == "TENSORS":
+            read(words[1], count, 9, _dtype(words[2]))
+        elif keyword == "TEXTURE_COORDINATES":
+            read(words[1], count, int(words[2]), _dtype(words[3]))
+        elif keyword == "COLOR_SCALARS":
+            # Colors are stored as bytes in binary files
+            read(words[1], count, int(words[2]), np.dtype("u1"),
+                 np.dtype(float), 255.0 if reader.binary else None)
+        elif keyword == "LOOKUP_TABLE":
+            # Lookup table data, not of interest here
+            reader.read_array(int(words[2]) * 4, np.dtype("u1"),
+                              np.dtype(float))
+        elif keyword == "FIELD":
+            for _ in range(int(words[2])):
+                words = reader.expect_line()
+                if words[0].upper() == "METADATA":
+                    _skip_metadata(reader)
+                    words = reader.expect_line()
+                read(words[0], int(words[2]), int(words[1]),
+                     _dtype(words[3]))
+        elif keyword == "METADATA":
+            _skip_metadata(reader)
+        else:
+            return words
+
+        words = reader.next_line()
+
+    return None
+
+
+def _skip_metadata(reader):
+    """Skip the METADATA block, which is terminated by an empty line."""
+    while True:
+        line = reader.f.readline()
+        if not line or not line.strip():
+            return
+
+
+def _read_sections(filename, arrays=None, names=None, cells=True):
+    """Read the sections of the legacy VTK file.
+
+    Args:
+        filename (str): Name of the file.
+        arrays (List[str]): See :func:`read`.
+        names (dict): If given, the names of all the point and cell data
+            arrays are appended to its lists 'POINT_DATA' and 'CELL_DATA'.
+        cells (bool): If False, the cells are skipped, only their number is
+            stored in the geometry as 'NCELLS'.
+
+    Returns:
+        tuple: (dataset, geometry, point_data, cell_data), geometry being
+            the dict of the geometry sections indexed by their keywords.
+    """
+
+    with open(filename, "rb") as f:
+        f.readline()
+        f.readline()
+        fmt = f.readline().strip().upper()
+        if fmt not in ["ASCII", "BINARY"]:
+            raise ValueError("Unknown format %s of file %s" % (fmt, filename))
+
+        reader = _Reader(filename, f, fmt == "BINARY")
+        words = reader.expect_line()
+        if words[0].upper() != "DATASET":
+            raise ValueError("Missing DATASET in file %s" % filename)
+        dataset = words[1].upper()
+        if dataset not in ["STRUCTURED_POINTS", "STRUCTURED_GRID",
+                           "RECTILINEAR_GRID", "UNSTRUCTURED_GRID"]:
+            raise ValueError("Unsupported dataset %s in file %s"
+                             % (dataset, filename))
+
+        geometry = {}
+        point_data, cell_data = {}, {}
+        words = reader.next_line()
+        while words is not None:
+            keyword = words[0].upper()
+            if keyword in ["DIMENSIONS", "ORIGIN", "SPACING", "ASPECT_RATIO"]:
+                geometry[keyword] = [float(w) for w in words[1:4]]
+            elif keyword == "POINTS":
+                npoints = int(words[1])
+                geometry["POINTS"] = reader.read_array(
+                    3 * npoints, _dtype(words[2])).reshape(npoints, 3)
+            elif keyword in ["X_COORDINATES", "Y_COORDINATES",
+                             "Z_COORDINATES"]:
+                geometry[keyword] = reader.read_array(int(words[1]),
+                                                      _dtype(words[2]))
+            elif keyword == "CELLS" and not cells:
+                ncells, size = int(words[1]), int(words[2])
+                pos = reader.f.tell()
+                nextwords = reader.expect_line()
+                if nextwords[0].upper() == "OFFSETS":
+                    # The offsets are followed by the total size
+                    reader.skip_array(ncells, _dtype(nextwords[1]))
+                    nextwords = reader.expect_line()
+                    reader.skip_array(size, _dtype(nextwords[1]))
+                    ncells -= 1
+                else:
+                    reader.f.seek(pos)
+                    reader.skip_array(size, np.dtype(">i4"))
+                geometry["NCELLS"] = ncells
+            elif keyword == "CELLS":
+                ncells, size = int(words[1]), int(words[2])
+                pos = reader.f.tell()
+                nextwords = reader.expect_line()
+                if nextwords[0].upper() == "OFFSETS":
+                    # Format of VTK >= 9: OFFSETS and CONNECTIVITY arrays
+                    offsets = reader.read_array(ncells,
+                                                _dtype(nextwords[1]))
+                    nextwords = reader.expect_line()
+                    conn = reader.read_array(size, _dtype(nextwords[1]))
+                    geometry["CELLS"] = (offsets, conn)
+                else:
+                    reader.f.seek(pos)
+                    geometry["CELLS"] = (ncells,
+                                         reader.read_array(size,
+                                                           np.dtype(">i4")))
+            elif keyword == "CELL_TYPES" and not cells:
+                reader.skip_array(int(words[1]), np.dtype(">i4"))
+            elif keyword == "CELL_TYPES":
+                geometry["CELL_TYPES"] = reader.read_array(int(words[1]),
+                                                           np.dtype(">i4"))
+            elif keyword in ["POINT_DATA", "CELL_DATA"]:
+                data = point_data if keyword == "POINT_DATA" else cell_data
+                words = _read_attributes(
+                    reader, int(words[1]), reader.next_line(), data, arrays,
+                    None if names is None else names[keyword])
+                continue
+            elif keyword in ["FIELD", "METADATA"]:
+                # Field data of the whole dataset, not of interest here
+                words = _read_attributes(reader, 1, words, {}, [])
+                continue
+            else:
+                raise ValueError("Unexpected keyword %s in file %s"
+                                 % (words[0], filename))
+
+            words = reader.next_line()
+
+    return dataset, geometry, point_data, cell_data
+
+
+def read(filename, arrays=None):
+    """Read the legacy VTK file.
+
+    Args:
+        filename (str): Name of the file.
+        arrays (List[str]): Names of the point and cell data arrays to be
+            read, the others are skipped. All by default.
+
+    Returns:
+        pvtools.mesh.Mesh: The mesh with all the data arrays.
+            The arrays of binary files are memory-mapped.
+    """
+
+    mesh = _build_mesh(*_read_sections(filename, arrays))
+    mesh.source_files = [filename]
+    return mesh
+
+
+def read_metadata(filename):
+    """Read the description of the data in the legacy VTK file.
+
+    The data arrays and the cells are skipped (in binary files without
+    reading them at all), only the points are read to get the bounds.
+
+    Returns:
+        dict: Lists of the names 'point_variables' and 'cell_variables',
+            the counts 'num_points' and 'num_cells' and the 'bounds'
+            (minx, miny, minz, maxx, maxy, maxz), None for no points.
+    """
+
+    names = {"POINT_DATA": [], "CELL_DATA": []}
+    dataset, geometry, _, _ = _read_sections(filename, [], names, False)
+
+    if dataset in ["UNSTRUCTURED_GRID", "STRUCTURED_GRID"]:
+        points = geometry["POINTS"]
+        lower = points.min(axis=0) if len(points) else None
+        upper = points.max(axis=0) if len(points) else None
+    elif dataset == "RECTILINEAR_GRID":
+        coords = [geometry[k] for k in
+                  ["X_COORDINATES", "Y_COORDINATES", "Z_COORDINATES"]]
+        lower = [c.min() for c in coords]
+        upper = [c.max() for c in coords]
+    else:
+        origin = np.array(geometry.get("ORIGIN", [0.0, 0.0, 0.0]))
+        spacing = np.array(geometry.get("SPACING",
+                                        geometry.get("ASPECT_RATIO",
+                                                     [1.0, 1.0, 1.0])))
+        far = origin + (np.array(geometry["DIMENSIONS"]) - 1) * spacing
+        lower, upper = np.minimum(origin, far), np.maximum(origin, far)
+
+    if dataset == "UNSTRUCTURED_GRID":
+        npoints = len(geometry["POINTS"])
+        ncells = geometry["NCELLS"]
+    else:
+        dimensions = [int(d) for d in geometry["DIMENSIONS"]]
+        npoints = int(np.prod(dimensions))
+        ncells = int(np.prod([d - 1 for d in dimensions if d > 1]))
+
+    bounds = None
+    if npoints:
+        bounds = tuple(float(b) for b in list(lower) + list(upper))
+    return {"point_variables": names["POINT_DATA"],
+            "cell_variables": names["CELL_DATA"],
+            "num_points": npoints, "num_cells": ncells, "bounds": bounds}
+
+
+def _build_mesh(dataset, geometry, point_data, cell_data):
+    """Create the mesh object from the read sections."""
+
+    if dataset == "UNSTRUCTURED_GRID":
+        cells = geometry["CELLS"]
+        cell_types = geometry["CELL_TYPES"]
+
+        def get_cells():
+            if isinstance(cells[0], int):
+                offsets, connectivity = split_cells(
+                    cells[1], cells[0], cell_sizes(cell_types))
+            else:
+                offsets, connectivity = cells
+            return cell_types, offsets, connectivity
+
+        return UnstructuredMesh(geometry["POINTS"], get_cells,
+                                point_data, cell_data)
+
+    dimensions = [int(d) for d in geometry["DIMENSIONS"]]
+    if dataset == "STRUCTURED_GRID":
+        points = geometry["POINTS"]
+    elif dataset == "RECTILINEAR_GRID":
+        coords = [geometry[k] for k in
+                  ["X_COORDINATES", "Y_COORDINATES", "Z_COORDINATES"]]
+
+        def points():
+            z, y, x = np.meshgrid(coords[2], coords[1], coords[0],
+                                  indexing="ij")
+            return np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+    else:
+        origin = np.array(geometry.get("ORIGIN", [0.0, 0.0, 0.0]))
+        spacing = np.array(geometry.get("SPACING",
+                                        geometry.get("ASPECT_RATIO",
+                                                     [1.0, 1.0, 1.0])))
+
+        def points():
+            k, j, i = np.meshgrid(*[np.arange(d) for d in dimensions[::-1]],
+                                  indexing="ij")
+            index = np.column_stack([i.ravel(), j.ravel(), k.ravel()])
+            return origin + index * spacing
+
+    return StructuredMesh(dimensions, points, point_data, cell_data)
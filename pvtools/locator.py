@@ -0,0 +1,808 @@
+#!/usr/bin/env python2
+
+"""
+Implements the cell locator used for probing the meshes read by the native
+readers.
+
+The locator divides the bounding box of the mesh to a uniform grid of bins,
+each listing the cells overlapping it. Points are then located by testing only
+the cells of their bin. Inside the cells, the point data are interpolated
+by the isoparametric shape functions, as VTK does (barycentric weights for
+tetrahedra, trilinear for hexahedra). Polyhedra are decomposed to tetrahedra
+sharing the cell centroid, whose value is the average of the cell points.
+Points are located in the surface cells (triangles and quadrilaterals) when
+they lie on the surface, within the tolerance.
+
+All the operations are vectorized over the queried points.
+
+Meshes composed of subdomains (decomposed OpenFOAM cases) get a locator per
+subdomain, built when a queried point first falls in the subdomain bounds.
+The points are routed only to the subdomains whose bounds contain them.
+"""
+
+import os
+
+import numpy as np
+
+from .mesh import (LazyDict, expand_ranges, VTK_TRIANGLE, VTK_PIXEL,
+                   VTK_QUAD, VTK_TETRA, VTK_VOXEL, VTK_HEXAHEDRON, VTK_WEDGE,
+                   VTK_PYRAMID, VTK_POLYHEDRON)
+
+
+# Version of the sidecar file format
+_INDEX_VERSION = 2
+
+# Tolerance on the parametric coordinates
+_TOLERANCE = 1e-6
+
+# Maximal number of Newton iterations when inverting the shape functions
+_MAX_ITERATIONS = 20
+
+# Points are located in chunks of this size to limit the memory use
+_CHUNK_SIZE = 50000
+
+# Target number of elements in a bin, on average
+_CELLS_PER_BIN = 1.0
+
+# Cell types located as other types, with the reordering of their points
+_REORDERED = {VTK_VOXEL: (VTK_HEXAHEDRON, [0, 1, 3, 2, 4, 5, 7, 6]),
+              VTK_PIXEL: (VTK_QUAD, [0, 1, 3, 2])}
+
+
+def _shape_triangle(r, s, t):
+    return np.column_stack([1 - r - s, r, s])
+
+
+def _derivs_triangle(r, s, t):
+    n = len(r)
+    one, zero = np.ones(n), np.zeros(n)
+    return np.stack([np.column_stack([-one, one, zero]),
+                     np.column_stack([-one, zero, one]),
+                     np.column_stack([zero, zero, zero])], axis=1)
+
+
+def _inside_triangle(r, s, t, tol):
+    return (r >= -tol) & (s >= -tol) & (r + s <= 1 + tol)
+
+
+def _shape_quad(r, s, t):
+    rm, sm = 1 - r, 1 - s
+    return np.column_stack([rm * sm, r * sm, r * s, rm * s])
+
+
+def _derivs_quad(r, s, t):
+    rm, sm = 1 - r, 1 - s
+    zero = 0 * t
+    return np.stack([np.column_stack([-sm, sm, s, -s]),
+                     np.column_stack([-rm, -r, r, rm]),
+                     np.column_stack([zero, zero, zero, zero])], axis=1)
+
+
+def _inside_rectangle(r, s, t, tol):
+    return (r >= -tol) & (r <= 1 + tol) & (s >= -tol) & (s <= 1 + tol)
+
+
+def _shape_tetra(r, s, t):
+    return np.column_stack([1 - r - s - t, r, s, t])
+
+
+def _derivs_tetra(r, s, t):
+    n = len(r)
+    one, zero = np.ones(n), np.zeros(n)
+    return np.stack([np.column_stack([-one, one, zero, zero]),
+                     np.column_stack([-one, zero, one, zero]),
+                     np.column_stack([-one, zero, zero, one])], axis=1)
+
+
+def _inside_tetra(r, s, t, tol):
+    return ((r >= -tol) & (s >= -tol) & (t >= -tol)
+            & (r + s + t <= 1 + tol))
+
+
+def _shape_hex(r, s, t):
+    rm, sm, tm = 1 - r, 1 - s, 1 - t
+    return np.column_stack([rm * sm * tm, r * sm * tm, r * s * tm, rm * s * tm,
+                            rm * sm * t, r * sm * t, r * s * t, rm * s * t])
+
+
+def _derivs_hex(r, s, t):
+    rm, sm, tm = 1 - r, 1 - s, 1 - t
+    dr = np.column_stack([-sm * tm, sm * tm, s * tm, -s * tm,
+                          -sm * t, sm * t, s * t, -s * t])
+    ds = np.column_stack([-rm * tm, -r * tm, r * tm, rm * tm,
+                          -rm * t, -r * t, r * t, rm * t])
+    dt = np.column_stack([-rm * sm, -r * sm, -r * s, -rm * s,
+                          rm * sm, r * sm, r * s, rm * s])
+    return np.stack([dr, ds, dt], axis=1)
+
+
+def _inside_box(r, s, t, tol):
+    return ((r >= -tol) & (r <= 1 + tol) & (s >= -tol) & (s <= 1 + tol)
+            & (t >= -tol) & (t <= 1 + tol))
+
+
+def _shape_wedge(r, s, t):
+    u = 1 - r - s
+    return np.column_stack([u * (1 - t), r * (1 - t), s * (1 - t),
+                            u * t, r * t, s * t])
+
+
+def _derivs_wedge(r, s, t):
+    u = 1 - r - s
+    tm = 1 - t
+    return np.stack([np.column_stack([-tm, tm, 0 * t, -t, t, 0 * t]),
+                     np.column_stack([-tm, 0 * t, tm, -t, 0 * t, t]),
+                     np.column_stack([-u, -r, -s, u, r, s])], axis=1)
+
+
+def _inside_wedge(r, s, t, tol):
+    return ((r >= -tol) & (s >= -tol) & (r + s <= 1 + tol)
+            & (t >= -tol) & (t <= 1 + tol))
+
+
+def _shape_pyramid(r, s, t):
+    rm, sm, tm = 1 - r, 1 - s, 1 - t
+    return np.column_stack([rm * sm * tm, r * sm * tm, r * s * tm,
+                            rm * s * tm, t])
+
+
+def _derivs_pyramid(r, s, t):
+    rm, sm, tm = 1 - r, 1 - s, 1 - t
+    zero, one = 0 * t, 0 * t + 1
+    return np.stack([
+        np.column_stack([-sm * tm, sm * tm, s * tm, -s * tm, zero]),
+        np.column_stack([-rm * tm, -r * tm, r * tm, rm * tm, zero]),
+        np.column_stack([-rm * sm, -r * sm, -r * s, -rm * s, one])], axis=1)
+
+
+# Number of points, shape functions, their derivatives and the test of
+# the parametric coordinates, for each of the supported element types.
+# The surface elements have two parametric coordinates, the third one is
+# the distance from the element, see _parametric_coords.
+_ELEMENTS = {
+    VTK_TRIANGLE: (3, _shape_triangle, _derivs_triangle, _inside_triangle),
+    VTK_QUAD: (4, _shape_quad, _derivs_quad, _inside_rectangle),
+    VTK_TETRA: (4, _shape_tetra, _derivs_tetra, _inside_tetra),
+    VTK_HEXAHEDRON: (8, _shape_hex, _derivs_hex, _inside_box),
+    VTK_WEDGE: (6, _shape_wedge, _derivs_wedge, _inside_wedge),
+    VTK_PYRAMID: (5, _shape_pyramid, _derivs_pyramid, _inside_box),
+}
+
+_SURFACE_ELEMENTS = [VTK_TRIANGLE, VTK_QUAD]
+
+
+def _solve3(mat, rhs):
+    """Solve a stack of 3x3 linear systems.
+
+    Returns:
+        tuple: (solution, ok), where ok is False for the singular systems.
+    """
+
+    c0, c1, c2 = mat[:, :, 0], mat[:, :, 1], mat[:, :, 2]
+    cross12 = np.cross(c1, c2)
+    det = np.sum(c0 * cross12, axis=1)
+    ok = np.abs(det) > 1e-300
+    det = np.where(ok, det, 1.0)
+
+    sol = np.column_stack([np.sum(rhs * cross12, axis=1),
+                           np.sum(c0 * np.cross(rhs, c2), axis=1),
+                           np.sum(c0 * np.cross(c1, rhs), axis=1)])
+    return sol / det[:, np.newaxis], ok
+
+
+def _parametric_coords(etype, nodes, points):
+    """Find the parametric coordinates of the points in the elements.
+
+    Args:
+        etype (int): VTK type of the elements.
+        nodes (numpy.ndarray): (n, npts, 3) array of the element points.
+        points (numpy.ndarray): (n, 3) array of the points.
+
+    Returns:
+        tuple: (weights, inside), the interpolation weights of the element
+            points and the mask of points lying inside their elements.
+    """
+
+    _, shape, derivs, inside = _ELEMENTS[etype]
+    n = len(points)
+    surface = etype in _SURFACE_ELEMENTS
+    nparams = 2 if surface else 3
+    params = np.full((n, 3), 0.25 if etype == VTK_TETRA else 0.5)
+    if surface:
+        params[:, 2] = 0.0
+    converged = np.zeros(n, dtype=bool)
+    ok = np.ones(n, dtype=bool)
+
+    for _ in range(_MAX_ITERATIONS):
+        r, s, t = params.T
+        residual = points - np.einsum("ij,ijk->ik", shape(r, s, t), nodes)
+        jacobian = np.einsum("ilj,ijk->ikl", derivs(r, s, t), nodes)
+        if surface:
+            # The third direction is the unit normal of the surface, so the
+            # third coordinate is the distance of the point from it
+            normal = np.cross(jacobian[:, :, 0], jacobian[:, :, 1])
+            length = np.sqrt(np.sum(normal**2, axis=1))
+            jacobian[:, :, 2] = normal / np.where(
+                length > 0, length, 1.0)[:, np.newaxis]
+            params[:, 2] = 0.0
+        delta, solvable = _solve3(jacobian, residual)
+        ok &= solvable
+        delta[~ok] = 0.0
+        params += delta
+
+        converged = np.max(np.abs(delta[:, :nparams]), axis=1) < 1e-10
+        if np.all(converged | ~ok):
+            break
+        # Points far outside of the element diverge, stop their iterations
+        ok &= np.all(np.abs(params[:, :nparams]) < 10, axis=1)
+
+    r, s, t = params.T
+    found = ok & converged & inside(r, s, t, _TOLERANCE)
+    if surface:
+        size = np.sqrt(np.max(np.sum(jacobian[:, :, :2]**2, axis=1), axis=1))
+        found &= np.abs(t) <= _TOLERANCE * size
+    return shape(r, s, t), found
+
+
+class CellLocator(object):
+    """Locator of the cells containing given points.
+
+    Args:
+        mesh (pvtools.mesh.Mesh): The mesh.
+        arrays (dict): Arrays of a previously built locator, as stored by
+            :py:meth:`CellLocator.save`. If None, the locator is built.
+    """
+
+    def __init__(self, mesh, arrays=None):
+        self.mesh = mesh
+        self.points = np.asarray(mesh.points, dtype=float)
+        if arrays is None:
+            arrays = self._build()
+        for name, array in arrays.iteritems():
+            setattr(self, name, array)
+
+    # Building
+
+    def _elements(self):
+        """Decompose the cells to the elements of the supported types.
+
+        Polyhedra are decomposed to tetrahedra, whose fourth point is
+        the centroid of the polyhedron. Centroids are numbered after the
+        mesh points.
+        """
+
+        mesh = self.mesh
+        cell_types = np.asarray(mesh.cell_types)
+        offsets = np.asarray(mesh.offsets)
+        connectivity = np.asarray(mesh.connectivity)
+        sizes = np.diff(offsets)
+
+        # Standard cells
+        supported = np.in1d(cell_types, list(_ELEMENTS) + list(_REORDERED))
+        if len(cell_types) and not supported.any() and not np.any(
+                cell_types == VTK_POLYHEDRON):
+            raise ValueError(
+                "Points are located only in surface and volume cells, the "
+                "mesh has cells of VTK types %s"
+                % ", ".join(str(t) for t in np.unique(cell_types)))
+        cells = np.nonzero(supported)[0]
+        nodes = connectivity[expand_ranges(offsets[cells], sizes[cells])]
+
+        # Voxels become hexahedra and pixels quadrilaterals, with reordered
+        # points
+        etypes = cell_types[cells].astype(int)
+        node_offsets = np.zeros(len(cells) + 1, dtype=int)
+        node_offsets[1:] = np.cumsum(sizes[cells])
+        for ctype, (etype, order) in _REORDERED.iteritems():
+            reordered = np.nonzero(etypes == ctype)[0]
+            if len(reordered):
+                starts = node_offsets[reordered][:, np.newaxis]
+                nodes[starts + np.arange(len(order))] = nodes[starts + order]
+                etypes[reordered] = etype
+        ecells = [cells]
+        enodes = [nodes]
+        esizes = [sizes[cells]]
+        etypes = [etypes]
+
+        # Polyhedra, their centroids being the averages of their points
+        polyhedra = np.nonzero(cell_types == VTK_POLYHEDRON)[0]
+        poly_sizes = sizes[polyhedra]
+        poly_points = self.points[connectivity[expand_ranges(
+            offsets[polyhedra], poly_sizes)]]
+        poly_index = np.repeat(np.arange(len(polyhedra)), poly_sizes)
+        centroids = np.column_stack([
+            np.bincount(poly_index, weights=poly_points[:, i],
+                        minlength=len(polyhedra))
+            for i in range(3)]) / np.maximum(poly_sizes, 1)[:, np.newaxis]
+
+        if len(polyhedra):
+            # Fan of triangles of each face, with the centroid. Faces point
+            # outwards, they are reversed for positive volume.
+            face_offsets, face_points, owners = mesh.cell_faces(polyhedra)
+            ntris = np.maximum(np.diff(face_offsets) - 2, 0)
+            tri_faces = np.repeat(np.arange(len(ntris)), ntris)
+            first = np.repeat(face_offsets[:-1], ntris)
+            j = 1 + np.arange(len(tri_faces)) - np.repeat(
+                np.cumsum(ntris) - ntris, ntris)
+            tets = np.column_stack([
+                face_points[first], face_points[first + j + 1],
+                face_points[first + j],
+                len(self.points) + np.searchsorted(polyhedra,
+                                                   owners[tri_faces])])
+            ecells.append(owners[tri_faces])
+            enodes.append(tets.ravel())
+            esizes.append(np.full(len(tets), 4, dtype=int))
+            etypes.append(np.full(len(tets), VTK_TETRA, dtype=int))
+
+        elem_sizes = np.concatenate(esizes)
+        elem_offsets = np.zeros(len(elem_sizes) + 1, dtype=int)
+        elem_offsets[1:] = np.cumsum(elem_sizes)
+
+        return {"elem_cells": np.concatenate(ecells),
+                "elem_types": np.concatenate(etypes).astype(np.uint8),
+                "elem_offsets": elem_offsets,
+                "elem_nodes": np.concatenate(enodes).astype(int),
+                "poly_cells": polyhedra,
+                "centroids": centroids}
+
+    def _build(self):
+        arrays = self._elements()
+        coords = np.vstack([self.points, arrays["centroids"]])
+        offsets = arrays["elem_offsets"]
+        nodes = arrays["elem_nodes"]
+        nelems = len(offsets) - 1
+
+        if nelems == 0:
+            lo = hi = np.zeros((0, 3))
+            origin, size, dims = np.zeros(3), np.ones(3), np.ones(3, dtype=int)
+        else:
+            starts = offsets[:-1]
+            lo = np.minimum.reduceat(coords[nodes], starts)
+            hi = np.maximum.reduceat(coords[nodes], starts)
+            origin = lo.min(axis=0)
+            extent = hi.max(axis=0) - origin
+
+            # Bins of roughly cubic shape, with about _CELLS_PER_BIN
+            # elements in each
+            nonzero = extent > 0
+            volume = np.prod(extent[nonzero]) if nonzero.any() else 1.0
+            nbins = max(nelems / _CELLS_PER_BIN, 1.0)
+            binsize = (volume / nbins) ** (1.0 / max(nonzero.sum(), 1))
+            dims = np.where(nonzero, np.maximum(np.round(extent / binsize), 1),
+                            1).astype(int)
+            size = np.where(nonzero, extent / dims, 1.0)
+
+        # Bins overlapped by the elements (their bounding boxes). Points on
+        # the bin boundaries are in some element of the bin anyway, so the
+        # tolerance is used only in the test of the bounding boxes.
+        tol = 1e-9 * size
+        ilo = np.clip(np.floor((lo - origin) / size), 0, dims - 1)
+        ihi = np.clip(np.floor((hi - origin) / size), 0, dims - 1)
+        ilo, ihi = ilo.astype(int), ihi.astype(int)
+        counts3 = ihi - ilo + 1
+        counts = np.prod(counts3, axis=1)
+
+        q = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                 counts)
+        elem = np.repeat(np.arange(nelems), counts)
+        cx, cy = counts3[elem, 0], counts3[elem, 1]
+        i = ilo[elem, 0] + q % cx
+        j = ilo[elem, 1] + (q // cx) % cy
+        k = ilo[elem, 2] + q // (cx * cy)
+        bins = i + dims[0] * (j + dims[1] * k)
+
+        order = np.argsort(bins, kind="mergesort")
+        bin_offsets = np.zeros(np.prod(dims) + 1, dtype=int)
+        bin_offsets[1:] = np.cumsum(np.bincount(bins, minlength=np.prod(dims)))
+
+        arrays.update({"elem_lo": lo - tol, "elem_hi": hi + tol,
+                       "origin": origin, "binsize": size, "dims": dims,
+                       "bin_offsets": bin_offsets,
+                       "bin_elems": elem[order]})
+        return arrays
+
+    # Persistence
+
+    _ARRAYS = ["elem_cells", "elem_types", "elem_offsets", "elem_nodes",
+               "poly_cells", "centroids", "elem_lo", "elem_hi", "origin",
+               "binsize", "dims", "bin_offsets", "bin_elems"]
+
+    def save(self, path, signature):
+        """Save the locator to a file.
+
+        Args:
+            path (str): Name of the file (.npz).
+            signature (numpy.ndarray): Identification of the mesh files,
+                see :func:`signature`.
+        """
+
+        arrays = dict((name, getattr(self, name)) for name in self._ARRAYS)
+        tmppath = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmppath, "wb") as f:
+            np.savez(f, version=_INDEX_VERSION, signature=signature, **arrays)
+        os.rename(tmppath, path)
+
+    @classmethod
+    def load(cls, path, mesh, signature):
+        """Load the locator saved by :py:meth:`CellLocator.save`.
+
+        Returns:
+            CellLocator: The locator, or None if the file does not exist or
+                does not match the signature.
+        """
+
+        try:
+            with np.load(path) as data:
+                if (int(data["version"]) != _INDEX_VERSION
+                        or not np.array_equal(data["signature"], signature)):
+                    return None
+                arrays = dict((name, data[name]) for name in cls._ARRAYS)
+        except (IOError, KeyError, ValueError):
+            return None
+        return cls(mesh, arrays)
+
+    # Queries
+
+    def find(self, points):
+        """Find the cells containing the points and the interpolation weights.
+
+        Args:
+            points (numpy.ndarray): (N, 3) array of the points.
+
+        Returns:
+            tuple: (cells, ids, weights). cells is the array of the cell
+                indices, -1 for points outside of the mesh. ids and weights
+                are (N, M) arrays of the point indices and their weights,
+                padded by zero weights.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        results = [self._find_chunk(points[i:i + _CHUNK_SIZE])
+                   for i in range(0, len(points), _CHUNK_SIZE)]
+        if not results:
+            return (np.zeros(0, dtype=int), np.zeros((0, 1), dtype=int),
+                    np.zeros((0, 1)))
+
+        width = max(r[1].shape[1] for r in results)
+        pad = lambda a: np.pad(a, ((0, 0), (0, width - a.shape[1])),
+                               "constant")
+        return (np.concatenate([r[0] for r in results]),
+                np.concatenate([pad(r[1]) for r in results]),
+                np.concatenate([pad(r[2]) for r in results]))
+
+    def _find_chunk(self, points):
+        npoints = len(points)
+        coords = np.vstack([self.points, self.centroids])
+
+        # Candidate elements from the bins of the points. Points on the
+        # boundary of the grid belong to the outermost bins.
+        rel = (points - self.origin) / self.binsize
+        inside_grid = np.all((rel >= -1e-9) & (rel <= self.dims + 1e-9),
+                             axis=1)
+        idx = np.clip(np.floor(rel), 0, self.dims - 1).astype(int)
+        pts = np.nonzero(inside_grid)[0]
+        bins = (idx[pts, 0]
+                + self.dims[0] * (idx[pts, 1] + self.dims[1] * idx[pts, 2]))
+        counts = self.bin_offsets[bins + 1] - self.bin_offsets[bins]
+        pair_points = np.repeat(pts, counts)
+        pair_elems = self.bin_elems[expand_ranges(self.bin_offsets[bins],
+                                                  counts)]
+
+        # Cheap test of the bounding boxes first
+        pair_coords = points[pair_points]
+        in_box = np.all((pair_coords >= self.elem_lo[pair_elems])
+                        & (pair_coords <= self.elem_hi[pair_elems]), axis=1)
+        pair_points, pair_elems = pair_points[in_box], pair_elems[in_box]
+
+        # Test the candidates, by the element types
+        found = np.zeros(len(pair_points), dtype=bool)
+        pair_weights = {}
+        for etype, (nnodes, _, _, _) in _ELEMENTS.iteritems():
+            sel = np.nonzero(self.elem_types[pair_elems] == etype)[0]
+            if len(sel) == 0:
+                continue
+            nodes = self.elem_nodes[self.elem_offsets[pair_elems[sel]]
+                                    [:, np.newaxis] + np.arange(nnodes)]
+            weights, inside = _parametric_coords(
+                etype, coords[nodes], points[pair_points[sel]])
+            found[sel] = inside
+            pair_weights[etype] = (sel, nodes, weights)
+
+        # First element containing the point
+        hits = np.nonzero(found)[0]
+        hit_points, first = np.unique(pair_points[hits], return_index=True)
+        hits = hits[first]
+
+        cells = np.full(npoints, -1, dtype=int)
+        cells[hit_points] = self.elem_cells[pair_elems[hits]]
+        ids = np.zeros((npoints, 8), dtype=int)
+        weights = np.zeros((npoints, 8))
+        for etype, (sel, nodes, w) in pair_weights.iteritems():
+            pos = np.searchsorted(sel, hits)
+            mask = (pos < len(sel)) & (sel[np.minimum(pos, len(sel) - 1)]
+                                       == hits)
+            nnodes = nodes.shape[1]
+            ids[hit_points[mask], :nnodes] = nodes[pos[mask]]
+            weights[hit_points[mask], :nnodes] = w[pos[mask]]
+
+        return self._expand_centroids(cells, ids, weights)
+
+    def _expand_centroids(self, cells, ids, weights):
+        """Distribute the weights of the polyhedron centroids to the points."""
+
+        # Each row has at most one centroid, its weight is shared equally
+        # by the points of the polyhedron, appended after the columns
+        npoints = len(self.points)
+        rows, cols = np.nonzero((ids >= npoints) & (weights != 0))
+        if len(rows) == 0:
+            ids[ids >= npoints] = 0
+            return cells, ids, weights
+
+        offsets = np.asarray(self.mesh.offsets)
+        connectivity = np.asarray(self.mesh.connectivity)
+        counts = np.diff(offsets)[cells[rows]]
+        width = ids.shape[1]
+        new_ids = np.zeros((len(ids), width + counts.max()), dtype=int)
+        new_weights = np.zeros((len(ids), width + counts.max()))
+        new_ids[:, :width] = ids
+        new_weights[:, :width] = weights
+
+        shares = weights[rows, cols] / counts
+        new_ids[rows, cols] = 0
+        new_weights[rows, cols] = 0.0
+        columns = width + np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        expanded = np.repeat(rows, counts)
+        new_ids[expanded, columns] = connectivity[expand_ranges(
+            offsets[cells[rows]], counts)]
+        new_weights[expanded, columns] = np.repeat(shares, counts)
+
+        new_ids[new_ids >= npoints] = 0
+        return cells, new_ids, new_weights
+
+    def sample(self, points, mesh=None):
+        """Sample the point data of the mesh at the given points.
+
+        Args:
+            points (array_like): (N, 3) array of the point coordinates.
+            mesh (pvtools.mesh.Mesh): Mesh of the same geometry with the data
+                to be sampled, such as the same mesh at another time.
+                The mesh of the locator by default.
+
+        Returns:
+            PointSamples: The sampled data. The data arrays are interpolated
+                only when accessed.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        cells, ids, weights = self.find(points)
+        return PointSamples(mesh if mesh is not None else self.mesh, points,
+                            cells, ids, weights)
+
+
+class PointSamples(object):
+    """Point data of the mesh sampled at a set of points.
+
+    The attribute names follow the VTK dataset adapter, so that the samples
+    can be handled in the same way as the data fetched from Paraview.
+
+    Attributes:
+        Points (numpy.ndarray): Coordinates of the points.
+        PointData (Mapping): Interpolated arrays, including the
+            'vtkValidPointMask', which is 1 for points inside the mesh.
+        CellData (Mapping): Cell arrays at the cells containing the points,
+            undefined for points outside.
+        cells (numpy.ndarray): Indices of the cells containing the points,
+            -1 for points outside.
+    """
+
+    def __init__(self, mesh, points, cells, ids, weights):
+        self.Points = points
+        self.cells = cells
+        self._mesh = mesh
+        self._ids = ids
+        self._weights = weights
+
+        loaders = dict((name, self._loader(name))
+                       for name in mesh.point_data.keys())
+        loaders["vtkValidPointMask"] = lambda: (cells >= 0).astype(np.int8)
+        self.PointData = LazyDict(loaders)
+        self.CellData = LazyDict(dict((name, self._cell_loader(name))
+                                      for name in mesh.cell_data.keys()))
+
+    def _loader(self, name):
+        return lambda: self.interpolate(self._mesh.point_data[name])
+
+    def _cell_loader(self, name):
+        return lambda: np.asarray(self._mesh.cell_data[name])[
+            np.maximum(self.cells, 0)]
+
+    def interpolate(self, values):
+        """Interpolate the array of values at the mesh points."""
+        values = np.asarray(values)
+        picked = values[self._ids]
+        if values.ndim == 2:
+            return np.einsum("ij,ijk->ik", self._weights, picked)
+        return np.sum(self._weights * picked, axis=1)
+
+
+class DecomposedLocator(object):
+    """Locator of the cells of a mesh composed of subdomains.
+
+    Args:
+        mesh (pvtools.foam.DecomposedMesh): The mesh, with the meshes of
+            the subdomains in 'parts'.
+        sidecar (str): Name of the file the locators are stored in, see
+            :func:`build`. The locator of each subdomain is stored in a file
+            of its own, with the subdomain number inserted before the
+            extension.
+    """
+
+    def __init__(self, mesh, sidecar=None):
+        self.mesh = mesh
+        self._sidecar = sidecar
+        self._locators = [None] * len(mesh.parts)
+        self._bounds = np.array(mesh.case.map(
+            lambda part: part.bounds(), mesh.parts), dtype=float)
+
+    def _part_sidecar(self, part):
+        if self._sidecar is None:
+            return None
+        root, extension = os.path.splitext(self._sidecar)
+        return "%s.%d%s" % (root, part, extension)
+
+    def _locator(self, part):
+        if self._locators[part] is None:
+            self._locators[part] = build(self.mesh.parts[part],
+                                         self._part_sidecar(part))
+        return self._locators[part]
+
+    def find(self, points):
+        """Find the cells of the points, see :py:meth:`CellLocator.find`.
+
+        Each point is searched for in the subdomains whose bounds contain it,
+        until it is found, so the points on the subdomain boundaries belong to
+        the first subdomain.
+
+        Returns:
+            tuple: (cells, ids, weights, parts), the cells and the point ids
+                being global, parts being the subdomains of the points,
+                -1 for points outside of the mesh.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        tol = 1e-9 * np.maximum(self._bounds[:, 3:] - self._bounds[:, :3], 1)
+        candidates = np.all(
+            (points[:, np.newaxis] >= (self._bounds[:, :3] - tol))
+            & (points[:, np.newaxis] <= (self._bounds[:, 3:] + tol)), axis=2)
+
+        # Locators of all the candidate subdomains are built concurrently
+        used = np.nonzero(candidates.any(axis=0))[0]
+        self.mesh.case.map(self._locator, used)
+
+        cells = np.full(len(points), -1, dtype=int)
+        parts = np.full(len(points), -1, dtype=int)
+        found = []
+        for part in used:
+            rows = np.nonzero(candidates[:, part] & (cells < 0))[0]
+            if not len(rows):
+                continue
+            part_cells, ids, weights = self._locator(part).find(points[rows])
+            hit = part_cells >= 0
+            rows = rows[hit]
+            cells[rows] = part_cells[hit] + self.mesh.cell_offsets[part]
+            parts[rows] = part
+            found.append((rows, ids[hit] + self.mesh.point_offsets[part],
+                          weights[hit]))
+
+        width = max([f[1].shape[1] for f in found] or [1])
+        ids = np.zeros((len(points), width), dtype=int)
+        weights = np.zeros((len(points), width))
+        for rows, part_ids, part_weights in found:
+            ids[rows, :part_ids.shape[1]] = part_ids
+            weights[rows, :part_weights.shape[1]] = part_weights
+        return cells, ids, weights, parts
+
+    def sample(self, points, mesh=None):
+        """Sample the point data, see :py:meth:`CellLocator.sample`.
+
+        Only the data of the subdomains containing some of the points are
+        read.
+
+        Returns:
+            DecomposedSamples: The sampled data.
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        cells, ids, weights, parts = self.find(points)
+        return DecomposedSamples(mesh if mesh is not None else self.mesh,
+                                 points, cells, ids, weights, parts)
+
+
+class DecomposedSamples(PointSamples):
+    """Point data of a mesh composed of subdomains sampled at the points.
+
+    Unlike :class:`PointSamples`, the data arrays are interpolated from the
+    subdomains containing the points, without reading the others.
+    """
+
+    def __init__(self, mesh, points, cells, ids, weights, parts):
+        self._parts = parts
+        PointSamples.__init__(self, mesh, points, cells, ids, weights)
+
+    def _loader(self, name):
+        def load():
+            parts = self._mesh.parts
+            shape = np.shape(parts[0].point_data[name])[1:]
+            result = np.zeros((len(self._parts),) + shape)
+            for part in np.unique(self._parts[self._parts >= 0]):
+                rows = self._parts == part
+                values = np.asarray(parts[part].point_data[name])
+                # The padding ids are out of the subdomain, with zero weights
+                ids = np.maximum(
+                    self._ids[rows] - self._mesh.point_offsets[part], 0)
+                if values.ndim == 2:
+                    result[rows] = np.einsum("ij,ijk->ik",
+                                             self._weights[rows], values[ids])
+                else:
+                    result[rows] = np.sum(self._weights[rows] * values[ids],
+                                          axis=1)
+            return result
+
+        return load
+
+    def _cell_loader(self, name):
+        def load():
+            parts = self._mesh.parts
+            first = np.asarray(parts[0].cell_data[name])
+            result = np.zeros((len(self._parts),) + first.shape[1:],
+                              dtype=first.dtype)
+            for part in np.unique(self._parts[self._parts >= 0]):
+                rows = self._parts == part
+                result[rows] = np.asarray(parts[part].cell_data[name])[
+                    self.cells[rows] - self._mesh.cell_offsets[part]]
+            return result
+
+        return load
+
+
+def signature(paths):
+    """Return identification of the files, changing when any of them changes.
+
+    Returns:
+        numpy.ndarray: Sizes and modification times of the files.
+    """
+    stats = [os.stat(path) for path in paths]
+    return np.array([[st.st_size, st.st_mtime] for st in stats], dtype=float)
+
+
+def build(mesh, sidecar=None):
+    """Return the cell locator of the mesh, possibly stored in a file.
+
+    Args:
+        mesh (pvtools.mesh.Mesh): The mesh.
+        sidecar (str): Name of the file where the locator is stored. If it
+            exists and matches the mesh source files, the locator is loaded
+            from it, otherwise the locator is built and saved to it.
+            If None, the locator is always built.
+
+    Returns:
+        CellLocator: The locator, DecomposedLocator for the meshes composed of
+            subdomains.
+    """
+
+    if getattr(mesh, "parts", None) is not None:
+        return DecomposedLocator(mesh, sidecar)
+    if sidecar is None:
+        return CellLocator(mesh)
+
+    sig = signature(mesh.source_files)
+    locator = CellLocator.load(sidecar, mesh, sig)
+    if locator is None:
+        locator = CellLocator(mesh)
+        try:
+            locator.save(sidecar, sig)
+        except (IOError, OSError):
+            # Not writable location, the index is just not cached
+            pass
+    return locator
@@ -0,0 +1,492 @@
+#!/usr/bin/env python2
+
+"""
+Implements the mesh containers used by the native (non-Paraview) readers.
+
+The meshes hold the coordinates, cells and data arrays as plain numpy arrays,
+using the same conventions as VTK (cell types, point ordering within cells).
+"""
+
+import collections
+
+import numpy as np
+
+
+# VTK cell types
+VTK_VERTEX = 1
+VTK_LINE = 3
+VTK_TRIANGLE = 5
+VTK_PIXEL = 8
+VTK_QUAD = 9
+VTK_TETRA = 10
+VTK_VOXEL = 11
+VTK_HEXAHEDRON = 12
+VTK_WEDGE = 13
+VTK_PYRAMID = 14
+VTK_POLYHEDRON = 42
+
+# Numbers of points of the cell types of fixed size
+_CELL_SIZES = {
+    VTK_VERTEX: 1, VTK_LINE: 2, VTK_TRIANGLE: 3, VTK_PIXEL: 4, VTK_QUAD: 4,
+    VTK_TETRA: 4, VTK_VOXEL: 8, VTK_HEXAHEDRON: 8, VTK_WEDGE: 6,
+    VTK_PYRAMID: 5,
+}
+
+# Faces of the 3D cells, as indices of the cell points
+_CELL_FACES = {
+    VTK_TETRA: [(0, 1, 3), (1, 2, 3), (2, 0, 3), (0, 2, 1)],
+    VTK_VOXEL: [(0, 2, 6, 4), (1, 5, 7, 3), (0, 4, 5, 1), (2, 3, 7, 6),
+                (0, 1, 3, 2), (4, 6, 7, 5)],
+    VTK_HEXAHEDRON: [(0, 4, 7, 3), (1, 2, 6, 5), (0, 1, 5, 4), (3, 7, 6, 2),
+                     (0, 3, 2, 1), (4, 5, 6, 7)],
+    VTK_WEDGE: [(0, 1, 2), (3, 5, 4), (0, 3, 4, 1), (1, 4, 5, 2),
+                (2, 5, 3, 0)],
+    VTK_PYRAMID: [(0, 3, 2, 1), (0, 1, 4), (1, 2, 4), (2, 3, 4), (3, 0, 4)],
+}
+
+
+def _lazy(value):
+    """Evaluate value if it is a function, return it as is otherwise."""
+    return value() if callable(value) else value
+
+
+class LazyDict(collections.Mapping):
+    """Read-only dict with the values computed when first accessed.
+
+    Args:
+        loaders (dict): Functions without arguments returning the values,
+            indexed by the keys.
+    """
+
+    def __init__(self, loaders):
+        self._loaders = loaders
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._loaders[key]()
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._loaders
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def keys(self):
+        return list(self._loaders)
+
+
+class Mesh(object):
+    """Base class of the meshes.
+
+    Attributes:
+        point_data (dict): Arrays defined at points, indexed by their names.
+        cell_data (dict): Arrays defined at cells, indexed by their names.
+        source_files (List[str]): Files the mesh geometry was read from.
+    """
+
+    def __init__(self, point_data=None, cell_data=None):
+        self.point_data = point_data if point_data is not None else {}
+        self.cell_data = cell_data if cell_data is not None else {}
+        self.source_files = []
+
+    @property
+    def points(self):
+        """numpy.ndarray: (N, 3) array of point coordinates."""
+        raise NotImplementedError()
+
+    @property
+    def cell_types(self):
+        """numpy.ndarray: VTK types of the cells."""
+        raise NotImplementedError()
+
+    @property
+    def offsets(self):
+        """numpy.ndarray: Start of each cell in the connectivity array.
+
+        Its length is the number of cells plus one, the last element being
+        the length of the connectivity array.
+        """
+        raise NotImplementedError()
+
+    @property
+    def connectivity(self):
+        """numpy.ndarray: Point indices of all the cells, one after another."""
+        raise NotImplementedError()
+
+    def polyhedron_faces(self, cell):
+        """Return the faces of a VTK_POLYHEDRON cell.
+
+        Returns:
+            List[numpy.ndarray]: Point indices of the faces, ordered so that
+                the normals point outwards of the cell.
+        """
+        raise NotImplementedError()
+
+    def cell_faces(self, cells=None):
+        """Return the faces of the 3D cells.
+
+        Args:
+            cells (numpy.ndarray): Indices of the cells, all by default.
+                Cells of other dimensions are ignored.
+
+        Returns:
+            tuple: (offsets, connectivity, owners) of the faces, oriented so
+                that the normals point outwards of the cells, owners being the
+                indices of their cells. The faces shared by two cells are
+                included for each of them.
+        """
+
+        cell_types = np.asarray(self.cell_types)
+        offsets = np.asarray(self.offsets)
+        connectivity = np.asarray(self.connectivity)
+        selected = np.zeros(len(cell_types), dtype=bool)
+        selected[slice(None) if cells is None else cells] = True
+
+        faces, sizes, owners = [], [], []
+        for cell_type, local_faces in sorted(_CELL_FACES.items()):
+            group = np.nonzero(selected & (cell_types == cell_type))[0]
+            if not len(group):
+                continue
+            for face in local_faces:
+                faces.append(connectivity[offsets[group][:, np.newaxis]
+                                          + face].ravel())
+                sizes.append(np.full(len(group), len(face), dtype=int))
+                owners.append(group)
+        for cell in np.nonzero(selected & (cell_types == VTK_POLYHEDRON))[0]:
+            for face in self.polyhedron_faces(cell):
+                faces.append(np.asarray(face, dtype=int))
+                sizes.append([len(face)])
+                owners.append([cell])
+
+        sizes = np.concatenate(sizes or [[]]).astype(int)
+        face_offsets = np.zeros(len(sizes) + 1, dtype=int)
+        face_offsets[1:] = np.cumsum(sizes)
+        return (face_offsets, np.concatenate(faces or [[]]).astype(int),
+                np.concatenate(owners or [[]]).astype(int))
+
+    def patch_faces(self, name):
+        """Return the faces of a boundary patch.
+
+        Only the OpenFOAM meshes have patches.
+
+        Returns:
+            tuple: (offsets, connectivity) of the faces, oriented so that the
+                normals point outwards of the domain.
+        """
+        raise ValueError("No patch %s in the mesh" % name)
+
+    def boundary_faces(self, with_owners=False):
+        """Return the faces on the boundary of the 3D cells.
+
+        These are the faces not shared by two cells. Cells of other
+        dimensions are ignored.
+
+        Args:
+            with_owners (bool): Return also the cells of the faces.
+
+        Returns:
+            tuple: (offsets, connectivity) of the faces, see the properties
+                of :class:`Mesh`, followed by the owners if requested.
+        """
+
+        cell_types = np.asarray(self.cell_types)
+        offsets = np.asarray(self.offsets)
+        connectivity = np.asarray(self.connectivity)
+
+        # All the faces and their cells, grouped by their number of points
+        faces = collections.defaultdict(list)
+        cells = collections.defaultdict(list)
+        for cell_type, local_faces in _CELL_FACES.items():
+            group = np.nonzero(cell_types == cell_type)[0]
+            if not len(group):
+                continue
+            for face in local_faces:
+                faces[len(face)].append(
+                    connectivity[offsets[group][:, np.newaxis] + face])
+                cells[len(face)].append(group)
+        for cell in np.nonzero(cell_types == VTK_POLYHEDRON)[0]:
+            for face in self.polyhedron_faces(cell):
+                faces[len(face)].append(np.asarray(face)[np.newaxis])
+                cells[len(face)].append([cell])
+
+        boundary, owners = [], []
+        for size in sorted(faces):
+            group = np.concatenate(faces[size])
+            _, index, counts = np.unique(np.sort(group, axis=1), axis=0,
+                                         return_index=True,
+                                         return_counts=True)
+            index = np.sort(index[counts == 1])
+            boundary.append(group[index])
+            owners.append(np.concatenate(cells[size])[index])
+
+        sizes = np.concatenate([np.full(len(group), group.shape[1], dtype=int)
+                                for group in boundary] or [[]]).astype(int)
+        face_offsets = np.zeros(len(sizes) + 1, dtype=int)
+        face_offsets[1:] = np.cumsum(sizes)
+        face_points = np.concatenate([group.ravel() for group in boundary]
+                                     or [[]]).astype(int)
+        if with_owners:
+            return face_offsets, face_points, np.concatenate(
+                owners or [[]]).astype(int)
+        return face_offsets, face_points
+
+    @property
+    def num_points(self):
+        return len(self.points)
+
+    @property
+    def num_cells(self):
+        return len(self.offsets) - 1
+
+    @property
+    def cell_centers(self):
+        """numpy.ndarray: Approximate cell centers (average of the points)."""
+        offsets = np.asarray(self.offsets)
+        sizes = np.diff(offsets)
+        cells = np.repeat(np.arange(len(sizes)), sizes)
+        points = np.asarray(self.points, dtype=float)[
+            np.asarray(self.connectivity)]
+        return np.column_stack([
+            np.bincount(cells, weights=points[:, i], minlength=len(sizes))
+            for i in range(3)]) / np.maximum(sizes, 1)[:, np.newaxis]
+
+    def bounds(self):
+        """Return the bounds of the mesh.
+
+        Returns:
+            tuple: (minx, miny, minz, maxx, maxy, maxz)
+        """
+        points = self.points
+        return tuple(points.min(axis=0)) + tuple(points.max(axis=0))
+
+    def get_variables(self, loc):
+        """Return list of variables defined on the mesh.
+
+        Args:
+             loc (string): Either 'point' or 'cell'
+        Returns:
+              List[str]: List of the present variables.
+        """
+        if loc == 'point':
+            return self.point_data.keys()
+        elif loc == 'cell':
+            return self.cell_data.keys()
+
+
+class UnstructuredMesh(Mesh):
+    """Mesh with explicitly given points and cells.
+
+    Args:
+        points (numpy.ndarray): (N, 3) array of point coordinates.
+        cells (tuple): Tuple (cell_types, offsets, connectivity), see the
+            properties of :class:`Mesh`. Can be given as a function returning
+            the tuple as well, which is then called when the cells are first
+            needed.
+        point_data (dict): Arrays defined at points.
+        cell_data (dict): Arrays defined at cells.
+    """
+
+    def __init__(self, points, cells, point_data=None, cell_data=None):
+        Mesh.__init__(self, point_data, cell_data)
+        self._points = points
+        self._cells = cells
+
+    def _get_cells(self):
+        if callable(self._cells):
+            self._cells = tuple(self._cells())
+        return self._cells
+
+    @property
+    def points(self):
+        return self._points
+
+    @property
+    def cell_types(self):
+        return self._get_cells()[0]
+
+    @property
+    def offsets(self):
+        return self._get_cells()[1]
+
+    @property
+    def connectivity(self):
+        return self._get_cells()[2]
+
+
+class StructuredMesh(Mesh):
+    """Mesh with the topology of a regular grid.
+
+    Points are ordered with the x index varying fastest. Cells are generated
+    from the dimensions when they are first needed.
+
+    Args:
+        dimensions (tuple): Number of points in x, y and z direction.
+        points (numpy.ndarray): (N, 3) array of point coordinates, or function
+            returning it when the points are first needed.
+        point_data (dict): Arrays defined at points.
+        cell_data (dict): Arrays defined at cells.
+    """
+
+    def __init__(self, dimensions, points, point_data=None, cell_data=None):
+        Mesh.__init__(self, point_data, cell_data)
+        self.dimensions = tuple(int(d) for d in dimensions)
+        self._points = points
+        self._cells = None
+
+    @property
+    def points(self):
+        self._points = _lazy(self._points)
+        return self._points
+
+    @property
+    def num_points(self):
+        return int(np.prod(self.dimensions))
+
+    @property
+    def num_cells(self):
+        return int(np.prod([d - 1 for d in self.dimensions if d > 1]))
+
+    def _get_cells(self):
+        if self._cells is None:
+            self._cells = _structured_cells(self.dimensions)
+        return self._cells
+
+    @property
+    def cell_types(self):
+        return self._get_cells()[0]
+
+    @property
+    def offsets(self):
+        return self._get_cells()[1]
+
+    @property
+    def connectivity(self):
+        return self._get_cells()[2]
+
+
+def expand_ranges(starts, lengths):
+    """Concatenate ranges of given starts and lengths.
+
+    Returns:
+        numpy.ndarray: Concatenation of the ranges
+            start[i], ..., start[i] + lengths[i] - 1.
+    """
+    starts = np.asarray(starts, dtype=int)
+    lengths = np.asarray(lengths, dtype=int)
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+        starts - ends + lengths, lengths)
+
+
+def cell_sizes(cell_types):
+    """Return the numbers of points of the cells of given VTK types.
+
+    Returns:
+        numpy.ndarray: The numbers of points, -1 for the types of variable
+            size, such as polygons and polyhedra.
+    """
+    table = np.full(256, -1, dtype=int)
+    table[list(_CELL_SIZES)] = list(_CELL_SIZES.values())
+    return table[np.asarray(cell_types, dtype=int)]
+
+
+def split_cells(flat, ncells, sizes=None):
+    """Convert the cell list (n, id1, ..., idn, n, ...) to offsets and
+    connectivity arrays.
+
+    This format is used by the legacy VTK files as well as by the OpenFOAM
+    face lists.
+
+    Args:
+        flat (numpy.ndarray): The cell list.
+        ncells (int): Number of the cells.
+        sizes (array_like): Numbers of the cell points known in advance, -1
+            for the unknown ones, see :func:`cell_sizes`. The cells of known
+            sizes are located without a loop.
+    """
+
+    if ncells == 0:
+        return np.zeros(1, dtype=int), np.zeros(0, dtype=int)
+
+    if sizes is None:
+        # All cells of the same size are common, and are treated without
+        # a loop
+        npts = int(flat[0])
+        if len(flat) == ncells * (npts + 1):
+            table = flat.reshape(ncells, npts + 1)
+            if np.all(table[:, 0] == npts):
+                offsets = np.arange(ncells + 1) * npts
+                return offsets, table[:, 1:].ravel().astype(int)
+        sizes = np.full(ncells, -1, dtype=int)
+    sizes = np.array(sizes, dtype=int)
+
+    # Positions of the cell headers, the cells of unknown size are read one
+    # by one, shifting the following cells
+    unknown = np.nonzero(sizes < 0)[0]
+    heads = np.zeros(ncells, dtype=int)
+    heads[1:] = np.cumsum(np.maximum(sizes[:-1], 0) + 1)
+    read = []
+    shift = 0
+    for head in heads[unknown].tolist():
+        npts = int(flat[head + shift])
+        read.append(npts)
+        shift += npts
+    sizes[unknown] = read
+    shifts = np.zeros(ncells, dtype=int)
+    shifts[unknown] = read
+    heads[1:] += np.cumsum(shifts[:-1])
+
+    if (heads[-1] + sizes[-1] >= len(flat)
+            or not np.array_equal(flat[heads], sizes)):
+        raise ValueError("The cell list does not match the cell types")
+
+    offsets = np.zeros(ncells + 1, dtype=int)
+    offsets[1:] = np.cumsum(sizes)
+    # Indices of all the point ids in the flat array
+    return offsets, flat[expand_ranges(heads + 1, sizes)].astype(int)
+
+
+def _structured_cells(dimensions):
+    """Generate the cells of a structured grid of given dimensions.
+
+    Returns:
+        tuple: (cell_types, offsets, connectivity)
+    """
+
+    nx, ny, nz = dimensions
+    axes = [axis for axis in range(3) if dimensions[axis] > 1]
+
+    # Point index of the first corner of each cell, x varying fastest
+    ranges = [np.arange(max(d - 1, 1)) for d in dimensions]
+    k, j, i = np.meshgrid(ranges[2], ranges[1], ranges[0], indexing="ij")
+    base = (i + nx * (j + ny * k)).ravel()
+
+    strides = [1, nx, nx * ny]
+    if len(axes) == 3:
+        cell_type = VTK_HEXAHEDRON
+        corners = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+                   (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]
+    elif len(axes) == 2:
+        cell_type = VTK_QUAD
+        corners = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    elif len(axes) == 1:
+        cell_type = VTK_LINE
+        corners = [(0,), (1,)]
+    else:
+        cell_type = VTK_VERTEX
+        corners = [()]
+
+    shifts = [sum(c * strides[axis] for c, axis in zip(corner, axes))
+              for corner in corners]
+    connectivity = (base[:, np.newaxis] + shifts).ravel()
+
+    ncells = len(base)
+    cell_types = np.full(ncells, cell_type, dtype=np.uint8)
+    offsets = np.arange(ncells + 1) * len(corners)
+
+    return cell_types, offsets, connectivity
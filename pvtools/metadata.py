@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+
+"""
+Implements the lightweight description of the data files.
+
+:func:`inspect` returns the variables, the numbers of points and cells, the
+bounds and the times of a legacy VTK file or an OpenFOAM case without opening
+it by a reader pipeline. Only the headers are read, and the points for the
+bounds (see :func:`pvtools.legacyvtk.read_metadata` and
+:func:`pvtools.foam.read_metadata`):
+
+    info = pvtools.inspect("case.foam")
+    print(info["times"], info["point_variables"], info["bounds"])
+
+The description is stored in a sidecar file next to the data file and
+reused while the data are unchanged, as told by :func:`signature`. Listing
+many files thus reads only the small sidecar files after the first time.
+
+From the command line, `python -m pvtools inspect file...` prints the
+descriptions as JSON.
+"""
+
+import json
+import os
+
+from . import foam, legacyvtk
+
+# Version of the sidecar file format
+_VERSION = 1
+
+# Suffix of the sidecar files, appended to the name of the data file
+SIDECAR_SUFFIX = ".meta.json"
+
+
+def _is_sidecar(name):
+    """Return True for the sidecar files written by pvtools."""
+    return name.endswith(".npz") or name.endswith(SIDECAR_SUFFIX)
+
+
+def signature(filename):
+    """Return the state of the files of the data source.
+
+    For OpenFOAM cases, only the directories are checked (the time
+    directories and the mesh, also of each subdomain), so that the check
+    stays cheap, unlike :func:`pvtools.cache.source_files`. Files rewritten in
+    place within a time directory thus go unnoticed. The sidecar files
+    written by pvtools are left out.
+
+    Returns:
+        list: (path, size, mtime) of the files and directories.
+    """
+
+    paths = [filename]
+    if os.path.splitext(filename)[1].lower() in [".foam", ".openfoam"]:
+        casedir = os.path.dirname(os.path.abspath(filename))
+        paths.append(os.path.join(casedir, "constant", "polyMesh"))
+        paths.extend(os.path.join(casedir, name)
+                     for name in sorted(os.listdir(casedir))
+                     if not _is_sidecar(name))
+        # Subdomains of the decomposed cases
+        for procdir in foam.processor_dirs(casedir):
+            paths.append(os.path.join(procdir, "constant", "polyMesh"))
+            paths.extend(os.path.join(procdir, name)
+                         for name in sorted(os.listdir(procdir)))
+
+    state = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        state.append((path, stat.st_size, stat.st_mtime))
+    return state
+
+
+def _read(filename):
+    """Read the description of the data file, see :func:`inspect`."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".vtk":
+        return dict(legacyvtk.read_metadata(filename), times=[])
+    elif extension in [".foam", ".openfoam"]:
+        return foam.read_metadata(filename)
+    raise ValueError("Unsupported format: %s" % extension)
+
+
+def _load(sidecar, state):
+    """Return the description stored in the sidecar, None if not valid."""
+    try:
+        with open(sidecar) as f:
+            data = json.load(f)
+        if (data["version"] != _VERSION
+                or data["signature"] != json.loads(json.dumps(state))):
+            return None
+        metadata = data["metadata"]
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+    # Back to the types returned by the readers
+    for key in ["point_variables", "cell_variables"]:
+        metadata[key] = [str(name) for name in metadata[key]]
+    if metadata["bounds"] is not None:
+        metadata["bounds"] = tuple(metadata["bounds"])
+    return dict((str(key), value) for key, value in metadata.iteritems())
+
+
+def _save(sidecar, state, metadata):
+    tmppath = "%s.%d.tmp" % (sidecar, os.getpid())
+    try:
+        with open(tmppath, "w") as f:
+            json.dump({"version": _VERSION, "signature": state,
+                       "metadata": metadata}, f)
+        os.rename(tmppath, sidecar)
+    except (IOError, OSError):
+        # Not writable location, the description is just not cached
+        pass
+
+
+def inspect(filename, cache=True):
+    """Return the description of the data file.
+
+    Args:
+        filename (str): Name of the legacy VTK file or of the OpenFOAM case
+            file (.foam or .openfoam).
+        cache (bool): If True, the description is loaded from the sidecar
+            file (the file name with '.meta.json' appended) if it matches
+            the data files, and stored there otherwise.
+
+    Returns:
+        dict: Names of the variables 'point_variables' and 'cell_variables',
+            the counts 'num_points' and 'num_cells', the 'bounds' (minx, miny,
+            minz, maxx, maxy, maxz), None for data without points, and the
+            sorted 'times', empty for data without time.
+    """
+
+    if not os.path.isfile(filename):
+        raise ValueError("File %s does not exist" % filename)
+    filename = os.path.abspath(filename)
+    sidecar = filename + SIDECAR_SUFFIX
+
+    state = signature(filename)
+    if cache:
+        metadata = _load(sidecar, state)
+        if metadata is not None:
+            return metadata
+    metadata = _read(filename)
+    if cache:
+        _save(sidecar, state, metadata)
+    return metadata
@@ -0,0 +1,217 @@
+#!/usr/bin/env python2
+
+"""
+Implements the opt-in instrumentation of the queries.
+
+The queries are divided into stages (pipeline update, fetch, wrapping,
+extraction of the arrays, ...), which record their wall time, the number of
+calls and the number of bytes fetched to a :class:`Stats` object. Recording
+is enabled by :func:`profile`, or by the stats given to
+:class:`pvtools.DataSource` or :func:`pvtools.to_dict`:
+
+    with pvtools.profile() as stats:
+        pvtools.to_dict("probe", ...)
+    print(stats)
+    stats.write_trace("trace.json")
+
+When nothing is recorded, :func:`stage` returns a shared object doing
+nothing, so the instrumented code pays a single function call per stage.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stacks of the stats being recorded to, of each thread, the last one of a
+# stack is current
+_local = threading.local()
+
+# Stats may be recorded to from several threads
+_record_lock = threading.Lock()
+
+
+def _active():
+    """Return the stack of the stats of the current thread."""
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+class Stats(object):
+    """Statistics of the stages of the queries.
+
+    Attributes:
+        totals (collections.OrderedDict): Totals of each stage, indexed by
+            its name, in the order of the first call. Each total is a dict
+            with the number of calls 'count', the wall time 'time' (seconds,
+            including the nested stages) and the number of bytes 'bytes'.
+        events (List[dict]): Trace of all the stage calls, as Chrome trace
+            events.
+    """
+
+    def __init__(self):
+        self.totals = collections.OrderedDict()
+        self.events = []
+
+    def record(self, name, start, duration, nbytes=0, args=None):
+        """Record a call of the stage.
+
+        Args:
+            name (str): Name of the stage.
+            start (float): Start time (seconds since the epoch).
+            duration (float): Wall time of the call in seconds.
+            nbytes (int): Number of bytes transferred by the call.
+            args (dict): Description of the call, stored in the trace.
+        """
+
+        event = {"name": name, "cat": "pvtools", "ph": "X",
+                 "ts": start * 1e6, "dur": duration * 1e6,
+                 "pid": os.getpid(), "tid": threading.current_thread().ident}
+        if args or nbytes:
+            event["args"] = dict(args or {})
+            if nbytes:
+                event["args"]["bytes"] = nbytes
+
+        with _record_lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = {"count": 0, "time": 0.0,
+                                             "bytes": 0}
+            total["count"] += 1
+            total["time"] += duration
+            total["bytes"] += nbytes
+            self.events.append(event)
+
+    def merge(self, other):
+        """Add the records of other stats, e.g. of a worker process."""
+        with _record_lock:
+            for name, total in other.totals.iteritems():
+                mine = self.totals.setdefault(
+                    name, {"count": 0, "time": 0.0, "bytes": 0})
+                for field in mine:
+                    mine[field] += total[field]
+            self.events.extend(other.events)
+
+    def clear(self):
+        self.totals.clear()
+        del self.events[:]
+
+    def summary(self):
+        """Return the table of the totals, the slowest stages first."""
+        lines = ["%-16s %8s %12s %12s" % ("stage", "calls", "time [s]",
+                                          "bytes")]
+        for name, total in sorted(self.totals.iteritems(),
+                                  key=lambda item: -item[1]["time"]):
+            lines.append("%-16s %8d %12.6f %12d" % (
+                name, total["count"], total["time"], total["bytes"]))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.summary()
+
+    def write_trace(self, filename):
+        """Write the trace in the Chrome trace format.
+
+        The file can be viewed in chrome://tracing or Perfetto.
+        """
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.events,
+                       "displayTimeUnit": "ms"}, f, default=str)
+
+
+class _Stage(object):
+    """Context manager timing a stage, see :func:`stage`."""
+
+    enabled = True
+
+    def __init__(self, stats, name, args):
+        self.stats = stats
+        self.name = name
+        self.args = args
+        self.nbytes = 0
+
+    def __enter__(self):
+        # The nested stages are recorded to the same stats
+        _active().append(self.stats)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.time() - self.start
+        _active().pop()
+        self.stats.record(self.name, self.start, duration, self.nbytes,
+                          self.args)
+
+
+class _NullStage(object):
+    """Context manager doing nothing, used when nothing is recorded."""
+
+    enabled = False
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, stats=None, **args):
+    """Return context manager timing a stage of a query.
+
+    Args:
+        name (str): Name of the stage.
+        stats (Stats): Stats to record to. By default, the current stats of
+            the enclosing :func:`profile` or stage of the same thread, if
+            any.
+        **args: Description of the call, stored in the trace.
+
+    The number of bytes can be set to the 'nbytes' attribute of the returned
+    object. Its attribute 'enabled' tells whether anything is recorded.
+    """
+
+    if stats is None:
+        active = _active()
+        if not active:
+            return _NULL_STAGE
+        stats = active[-1]
+    return _Stage(stats, name, args)
+
+
+def recording():
+    """Return the stats the current thread records to, or None."""
+    active = _active()
+    return active[-1] if active else None
+
+
+@contextmanager
+def profile(stats=None):
+    """Record the stages of all the queries run in the context.
+
+    Only the stages of the calling thread are recorded, other threads record
+    to the stats only when given them explicitly.
+
+    Args:
+        stats (Stats): Stats to record to, new by default.
+
+    Yields:
+        Stats: The stats.
+    """
+
+    stats = Stats() if stats is None else stats
+    _active().append(stats)
+    try:
+        yield stats
+    finally:
+        _active().pop()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python2
+
+"""
+Implements the reductions of the point data over regions of the mesh.
+
+A region (a line, a plane, a box or a boundary patch) is represented by its
+vertices, whose values are interpolated from the mesh points, and by the
+weights of the vertex values in the integral. The geometry is thus processed
+once, and the integrals of all the variables and times are dot products.
+
+The cells are decomposed into tetrahedra, each spanned by an edge of a cell
+face, the face centre and the cell centre, and the faces into triangles
+spanned by an edge and the face centre. The values at the centres are the
+averages of the points, so the integrals are exact for linear fields.
+"""
+
+import numpy as np
+
+from .mesh import LazyDict
+
+# Triangles of the plane slice of a tetrahedron by the sign pattern of its
+# vertices (bit i set for the vertex i on the positive side), each given by
+# the tetrahedron edges its corners lie on
+_SLICE_TRIANGLES = {}
+for _code in range(1, 15):
+    _pos = [i for i in range(4) if _code >> i & 1]
+    _neg = [i for i in range(4) if not _code >> i & 1]
+    if len(_pos) == 2:
+        (_i, _j), (_k, _l) = _pos, _neg
+        _quad = [(_i, _k), (_i, _l), (_j, _l), (_j, _k)]
+        _SLICE_TRIANGLES[_code] = [_quad[:3], [_quad[0], _quad[2], _quad[3]]]
+    else:
+        _lone, _rest = (_pos, _neg) if len(_pos) == 1 else (_neg, _pos)
+        _SLICE_TRIANGLES[_code] = [[(_lone[0], _other) for _other in _rest]]
+
+
+def _group_mean(values, groups, ngroups):
+    """Return the averages of the values (rows) of each group."""
+    counts = np.bincount(groups, minlength=ngroups).astype(float)
+    counts[counts == 0] = 1
+    if values.ndim == 2:
+        return np.column_stack([
+            np.bincount(groups, weights=values[:, i], minlength=ngroups)
+            for i in range(values.shape[1])]) / counts[:, np.newaxis]
+    return np.bincount(groups, weights=values, minlength=ngroups) / counts
+
+
+def _interpolate(values, ids, weights):
+    """Return the weighted sums of the values, see the samples classes."""
+    picked = values[ids]
+    if values.ndim == 2:
+        return np.einsum("ij,ijk->ik", weights, picked)
+    return np.sum(weights * picked, axis=1)
+
+
+class _Decomposition(object):
+    """Decomposition of the faces into triangles and of the cells into
+    tetrahedra.
+
+    The vertices are the points of the faces, followed by the face centres
+    and the cell centres.
+
+    Args:
+        offsets (numpy.ndarray): Start of each face in the connectivity,
+            followed by its total length.
+        connectivity (numpy.ndarray): Point indices of all the faces.
+        owners (numpy.ndarray): Cells of the faces, if the cells are to be
+            decomposed.
+
+    Attributes:
+        triangles (numpy.ndarray): (N, 3) vertices of the triangles (the face
+            centre and an edge), oriented as the faces.
+        tetrahedra (numpy.ndarray): (N, 4) vertices of the tetrahedra, the
+            cell centre followed by a triangle.
+    """
+
+    def __init__(self, offsets, connectivity, owners=None):
+        sizes = np.diff(offsets)
+        self._used, local = np.unique(connectivity, return_inverse=True)
+        self._faces = np.repeat(np.arange(len(sizes)), sizes)
+        self._nfaces = len(sizes)
+        self._local = local
+
+        following = np.arange(len(connectivity)) + 1
+        nonempty = sizes > 0
+        following[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+        self.triangles = np.column_stack([len(self._used) + self._faces,
+                                          local, local[following]])
+
+        self.tetrahedra = None
+        if owners is not None:
+            _, self._owners = np.unique(owners, return_inverse=True)
+            self._ncells = self._owners.max() + 1 if len(owners) else 0
+            centres = len(self._used) + self._nfaces + self._owners
+            self.tetrahedra = np.column_stack([centres[self._faces],
+                                               self.triangles])
+
+    def extend(self, values):
+        """Return the values at the vertices from those at the mesh points."""
+        values = np.asarray(values)[self._used]
+        faces = _group_mean(values[self._local], self._faces, self._nfaces)
+        if self.tetrahedra is None:
+            return np.concatenate([values, faces])
+        return np.concatenate([values, faces, _group_mean(
+            faces, self._owners, self._ncells)])
+
+
+class Region(object):
+    """Region of the mesh with the integration weights of its vertices.
+
+    Args:
+        extend (callable): Function returning the values at the vertices,
+            given the values at the mesh points.
+        weights (numpy.ndarray): Weights of the vertex values in the
+            integral.
+        measure (float): Length, area or volume of the region.
+        area_vectors (numpy.ndarray): (N, 3) weights of the vertex vectors
+            in the flux through the region. None if the flux is not defined.
+        valid (numpy.ndarray): Mask of the vertices inside the mesh, all by
+            default.
+    """
+
+    def __init__(self, extend, weights, measure, area_vectors=None,
+                 valid=None):
+        self.extend = extend
+        self.weights = weights
+        self.measure = measure
+        self.area_vectors = area_vectors
+        self.valid = valid
+
+    def sample(self, mesh):
+        """Interpolate the point data of the mesh at the vertices.
+
+        Returns:
+            RegionSamples: The interpolated data.
+        """
+        return RegionSamples(self, mesh)
+
+    def integrate(self, values):
+        """Return the integral of the vertex values."""
+        return float(np.nansum(self.weights * values))
+
+    def average(self, values):
+        """Return the average of the vertex values, None if empty."""
+        if not self.measure:
+            return None
+        return self.integrate(values) / self.measure
+
+    def minmax(self, values):
+        """Return the minimum and maximum of the vertex values.
+
+        Returns:
+            tuple: (min, max), None if there are no valid values.
+        """
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None
+        return float(values.min()), float(values.max())
+
+    def flux(self, vectors):
+        """Return the flux of the (N, 3) vertex vectors through the region."""
+        if self.area_vectors is None:
+            raise ValueError("Flux is defined only through planes and "
+                             "patches")
+        return float(np.nansum(self.area_vectors * vectors))
+
+
+class RegionSamples(object):
+    """Point data interpolated at the vertices of the region.
+
+    The attribute names follow the VTK dataset adapter, see
+    :class:`pvtools.locator.PointSamples`.
+    """
+
+    def __init__(self, region, mesh):
+        self.Points = region.extend(mesh.points)
+        self._region = region
+        self._point_data = mesh.point_data
+
+        loaders = dict((name, self._loader(name))
+                       for name in mesh.point_data.keys())
+        if region.valid is not None:
+            loaders["vtkValidPointMask"] = (
+                lambda: region.valid.astype(np.int8))
+        self.PointData = LazyDict(loaders)
+
+    def _loader(self, name):
+        return lambda: self._region.extend(self._point_data[name])
+
+
+def line(samples):
+    """Return the region of a line.
+
+    Args:
+        samples (pvtools.locator.PointSamples): Samples of the mesh at the
+            points along the line. The data are integrated by the trapezoidal
+            rule over the segments with both ends inside the mesh.
+    """
+
+    valid = samples.cells >= 0
+    lengths = np.sqrt(np.sum(np.diff(samples.Points, axis=0)**2, axis=1))
+    lengths[~(valid[:-1] & valid[1:])] = 0
+    weights = np.zeros(len(valid))
+    weights[:-1] += lengths / 2
+    weights[1:] += lengths / 2
+    return Region(samples.interpolate, weights, lengths.sum(), valid=valid)
+
+
+def _tetrahedra(mesh, cells):
+    """Return the decomposition of the cells and its vertex coordinates."""
+    decomposition = _Decomposition(*mesh.cell_faces(cells))
+    return decomposition, decomposition.extend(mesh.points)
+
+
+def box(mesh, bounding_box):
+    """Return the region of the cells lying wholly in the box.
+
+    Args:
+        mesh (pvtools.mesh.Mesh): The mesh.
+        bounding_box (tuple): (minx, miny, minz, maxx, maxy, maxz), None for
+            the missing bounds.
+    """
+
+    lower = np.array([-np.inf if b is None else b
+                      for b in bounding_box[:3]], dtype=float)
+    upper = np.array([np.inf if b is None else b
+                      for b in bounding_box[3:]], dtype=float)
+    points = np.asarray(mesh.points, dtype=float)
+    inside = np.all((points >= lower) & (points <= upper), axis=1)
+    offsets = np.asarray(mesh.offsets)
+    sizes = np.diff(offsets)
+    cells_inside = np.bincount(
+        np.repeat(np.arange(len(sizes)), sizes),
+        weights=inside[np.asarray(mesh.connectivity)],
+        minlength=len(sizes)) == sizes
+
+    decomposition, coords = _tetrahedra(mesh, np.nonzero(cells_inside)[0])
+    tets = coords[decomposition.tetrahedra]
+    volumes = np.abs(np.einsum("ij,ij->i", tets[:, 1] - tets[:, 0], np.cross(
+        tets[:, 2] - tets[:, 0], tets[:, 3] - tets[:, 0]))) / 6
+    weights = np.bincount(decomposition.tetrahedra.ravel(),
+                          weights=np.repeat(volumes / 4, 4),
+                          minlength=len(coords))
+    return Region(decomposition.extend, weights, volumes.sum())
+
+
+def plane(mesh, origin, normal):
+    """Return the region of the intersection of the mesh with a plane.
+
+    The flux through the region is in the direction of the normal.
+    """
+
+    normal = np.asarray(normal, dtype=float)
+    normal = normal / np.sqrt(np.dot(normal, normal))
+    points = np.asarray(mesh.points, dtype=float)
+    offsets = np.asarray(mesh.offsets)
+    distance = np.dot(points - np.asarray(origin, dtype=float), normal)
+
+    # Only the cells crossing the plane are decomposed
+    sizes = np.diff(offsets)
+    cells = np.repeat(np.arange(len(sizes)), sizes)
+    below = np.bincount(cells, weights=distance[np.asarray(
+        mesh.connectivity)] < 0, minlength=len(sizes))
+    crossing = np.nonzero((below > 0) & (below < sizes))[0]
+    decomposition, coords = _tetrahedra(mesh, crossing)
+    tetrahedra = decomposition.tetrahedra
+    distance = np.dot(coords - np.asarray(origin, dtype=float), normal)
+
+    # Slices of the tetrahedra by their sign patterns. The corners of the
+    # triangles lie on the tetrahedron edges, stored by their ends.
+    codes = np.dot(distance[tetrahedra] >= 0, [1, 2, 4, 8])
+    ids, t = [np.zeros((0, 3, 2), dtype=int)], [np.zeros((0, 3))]
+    for code, triangles in sorted(_SLICE_TRIANGLES.items()):
+        tets = tetrahedra[codes == code]
+        for triangle in triangles:
+            ends = tets[:, triangle]
+            ids.append(ends)
+            t.append(distance[ends[:, :, 0]] / (distance[ends[:, :, 0]]
+                                                - distance[ends[:, :, 1]]))
+    ids = np.concatenate(ids).reshape(-1, 2)
+    t = np.concatenate(t).ravel()
+    weights = np.column_stack([1 - t, t])
+
+    corners = _interpolate(coords, ids, weights).reshape(-1, 3, 3)
+    areas = np.sqrt(np.sum(np.cross(corners[:, 1] - corners[:, 0],
+                                    corners[:, 2] - corners[:, 0])**2,
+                           axis=1)) / 2
+    vertex_weights = np.repeat(areas / 3, 3)
+
+    def extend(values):
+        return _interpolate(decomposition.extend(values), ids, weights)
+
+    return Region(extend, vertex_weights, areas.sum(),
+                  area_vectors=vertex_weights[:, np.newaxis] * normal)
+
+
+def patch(mesh, name):
+    """Return the region of a boundary patch.
+
+    The flux through the region is outwards of the domain.
+    """
+
+    decomposition = _Decomposition(*mesh.patch_faces(name))
+    coords = decomposition.extend(mesh.points)
+    triangles = coords[decomposition.triangles]
+    vectors = np.cross(triangles[:, 1] - triangles[:, 0],
+                       triangles[:, 2] - triangles[:, 0]) / 2
+    areas = np.sqrt(np.sum(vectors**2, axis=1))
+
+    vertices = decomposition.triangles.ravel()
+    weights = np.bincount(vertices, weights=np.repeat(areas / 3, 3),
+                          minlength=len(coords))
+    area_vectors = np.column_stack([
+        np.bincount(vertices, weights=np.repeat(vectors[:, i] / 3, 3),
+                    minlength=len(coords))
+        for i in range(3)])
+    return Region(decomposition.extend, weights, areas.sum(), area_vectors)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python2
+
+"""
+Implements the intersection of the domain boundary with a plane.
+
+The boundary surface is sliced by the plane in one vectorized pass over its
+face edges, the crossing points are chained to polylines and clipped by the
+bounding box, again vectorized over all the segments. Every resulting point
+keeps the indices and weights of the surface points it is interpolated from,
+so the slice of a plane is computed once and reused for all the variables,
+bounding boxes and times. The points keep also the surface faces their
+segments lie on, for the cell data.
+"""
+
+import numpy as np
+
+from .mesh import LazyDict
+
+
+class Surface(object):
+    """Polygonal surface, the boundary of a mesh.
+
+    Args:
+        points (numpy.ndarray): (N, 3) array of the point coordinates.
+        offsets (numpy.ndarray): Start of each face in the connectivity,
+            followed by its total length.
+        connectivity (numpy.ndarray): Point indices of all the faces.
+    """
+
+    def __init__(self, points, offsets, connectivity):
+        self.points = np.asarray(points, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.connectivity = np.asarray(connectivity, dtype=int)
+
+    def slice(self, origin, normal):
+        """Intersect the surface with a plane.
+
+        Args:
+            origin (tuple): Point on the plane.
+            normal (tuple): Normal of the plane.
+
+        Returns:
+            Curves: The intersection polylines.
+        """
+
+        distance = np.dot(self.points - np.asarray(origin, dtype=float),
+                          np.asarray(normal, dtype=float))
+        positive = distance >= 0
+
+        # Edges from each face point to the next one
+        conn = self.connectivity
+        sizes = np.diff(self.offsets)
+        nonempty = sizes > 0
+        following = np.arange(len(conn)) + 1
+        following[self.offsets[1:][nonempty] - 1] = self.offsets[:-1][nonempty]
+        first, second = conn, conn[following]
+        crossing = np.nonzero(positive[first] != positive[second])[0]
+
+        # Crossing points, identified by the edge oriented from the positive
+        # side, or by the point itself if it lies on the plane
+        pos = np.where(positive[first[crossing]], first[crossing],
+                       second[crossing])
+        neg = np.where(positive[first[crossing]], second[crossing],
+                       first[crossing])
+        on_plane = distance[pos] == 0
+        keys = pos * len(self.points) + np.where(on_plane, pos, neg)
+        _, index, inverse = np.unique(keys, return_index=True,
+                                         return_inverse=True)
+        pos, neg = pos[index], neg[index]
+        t = distance[pos] / (distance[pos] - distance[neg])
+        ids = np.column_stack([pos, neg])
+        weights = np.column_stack([1 - t, t])
+
+        # Pairs of consecutive crossings of a face form the segments
+        faces = np.repeat(np.arange(len(sizes)), sizes)[crossing]
+        rank = np.arange(len(faces)) - np.searchsorted(faces, faces)
+        starts = np.nonzero(rank % 2 == 0)[0]
+        starts = starts[starts + 1 < len(faces)]
+        starts = starts[faces[starts + 1] == faces[starts]]
+        segments = np.column_stack([inverse[starts], inverse[starts + 1]])
+        segment_faces = faces[starts]
+        distinct = segments[:, 0] != segments[:, 1]
+        segments, segment_faces = segments[distinct], segment_faces[distinct]
+        if len(segments):
+            segments, index = np.unique(np.sort(segments, axis=1), axis=0,
+                                        return_index=True)
+            segment_faces = segment_faces[index]
+
+        coords = np.einsum("ij,ijk->ik", weights, self.points[ids])
+
+        # Points are ordered along the polylines, each with the face of the
+        # segment following it (preceding it at the ends of open polylines)
+        lines = _chain(segments, coords)
+        segment_face = dict(zip(map(tuple, segments.tolist()),
+                                segment_faces.tolist()))
+        point_faces = []
+        for line, closed in lines:
+            pairs = zip(line, line[1:] + line[:1] if closed else line[1:])
+            point_faces.extend(segment_face[min(pair), max(pair)]
+                               for pair in pairs)
+            if not closed:
+                point_faces.append(point_faces[-1])
+        order = np.array([i for line, _ in lines for i in line], dtype=int)
+        bounds = np.cumsum([0] + [len(line) for line, _ in lines])
+        return Curves(coords[order], ids[order], weights[order],
+                      [(np.arange(start, stop), closed)
+                       for (start, stop, closed) in zip(
+                           bounds[:-1], bounds[1:],
+                           [closed for _, closed in lines])],
+                      np.array(point_faces, dtype=int))
+
+
+def _chain(segments, coords):
+    """Join the segments to polylines with a deterministic orientation.
+
+    Open polylines start at their lexicographically smaller end, closed ones
+    at their smallest point and continue towards its larger neighbour.
+    Polylines are sorted by their first points.
+
+    Returns:
+        List[tuple]: (point indices, closed) of the polylines.
+    """
+
+    neighbours = {}
+    for a, b in segments.tolist():
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+
+    used = set()
+
+    def walk(start):
+        line = [start]
+        current = start
+        while True:
+            remaining = [n for n in neighbours[current]
+                         if (min(current, n), max(current, n)) not in used]
+            if not remaining:
+                return line
+            nxt = remaining[0]
+            used.add((min(current, nxt), max(current, nxt)))
+            if nxt == start:
+                return line + [start]
+            line.append(nxt)
+            current = nxt
+
+    # Open polylines start at the points of odd degree
+    order = sorted(neighbours, key=lambda p: tuple(coords[p]))
+    lines = []
+    for start in ([p for p in order if len(neighbours[p]) % 2]
+                  + order):
+        while any((min(start, n), max(start, n)) not in used
+                  for n in neighbours[start]):
+            lines.append(walk(start))
+
+    def point(p):
+        return tuple(coords[p])
+
+    polylines = []
+    for line in lines:
+        closed = len(line) > 2 and line[0] == line[-1]
+        if closed:
+            line = line[:-1]
+            first = min(range(len(line)), key=lambda i: point(line[i]))
+            line = line[first:] + line[:first]
+            if point(line[-1]) > point(line[1]):
+                line = line[:1] + line[:0:-1]
+        elif point(line[-1]) < point(line[0]):
+            line = line[::-1]
+        polylines.append((line, closed))
+
+    polylines.sort(key=lambda item: point(item[0][0]))
+    return polylines
+
+
+class Curves(object):
+    """Polylines on a surface.
+
+    Attributes:
+        points (numpy.ndarray): (N, 3) coordinates of the points, with the
+            points of each polyline in order.
+        ids (numpy.ndarray): (N, K) indices of the surface points each point
+            is interpolated from.
+        weights (numpy.ndarray): (N, K) interpolation weights.
+        lines (List[tuple]): (point indices, closed) of the polylines.
+        faces (numpy.ndarray): Surface faces the points lie on, those of the
+            segments adjacent to the points. The points on the edges shared
+            by two faces get either of them.
+    """
+
+    def __init__(self, points, ids, weights, lines, faces):
+        self.points = points
+        self.ids = ids
+        self.weights = weights
+        self.lines = lines
+        self.faces = faces
+
+    def clip(self, bounding_box):
+        """Clip the polylines by a box.
+
+        Args:
+            bounding_box (tuple): (minx, miny, minz, maxx, maxy, maxz),
+                None for the missing bounds.
+
+        Returns:
+            Curves: The parts of the polylines inside the box, the points
+                where they enter and leave it included.
+        """
+
+        lower = np.array([-np.inf if b is None else b
+                          for b in bounding_box[:3]], dtype=float)
+        upper = np.array([np.inf if b is None else b
+                          for b in bounding_box[3:]], dtype=float)
+        inside = np.all((self.points >= lower) & (self.points <= upper),
+                        axis=1)
+
+        # Segments of all the polylines. Closed ones start outside the box,
+        # so that their parts inside are not split, or are taken as open if
+        # they lie wholly inside.
+        starts, ends, continued = [], [], []
+        for line, closed in self.lines:
+            outside = np.nonzero(~inside[line])[0]
+            if closed and len(outside):
+                line = np.roll(line, -outside[0])
+                line = np.append(line, line[0])
+            starts.append(line[:-1])
+            ends.append(line[1:])
+            continued.append(np.arange(len(line) - 1) > 0)
+        starts = np.concatenate(starts or [[]]).astype(int)
+        ends = np.concatenate(ends or [[]]).astype(int)
+        continued = np.concatenate(continued or [[]]).astype(bool)
+
+        # Liang-Barsky clipping of the segments
+        p0, p1 = self.points[starts], self.points[ends]
+        delta = p1 - p0
+        t0 = np.zeros(len(starts))
+        t1 = np.ones(len(starts))
+        kept = np.ones(len(starts), dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for bound, sign in [(lower, 1), (upper, -1)]:
+                for axis in np.nonzero(np.isfinite(bound))[0]:
+                    d = sign * delta[:, axis]
+                    q = sign * (p0[:, axis] - bound[axis])
+                    kept &= (d != 0) | (q >= 0)
+                    t = -q / d
+                    t0 = np.where(d > 0, np.maximum(t0, t), t0)
+                    t1 = np.where(d < 0, np.minimum(t1, t), t1)
+        kept &= t0 <= t1
+
+        # The start is emitted unless it is the end of the previous segment
+        previous = np.append(False, kept[:-1] & (t1[:-1] >= 1))
+        emit_start = kept & ((t0 > 0) | ~(continued & previous))
+        emit = np.column_stack([emit_start, kept]).ravel()
+        segment = np.repeat(np.arange(len(starts)), 2)[emit]
+        t = np.column_stack([t0, t1]).ravel()[emit][:, np.newaxis]
+        a, b = starts[segment], ends[segment]
+        points = (1 - t) * self.points[a] + t * self.points[b]
+
+        # New polyline starts at every emitted segment start. Segments
+        # touching the box only at a point repeat the previous point.
+        new = np.column_stack([emit_start, np.zeros_like(kept)]).ravel()[emit]
+        unique = np.ones(len(points), dtype=bool)
+        unique[1:] = new[1:] | np.any(points[1:] != points[:-1], axis=1)
+        a, b, t, points, new = (a[unique], b[unique], t[unique],
+                                points[unique], new[unique])
+
+        bounds = np.append(np.nonzero(new)[0], len(points))
+        lines = [(np.arange(start, stop), False)
+                 for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        return Curves(points, np.hstack([self.ids[a], self.ids[b]]),
+                      np.hstack([(1 - t) * self.weights[a],
+                                 t * self.weights[b]]),
+                      lines, self.faces[a])
+
+    def sample(self, point_data, cell_data=None):
+        """Interpolate the point data of the surface at the points.
+
+        Args:
+            point_data (Mapping): Arrays defined at the surface points.
+            cell_data (Mapping): Arrays defined at the surface faces.
+
+        Returns:
+            CurveSamples: The interpolated data.
+        """
+        return CurveSamples(self, point_data, cell_data)
+
+
+class CurveSamples(object):
+    """Point data interpolated at the points of the curves.
+
+    The attribute names follow the VTK dataset adapter, see
+    :class:`pvtools.locator.PointSamples`.
+    """
+
+    def __init__(self, curves, point_data, cell_data=None):
+        self.Points = curves.points
+        self._curves = curves
+        self._point_data = point_data
+        self._cell_data = cell_data if cell_data is not None else {}
+        self.PointData = LazyDict(dict((name, self._loader(name))
+                                       for name in point_data.keys()))
+        self.CellData = LazyDict(dict((name, self._cell_loader(name))
+                                      for name in self._cell_data.keys()))
+
+    def _loader(self, name):
+        return lambda: self.interpolate(self._point_data[name])
+
+    def _cell_loader(self, name):
+        return lambda: np.asarray(self._cell_data[name])[self._curves.faces]
+
+    def interpolate(self, values):
+        """Interpolate the array of values at the surface points."""
+        values = np.asarray(values)
+        picked = values[self._curves.ids]
+        if values.ndim == 2:
+            return np.einsum("ij,ijk->ik", self._curves.weights, picked)
+        return np.sum(self._curves.weights * picked, axis=1)
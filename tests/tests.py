@@ -6,12 +6,23 @@ Tests of pvtools package.
 
 import unittest
 import doctest
+import json
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import cStringIO
+
+import numpy as np
 
 sys.path.insert(0, os.path.abspath('..'))
 
 import pvtools as pvt
+import pvtools.batch
+import pvtools.daemon
 
 
 class TestVtk(unittest.TestCase):
@@ -44,6 +55,35 @@ class TestVtk(unittest.TestCase):
             self.assertAlmostEqual(ds.probe("Y", (1, 0.5, 0.5)),
                                    0.5)
 
+    def test_cell_data(self):
+        with pvt.dsopen(self.file1) as ds:
+            self.assertAlmostEqual(ds.probe("CPressure", (0.5, 0.5, 0.5),
+                                            loc="cell"), 100.0)
+            self.assertEqual(ds.probe("PPressure", (0.5, 0.5, 0.5),
+                                      loc="cell"), None)
+            centres, values = ds.extract(["CPressure", "CVelocity Z"])
+            self.assertEqual(centres.tolist(), [[0.5, 0.5, 0.5]])
+            self.assertAlmostEqual(values["CPressure"][0], 100.0)
+            self.assertAlmostEqual(values["CVelocity Z"][0], 0.3)
+            centres, values = ds.extract("CPressure", (1, None, None,
+                                                       None, None, None))
+            self.assertEqual(len(centres), 0)
+
+    def test_probe_many(self):
+        with pvt.dsopen(self.file2) as ds:
+            points = [(1, 0.5, 0.5), (0.5, 0.5, 0.5), (0, 0, -1)]
+            arr = ds.probe_many("PPressure", points)
+            self.assertEqual(len(arr), 3)
+            self.assertAlmostEqual(arr[0], 20.0)
+            self.assertAlmostEqual(arr[1], 15.0)
+            self.assertTrue(np.isnan(arr[2]))
+
+            arr = ds.probe_many("Y", points)
+            self.assertAlmostEqual(arr[0], 0.5)
+            self.assertTrue(np.isnan(arr[2]))
+
+            self.assertEqual(ds.probe_many("Non existent", points), None)
+
     def test_line(self):
         with pvt.dsopen(self.file2) as ds:
             arr = ds.line("PPressure", ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5)), 3)
@@ -58,6 +98,22 @@ class TestVtk(unittest.TestCase):
             self.assertAlmostEqual(arr[1], 1.0)
             self.assertAlmostEqual(arr[2], 2.0)
 
+    def test_line_variables(self):
+        with pvt.dsopen(self.file2) as ds:
+            line = ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5))
+            res = ds.line(["PPressure", "PVelocity Z", "Missing"], line, 3)
+            self.assertEqual(sorted(res.keys()),
+                             ["Missing", "PPressure", "PVelocity Z"])
+            self.assertEqual(res["Missing"], None)
+            for pa, pb in zip(res["PPressure"], [10.0, 20.0, 30.0]):
+                self.assertAlmostEqual(pa, pb)
+            for ua, ub in zip(res["PVelocity Z"], [1.0, 2.0, 3.0]):
+                self.assertAlmostEqual(ua, ub)
+
+            res = ds.probe(["PPressure", "PVelocity"], (1, 0.5, 0.5))
+            self.assertAlmostEqual(res["PPressure"], 20.0)
+            self.assertAlmostEqual(res["PVelocity"], 2.0)
+
     def test_boundary_line(self):
         with pvt.dsopen(self.file2) as ds:
             point = (0.5, 0.5, 0.5)
@@ -76,6 +132,28 @@ class TestVtk(unittest.TestCase):
             for za, zb in zip(arr, [0.5, 0.5, 0.5]):
                 self.assertAlmostEqual(za, zb)
 
+    @unittest.skipUnless(pvt.backends.paraview_available(),
+                         "Paraview is not available")
+    def test_filter_reuse(self):
+        pvs = pvt.datasource.pvs
+        nsources = len(pvs.GetSources())
+        with pvt.dsopen(self.file2) as ds:
+            for i in range(3):
+                x = 0.5 + 0.5 * i
+                self.assertAlmostEqual(ds.probe("PPressure", (x, 0.5, 0.5)),
+                                       10.0 * (x + 1))
+                arr = ds.line("X", ((0.0, 0.5, 0.5), (x, 0.5, 0.5)), 3)
+                self.assertAlmostEqual(arr[-1], x)
+                arr = ds.boundary_line("X", (0.5, 0.5, 0.5), (0, 0, 1),
+                                       (x, None, None, None, 0.5, None))
+                self.assertAlmostEqual(min(arr), x)
+                if i == 0:
+                    nopen = len(pvs.GetSources())
+
+            # The filters were created by the first queries only
+            self.assertEqual(len(pvs.GetSources()), nopen)
+        self.assertEqual(len(pvs.GetSources()), nsources)
+
     def test_to_dict_probe(self):
         res = pvt.to_dict(
             "probe",
@@ -88,6 +166,73 @@ class TestVtk(unittest.TestCase):
         self.assertEqual(res[("C1", "p")], 15.0)
         self.assertEqual(res[("C2", "p")], 15.0)
 
+    def test_to_dict_probe_points(self):
+        res = pvt.to_dict(
+            "probe",
+            filename=self.file2,
+            variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+            point=[((1.0, 0.5, 0.5), "P1"), ((0.0, 0.0, -1.0), "P2")])
+
+        self.assertAlmostEqual(res[("uz", "P1")], 2.0)
+        self.assertAlmostEqual(res[("p", "P1")], 20.0)
+        self.assertEqual(res[("uz", "P2")], None)
+        self.assertEqual(res[("p", "P2")], None)
+
+    def test_to_dict_workers(self):
+        args = dict(filename=[(self.file1, "C1"), (self.file2, "C2")],
+                    variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+                    point=[((1.0, 0.5, 0.5), "P1"), ((0.5, 0.5, 0.5), "P2"),
+                           ((0.0, 0.0, -1.0), "P3")])
+        self.assertEqual(pvt.to_dict("probe", workers=4, **args),
+                         pvt.to_dict("probe", **args))
+
+        args = dict(filename=self.file2,
+                    variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+                    line=[(((0.0, 0.5, 0.5), (2.0, 0.5, 0.5)), "L1"),
+                          (((2.0, 0.5, 0.5), (0.0, 0.5, 0.5)), "L2")],
+                    npoints=3)
+        serial = pvt.to_dict("line", **args)
+        parallel = pvt.to_dict("line", workers=2, **args)
+        self.assertEqual(sorted(serial.keys()), sorted(parallel.keys()))
+        for key in serial:
+            self.assertEqual(list(serial[key]), list(parallel[key]))
+
+        missing = os.path.join(pvt.PVTOOLS_DIR, "tests/data/Missing.vtk")
+        with self.assertRaisesRegexp(RuntimeError, "Missing.vtk"):
+            pvt.to_dict("probe", workers=2,
+                        filename=[(self.file1, "C1"), (missing, "C2")],
+                        variable="PPressure", point=(0.5, 0.5, 0.5))
+
+    def test_to_dict_cache(self):
+        cachedir = tempfile.mkdtemp()
+        args = dict(filename=[(self.file1, "C1"), (self.file2, "C2")],
+                    variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+                    point=(0.5, 0.5, 0.5), cache=cachedir)
+        res1 = pvt.to_dict("probe", **args)
+        self.assertEqual(len(os.listdir(cachedir)), 2)
+        res2 = pvt.to_dict("probe", **args)
+        self.assertEqual(res1, res2)
+        self.assertEqual(len(os.listdir(cachedir)), 2)
+        shutil.rmtree(cachedir)
+
+    def test_to_json(self):
+        tmpdir = tempfile.mkdtemp()
+        args = dict(filename=[(self.file1, "C1"), (self.file2, "C2")],
+                    variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+                    line=((0.0, 0.5, 0.5), (1.0, 0.5, 0.5)), npoints=3)
+
+        pvt.to_json(os.path.join(tmpdir, "res.json"), "line", **args)
+        with open(os.path.join(tmpdir, "res.json")) as f:
+            res = json.load(f)
+        self.assertEqual(sorted(res.keys()), ["C1", "C2"])
+        self.assertEqual(res["C2"]["p"], [10.0, 15.0, 20.0])
+
+        pvt.to_npz(os.path.join(tmpdir, "res.npz"), "line", **args)
+        res = pvt.load_npz(os.path.join(tmpdir, "res.npz"))
+        self.assertEqual(list(res["C2"]["p"]), [10.0, 15.0, 20.0])
+        self.assertEqual(list(res["C1"]["uz"]), [1.0, 1.5, 2.0])
+        shutil.rmtree(tmpdir)
+
     def test_to_dict_line(self):
         res = pvt.to_dict(
             "line",
@@ -123,6 +268,708 @@ class TestVtk(unittest.TestCase):
             self.assertAlmostEqual(y0[i], y1[i])
 
 
+class TestLegacyVtk(unittest.TestCase):
+    def setUp(self):
+        self.file1 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell1Structured.vtk")
+        self.file2 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell2Unstructured.vtk")
+        self.file2bin = os.path.join(pvt.PVTOOLS_DIR,
+                                     "tests/data/Cell2UnstructuredBinary.vtk")
+
+    def test_structured(self):
+        mesh = pvt.legacyvtk.read(self.file1)
+        self.assertEqual(mesh.num_points, 8)
+        self.assertEqual(mesh.num_cells, 1)
+        self.assertEqual(mesh.bounds(), (0, 0, 0, 1, 1, 1))
+        self.assertEqual(list(mesh.connectivity), [0, 1, 3, 2, 4, 5, 7, 6])
+        self.assertEqual(sorted(mesh.get_variables('cell')),
+                         ["CPressure", "CVelocity"])
+        self.assertEqual(mesh.point_data["PVelocity"].shape, (8, 3))
+
+    def test_unstructured(self):
+        for filename in [self.file2, self.file2bin]:
+            mesh = pvt.legacyvtk.read(filename)
+            self.assertEqual(mesh.num_points, 12)
+            self.assertEqual(mesh.num_cells, 2)
+            self.assertEqual(list(mesh.offsets), [0, 8, 16])
+            self.assertEqual(list(mesh.cell_types), [12, 12])
+            self.assertEqual(list(mesh.connectivity[8:]),
+                             [4, 5, 7, 6, 8, 9, 11, 10])
+            self.assertEqual(list(mesh.point_data["PPressure"][::4]),
+                             [10, 20, 30])
+            self.assertEqual(list(mesh.points[11]), [2, 1, 1])
+
+    def test_select_arrays(self):
+        for filename in [self.file2, self.file2bin]:
+            mesh = pvt.legacyvtk.read(filename, arrays=["PVelocity"])
+            self.assertEqual(mesh.point_data.keys(), ["PVelocity"])
+            self.assertEqual(mesh.point_data["PVelocity"].shape, (12, 3))
+
+            with pvt.dsopen(filename, backend="numpy",
+                            arrays=pvt.datasource.required_arrays(
+                                ["PVelocity Z", "X"])) as ds:
+                self.assertEqual(ds.get_variables("point"), ["PVelocity"])
+                self.assertAlmostEqual(ds.probe("PVelocity Z", (2, 1, 1)),
+                                       3.0)
+                self.assertEqual(ds.probe("PPressure", (2, 1, 1)), None)
+
+        with self.assertRaises(ValueError):
+            pvt.DataSource(self.file2, backend="numpy", regions=["inlet"])
+
+    def test_split_cells(self):
+        # Tetrahedron, polygon of 5 points and wedge
+        flat = np.array([4, 0, 1, 2, 3, 5, 4, 5, 6, 7, 8, 6, 0, 1, 2, 3, 4, 5])
+        sizes = pvt.mesh.cell_sizes([10, 7, 13])
+        self.assertEqual(list(sizes), [4, -1, 6])
+        for known in [None, sizes]:
+            offsets, connectivity = pvt.mesh.split_cells(flat, 3, known)
+            self.assertEqual(list(offsets), [0, 4, 9, 15])
+            self.assertEqual(list(connectivity),
+                             [0, 1, 2, 3, 4, 5, 6, 7, 8, 0, 1, 2, 3, 4, 5])
+        self.assertRaises(ValueError, pvt.mesh.split_cells, flat, 3,
+                          [4, 4, 6])
+
+    def test_reductions(self):
+        # Pressure is 10 + 10x on the domain [0, 2] x [0, 1] x [0, 1],
+        # velocity (0, 0, 1 + x)
+        whole = ("box", (None,) * 6)
+        with pvt.dsopen(self.file2bin, backend="numpy") as ds:
+            res = ds.integrate(["PPressure", "PVelocity Z", "X"], whole)
+            self.assertAlmostEqual(res["PPressure"], 40.0)
+            self.assertAlmostEqual(res["PVelocity Z"], 4.0)
+            self.assertAlmostEqual(res["X"], 2.0)
+            self.assertAlmostEqual(ds.average("PPressure", whole), 20.0)
+            self.assertEqual(ds.minmax("PVelocity", whole), (1.0, 3.0))
+            self.assertAlmostEqual(ds.integrate(
+                "PPressure", ("box", (None, None, None, 1.0, None, None))),
+                15.0)
+
+            plane = ("plane", (0.5, 0.5, 0.5), (2, 0, 0))
+            self.assertAlmostEqual(ds.integrate("PPressure", plane), 15.0)
+            self.assertAlmostEqual(ds.average("PPressure", plane), 15.0)
+            self.assertAlmostEqual(ds.flux(
+                "PVelocity", ("plane", (0, 0, 0.5), (0, 0, 1))), 4.0)
+            self.assertAlmostEqual(ds.flux(
+                "PVelocity", ("plane", (0, 0, 0.5), (0, 0, -1))), -4.0)
+            self.assertEqual(ds.average(
+                "PPressure", ("plane", (5, 0, 0), (1, 0, 0))), None)
+
+            # Part of the line outside of the domain is left out
+            line = ("line", (-1, 0.5, 0.5), (2, 0.5, 0.5), 31)
+            self.assertAlmostEqual(ds.integrate("PPressure", line), 40.0)
+            self.assertAlmostEqual(ds.average("PPressure", line), 20.0)
+            res = ds.minmax(["PPressure", "Foo"], line)
+            self.assertEqual(res["Foo"], None)
+            self.assertAlmostEqual(res["PPressure"][0], 10.0)
+            self.assertAlmostEqual(res["PPressure"][1], 30.0)
+
+            self.assertRaises(ValueError, ds.flux, "PVelocity", whole)
+            self.assertRaises(ValueError, ds.integrate, "PPressure",
+                              ("patch", "inlet"))
+            self.assertRaises(ValueError, ds.integrate, "PPressure",
+                              ("sphere", (0, 0, 0), 1))
+
+    def test_surface_cells(self):
+        # Pressure is x + 2y on triangles, a quad and a pixel in the plane
+        # z = 0, and on a structured grid in the plane z = 1
+        surface = os.path.join(pvt.PVTOOLS_DIR,
+                               "tests/data/SurfaceUnstructured.vtk")
+        with pvt.dsopen(surface, backend="numpy") as ds:
+            points = [(0.5, 0.25, 0), (0.25, 0.5, 0), (1.5, 0.5, 0),
+                      (2.5, 0.75, 0), (0.5, 0.5, 0.1), (3.5, 0.5, 0)]
+            arr = ds.probe_many("PPressure", points)
+            for pa, pb in zip(arr[:4], [1.0, 1.25, 2.5, 4.0]):
+                self.assertAlmostEqual(pa, pb)
+            self.assertTrue(np.all(np.isnan(arr[4:])))
+
+        flat = os.path.join(pvt.PVTOOLS_DIR,
+                            "tests/data/SurfaceStructured.vtk")
+        with pvt.dsopen(flat, backend="numpy") as ds:
+            self.assertAlmostEqual(ds.probe("PPressure", (1.5, 0.5, 1)), 2.5)
+            self.assertEqual(ds.probe("PPressure", (1.5, 0.5, 1.5)), None)
+
+        # Points are not located in lines
+        tmpdir = tempfile.mkdtemp()
+        try:
+            lines = os.path.join(tmpdir, "lines.vtk")
+            with open(lines, "w") as f:
+                f.write("# vtk DataFile Version 2.0\nlines\nASCII\n"
+                        "DATASET UNSTRUCTURED_GRID\nPOINTS 2 double\n"
+                        "0 0 0 1 0 0\nCELLS 1 3\n2 0 1\nCELL_TYPES 1\n3\n"
+                        "POINT_DATA 2\nSCALARS PPressure double 1\n"
+                        "LOOKUP_TABLE default\n0 1\n")
+            with pvt.dsopen(lines, backend="numpy") as ds:
+                self.assertRaises(ValueError, ds.probe, "PPressure",
+                                  (0.5, 0, 0))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @unittest.skipUnless(pvt.backends.paraview_available(),
+                         "Paraview is not available")
+    def test_line_reductions_paraview(self):
+        # Part of the line outside of the domain is left out, as by numpy
+        line = ("line", (-1, 0.5, 0.5), (2, 0.5, 0.5), 31)
+        with pvt.dsopen(self.file2bin, backend="paraview") as ds:
+            self.assertAlmostEqual(ds.integrate("PPressure", line), 40.0)
+            self.assertAlmostEqual(ds.average("PPressure", line), 20.0)
+            res = ds.minmax("PPressure", line)
+            self.assertAlmostEqual(res[0], 10.0)
+            self.assertAlmostEqual(res[1], 30.0)
+
+    def test_numpy_backend(self):
+        with pvt.dsopen(self.file2bin, backend="numpy") as ds:
+            self.assertEqual(ds.get_variables('cell'), [])
+            self.assertEqual(sorted(ds.get_variables('point')),
+                             ["PPressure", "PVelocity"])
+
+    def test_numpy_probe(self):
+        for filename in [self.file2, self.file2bin]:
+            with pvt.dsopen(filename, backend="numpy") as ds:
+                self.assertAlmostEqual(ds.probe("PPressure", (1, 0.5, 0.5)),
+                                       20.0)
+                self.assertAlmostEqual(ds.probe("PPressure", (1.5, 0.5, 0.5)),
+                                       25.0)
+                self.assertAlmostEqual(ds.probe("PVelocity Z", (0, 0, 0)),
+                                       1.0)
+                self.assertAlmostEqual(ds.probe("PVelocity", (2, 1, 1)), 3.0)
+                self.assertEqual(ds.probe("PPressure", (0, 0, -1)), None)
+                self.assertEqual(ds.probe("Non existent", (1, 0.5, 0.5)),
+                                 None)
+
+                arr = ds.probe_many("PPressure", [(0.5, 0.5, 0.5), (3, 0, 0)])
+                self.assertAlmostEqual(arr[0], 15.0)
+                self.assertTrue(np.isnan(arr[1]))
+
+        with pvt.dsopen(self.file1, backend="numpy") as ds:
+            self.assertAlmostEqual(ds.probe("PPressure", (0.5, 0.5, 0.5)),
+                                   15.0)
+
+    def test_numpy_line(self):
+        with pvt.dsopen(self.file2, backend="numpy") as ds:
+            arr = ds.line("PPressure", ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5)), 5)
+            for pa, pb in zip(arr, [10.0, 15.0, 20.0, 25.0, 30.0]):
+                self.assertAlmostEqual(pa, pb)
+
+            arr = ds.line("X", ((-1.0, 0.5, 0.5), (2.0, 0.5, 0.5)), 4)
+            self.assertEqual(len(arr), 3)
+            for xa, xb in zip(arr, [0.0, 1.0, 2.0]):
+                self.assertAlmostEqual(xa, xb)
+
+            arr = ds.line("X", ((-1.0, 0.5, 0.5), (2.0, 0.5, 0.5)), 4,
+                          only_inside=False)
+            self.assertEqual(len(arr), 4)
+            self.assertTrue(np.isnan(arr[0]))
+            for xa, xb in zip(arr[1:], [0.0, 1.0, 2.0]):
+                self.assertAlmostEqual(xa, xb)
+
+    def test_numpy_boundary_line(self):
+        mesh = pvt.legacyvtk.read(self.file2)
+        offsets, connectivity = mesh.boundary_faces()
+        self.assertEqual(len(offsets) - 1, 10)
+        self.assertEqual(len(connectivity), 40)
+
+        with pvt.dsopen(self.file2, backend="numpy") as ds:
+            point, normal = (0.5, 0.5, 0.5), (0, 0, 1)
+
+            # Zero bounds are applied, and the box touching the boundary
+            # at a point does not repeat it
+            bbox = (None, None, None, 1.0, 0.0, None)
+            res = ds.boundary_line(["X", "PPressure"], point, normal, bbox)
+            self.assertEqual(len(res["X"]), 2)
+            for xa, xb in zip(res["X"], [0.0, 1.0]):
+                self.assertAlmostEqual(xa, xb)
+            for pa, pb in zip(res["PPressure"], [10.0, 20.0]):
+                self.assertAlmostEqual(pa, pb)
+
+            # The whole closed intersection, starting at its smallest point
+            arr = ds.boundary_line("X", point, normal)
+            self.assertEqual(len(arr), 6)
+            for xa, xb in zip(arr, [0.0, 1.0, 2.0, 2.0, 1.0, 0.0]):
+                self.assertAlmostEqual(xa, xb)
+
+            # The slice of the plane is reused by the other boxes
+            curves = ds._curves
+            arr = ds.boundary_line("PVelocity Z", point, normal,
+                                   (1.5, None, None, None, None, None))
+            self.assertTrue(ds._curves is curves)
+            self.assertEqual(len(arr), 4)
+
+    def test_numpy_cell_data(self):
+        mesh = pvt.legacyvtk.read(self.file2)
+        self.assertEqual(mesh.cell_centers.tolist(),
+                         [[0.5, 0.5, 0.5], [1.5, 0.5, 0.5]])
+        self.assertEqual(list(mesh.boundary_faces(with_owners=True)[2]),
+                         [0, 1, 0, 1, 0, 1, 0, 1, 0, 1])
+
+        with pvt.dsopen(self.file1, backend="numpy") as ds:
+            # Variables defined only at the cells are taken from the cells
+            self.assertAlmostEqual(ds.probe("CPressure", (0.2, 0.5, 0.9)),
+                                   100.0)
+            self.assertAlmostEqual(ds.probe("CVelocity Y", (0.2, 0.5, 0.9),
+                                            loc="cell"), 0.2)
+            self.assertEqual(ds.probe("CPressure", (0.2, 0.5, 0.9),
+                                      loc="point"), None)
+            self.assertEqual(ds.probe("CPressure", (0, 0, -1)), None)
+
+            arr = ds.line("CPressure", ((-1, 0.5, 0.5), (1, 0.5, 0.5)), 3,
+                          only_inside=False)
+            self.assertTrue(np.isnan(arr[0]))
+            self.assertEqual(list(arr[1:]), [100.0, 100.0])
+
+            arr = ds.boundary_line("CPressure", (0.5, 0.5, 0.5), (0, 0, 1))
+            self.assertEqual(list(arr), [100.0] * 4)
+
+            centres, values = ds.extract(["CPressure", "PPressure", "X"])
+            self.assertEqual(centres.tolist(), [[0.5, 0.5, 0.5]])
+            self.assertEqual(list(values["CPressure"]), [100.0])
+            self.assertEqual(values["PPressure"], None)
+            self.assertEqual(list(values["X"]), [0.5])
+
+    def test_locator_sidecar(self):
+        mesh = pvt.legacyvtk.read(self.file2)
+        sidecar = os.path.join(tempfile.mkdtemp(), "index.npz")
+        loc1 = pvt.locator.build(mesh, sidecar)
+        self.assertTrue(os.path.isfile(sidecar))
+        loc2 = pvt.locator.build(mesh, sidecar)
+        self.assertEqual(list(loc1.bin_elems), list(loc2.bin_elems))
+        self.assertEqual(list(loc2.find([(1.5, 0.5, 0.5)])[0]), [1])
+        shutil.rmtree(os.path.dirname(sidecar))
+
+
+class TestBackends(unittest.TestCase):
+    def test_lazy_import(self):
+        # Paraview is not imported until a data source needs it
+        script = ("import sys, pvtools; "
+                  "print('paraview' in sys.modules, 'vtk' in sys.modules)")
+        output = subprocess.check_output([sys.executable, "-c", script],
+                                         cwd=pvt.PVTOOLS_DIR)
+        self.assertEqual(output.strip(), "(False, False)")
+
+    def test_select(self):
+        self.assertEqual(pvt.backends.select("numpy"), "numpy")
+        self.assertEqual(pvt.backends.select("paraview"), "paraview")
+        self.assertIn(pvt.backends.select("auto"), ["numpy", "paraview"])
+        self.assertRaises(ValueError, pvt.backends.select, "vtk")
+
+    def test_read_native(self):
+        filename = os.path.join(pvt.PVTOOLS_DIR,
+                                "tests/data/Cell2Unstructured.vtk")
+        mesh = pvt.backends.read_native(filename)
+        self.assertEqual(mesh.num_cells, 2)
+        self.assertRaises(ValueError, pvt.backends.read_native, "file.vtu")
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.results = {("C1", "p", "L1"): np.array([1.0, 2.0, 3.0]),
+                        ("C1", "p", "L2"): None,
+                        ("C1", "u", "L1"): np.float64(4.0),
+                        ("C2", "p", "L1"): np.arange(4.0).reshape(2, 2),
+                        ("C2", 1, 2.5): 5.0}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_json(self):
+        filename = os.path.join(self.tmpdir, "res.json")
+        with open(filename, "w") as f:
+            writer = pvt.export.JsonWriter(f)
+            for key in sorted(self.results):
+                writer.write(key, self.results[key])
+            writer.close()
+
+        with open(filename) as f:
+            res = json.load(f)
+        expected = json.loads(json.dumps(pvt.interface._hierarchize(
+            dict((k, pvt.export._plain(v))
+                 for k, v in self.results.iteritems()))))
+        self.assertEqual(res, expected)
+
+    def test_json_special(self):
+        for results, expected in [({}, {}), ({(): 1.5}, 1.5),
+                                  ({("a",): None}, {"a": None})]:
+            f = cStringIO.StringIO()
+            writer = pvt.export.JsonWriter(f)
+            for key, val in results.iteritems():
+                writer.write(key, val)
+            writer.close()
+            self.assertEqual(json.loads(f.getvalue()), expected)
+
+    def test_npz(self):
+        filename = os.path.join(self.tmpdir, "res.npz")
+        writer = pvt.export.NpzWriter(filename)
+        for key in sorted(self.results):
+            writer.write(key, self.results[key])
+        writer.close()
+
+        for mmap in [True, False]:
+            res = pvt.load_npz(filename, mmap)
+            self.assertEqual(sorted(res.keys()), ["C1", "C2"])
+            self.assertEqual(list(res["C1"]["p"]["L1"]), [1.0, 2.0, 3.0])
+            self.assertNotIn("L2", res["C1"]["p"])
+            self.assertEqual(res["C1"]["u"]["L1"], 4.0)
+            self.assertEqual(res["C2"]["p"]["L1"].tolist(),
+                             [[0.0, 1.0], [2.0, 3.0]])
+            self.assertEqual(res["C2"]["1"]["2.5"], 5.0)
+            self.assertEqual(isinstance(res["C1"]["p"]["L1"], np.memmap),
+                             mmap)
+
+        # Readable by numpy as well
+        npz = np.load(filename)
+        self.assertEqual(list(npz["C1/p/L1"]), [1.0, 2.0, 3.0])
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.file2 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell2Unstructured.vtk")
+
+    def test_disabled(self):
+        stage = pvt.profiling.stage("fetch")
+        self.assertFalse(stage.enabled)
+        with stage:
+            stage.nbytes = 10
+        self.assertEqual(stage.nbytes, 0)
+
+    def test_threads(self):
+        def run(stats):
+            for _ in range(200):
+                with pvt.profiling.stage("outer", stats):
+                    with pvt.profiling.stage("inner"):
+                        pass
+
+        with pvt.profile() as stats:
+            threads = [threading.Thread(target=run, args=(stats,))
+                       for _ in range(4)]
+            threads += [threading.Thread(target=run, args=(None,))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(pvt.profiling.recording(), stats)
+
+        # Threads without the stats given record nothing
+        self.assertEqual(stats.totals["outer"]["count"], 800)
+        self.assertEqual(stats.totals["inner"]["count"], 800)
+        self.assertIsNone(pvt.profiling.recording())
+
+    def test_datasource_stats(self):
+        stats = pvt.Stats()
+        with pvt.dsopen(self.file2, backend="numpy", stats=stats) as ds:
+            for x in [0.5, 1.5]:
+                ds.probe("PPressure", (x, 0.5, 0.5))
+            ds.line("X", ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5)), 5)
+
+        self.assertEqual(stats.totals["open"]["count"], 1)
+        self.assertEqual(stats.totals["probe"]["count"], 2)
+        self.assertEqual(stats.totals["line"]["count"], 1)
+        self.assertEqual(stats.totals["locator"]["count"], 1)
+        self.assertEqual(stats.totals["sample"]["count"], 3)
+        self.assertTrue("probe" in stats.summary())
+
+    def test_profile_to_dict(self):
+        args = dict(filename=[(self.file2, "C1"), (self.file2, "C2")],
+                    variable="PPressure", point=(1.0, 0.5, 0.5))
+        for workers in [1, 2]:
+            with pvt.profile() as stats:
+                pvt.to_dict("probe", workers=workers, **args)
+            self.assertEqual(stats.totals["file"]["count"], 2)
+            self.assertEqual(stats.totals["probe"]["count"], 2)
+            self.assertEqual(len(set(e["pid"] for e in stats.events)),
+                             workers)
+
+        # Nothing is recorded outside of the profile
+        pvt.to_dict("probe", **args)
+        self.assertEqual(stats.totals["file"]["count"], 2)
+
+        tmpdir = tempfile.mkdtemp()
+        trace = os.path.join(tmpdir, "trace.json")
+        stats.write_trace(trace)
+        with open(trace) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual(len(events), len(stats.events))
+        self.assertEqual(set(e["ph"] for e in events), set(["X"]))
+        shutil.rmtree(tmpdir)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file1 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell1Structured.vtk")
+        self.file2 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell2Unstructured.vtk")
+        files = [[self.file1, "C1"], [self.file2, "C2"]]
+        self.spec = {"options": {"backend": "numpy"}, "jobs": [
+            {"name": "probes", "function": "probe", "filename": files,
+             "variable": [["PPressure", "p"], ["PVelocity Z", "uz"]],
+             "point": [[[0.0, 0.5, 0.5], "P1"], [[1.0, 0.5, 0.5], "P2"]],
+             "output": os.path.join(self.tmpdir, "probes.json")},
+            {"name": "more_probes", "function": "probe", "filename": files,
+             "variable": "PPressure", "point": [[[1.0, 0.5, 0.5], "P2"]],
+             "output": os.path.join(self.tmpdir, "more_probes.json")},
+            {"name": "lines", "function": "line", "filename": self.file2,
+             "variable": "PPressure",
+             "line": [[[[0, 0.5, 0.5], [2, 0.5, 0.5]], "L1"]],
+             "npoints": 5, "output": os.path.join(self.tmpdir, "lines.npz")}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_adaptive_line(self):
+        spec = {"jobs": [{"name": "adaptive", "function": "line",
+                          "filename": self.file2, "variable": "PPressure",
+                          "line": [[[[0, 0.5, 0.5], [2, 0.5, 0.5]], "L1"]],
+                          "adaptive": True}]}
+        self.assertRaises(ValueError, pvt.batch.plan, spec)
+        args = dict(filename=self.file2, variable="PPressure",
+                    line=((0, 0.5, 0.5), (2, 0.5, 0.5)))
+        self.assertRaises(ValueError, pvt.to_dict, "line", adaptive=True,
+                          **args)
+        self.assertEqual(len(pvt.to_dict("line", adaptive=False, **args)),
+                         1)
+
+    def test_plan(self):
+        files = pvt.batch.plan(self.spec)
+        self.assertEqual(files.keys(), [os.path.realpath(self.file1),
+                                        os.path.realpath(self.file2)])
+        self.assertEqual([task.job for task in files.values()[1]],
+                         ["probes", "more_probes", "lines"])
+        self.assertRaises(ValueError, pvt.batch.plan,
+                          {"jobs": self.spec["jobs"][:1] * 2})
+
+    def test_results(self):
+        with pvt.profile() as stats:
+            results = list(pvt.batch.iter_results(self.spec))
+        # Each file is opened once
+        self.assertEqual(stats.totals["open"]["count"], 2)
+        self.assertEqual(stats.totals["probe_many"]["count"], 2)
+
+        merged = {}
+        for job, res in results:
+            merged.setdefault(job, {}).update(res)
+        self.assertEqual(merged["probes"], pvt.to_dict(
+            "probe", filename=[(self.file1, "C1"), (self.file2, "C2")],
+            variable=[("PPressure", "p"), ("PVelocity Z", "uz")],
+            point=[((0.0, 0.5, 0.5), "P1"), ((1.0, 0.5, 0.5), "P2")]))
+        self.assertEqual(merged["more_probes"],
+                         {("C1",): 20.0, ("C2",): 20.0})
+        self.assertEqual(merged["lines"][()].tolist(),
+                         [10.0, 15.0, 20.0, 25.0, 30.0])
+
+    def test_cli(self):
+        spec_file = os.path.join(self.tmpdir, "spec.json")
+        with open(spec_file, "w") as f:
+            json.dump(self.spec, f)
+        subprocess.check_call([sys.executable, "-m", "pvtools", "batch",
+                               spec_file], cwd=pvt.PVTOOLS_DIR)
+
+        with open(os.path.join(self.tmpdir, "probes.json")) as f:
+            probes = json.load(f)
+        self.assertEqual(probes["C2"]["uz"]["P2"], 2.0)
+        with open(os.path.join(self.tmpdir, "more_probes.json")) as f:
+            self.assertEqual(json.load(f), {"C1": 20.0, "C2": 20.0})
+        lines = pvt.load_npz(os.path.join(self.tmpdir, "lines.npz"))
+        self.assertEqual(list(lines), [10.0, 15.0, 20.0, 25.0, 30.0])
+
+
+class TestMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["Cell1Structured.vtk", "Cell1Foam",
+                     "Cell1FoamDecomposed"]:
+            path = os.path.join(pvt.PVTOOLS_DIR, "tests/data", name)
+            copy = shutil.copytree if os.path.isdir(path) else shutil.copy
+            copy(path, os.path.join(self.tmpdir, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_legacy_vtk(self):
+        filename = os.path.join(self.tmpdir, "Cell1Structured.vtk")
+        info = pvt.inspect(filename)
+        self.assertEqual(info, {
+            "point_variables": ["PPressure", "PVelocity"],
+            "cell_variables": ["CPressure", "CVelocity"],
+            "num_points": 8, "num_cells": 1,
+            "bounds": (0.0, 0.0, 0.0, 1.0, 1.0, 1.0), "times": []})
+
+        # Loaded from the sidecar, unless the file changes
+        sidecar = filename + ".meta.json"
+        with open(sidecar) as f:
+            data = json.load(f)
+        data["metadata"]["num_cells"] = 5
+        with open(sidecar, "w") as f:
+            json.dump(data, f)
+        self.assertEqual(pvt.inspect(filename), dict(info, num_cells=5))
+        self.assertEqual(pvt.inspect(filename, cache=False), info)
+        os.utime(filename, (0, 0))
+        self.assertEqual(pvt.inspect(filename), info)
+
+    def test_foam(self):
+        casefile = os.path.join(self.tmpdir, "Cell1Foam", "Cell1Foam.foam")
+        info = pvt.inspect(casefile)
+        self.assertEqual(info["times"], [0.0, 1.0])
+        self.assertEqual(info["point_variables"], ["U", "p"])
+        self.assertEqual(info["cell_variables"], ["U", "p"])
+        self.assertEqual((info["num_points"], info["num_cells"]), (12, 2))
+        self.assertEqual(info["bounds"], (0.0, 0.0, 0.0, 2.0, 1.0, 1.0))
+        self.assertEqual(pvt.inspect(casefile), info)
+
+        # New time directory
+        casedir = os.path.dirname(casefile)
+        shutil.copytree(os.path.join(casedir, "1"),
+                        os.path.join(casedir, "2"))
+        self.assertEqual(pvt.inspect(casefile)["times"], [0.0, 1.0, 2.0])
+
+        info = pvt.inspect(os.path.join(
+            self.tmpdir, "Cell1FoamDecomposed", "Cell1FoamDecomposed.foam"))
+        self.assertEqual((info["num_points"], info["num_cells"]), (16, 2))
+        self.assertEqual(info["bounds"], (0.0, 0.0, 0.0, 2.0, 1.0, 1.0))
+
+    def test_cli(self):
+        filename = os.path.join(self.tmpdir, "Cell1Structured.vtk")
+        output = subprocess.check_output(
+            [sys.executable, "-m", "pvtools", "inspect", filename,
+             "--no-cache"], cwd=pvt.PVTOOLS_DIR)
+        info = json.loads(output)
+        self.assertEqual(info["filename"], filename)
+        self.assertEqual(info["num_points"], 8)
+        self.assertFalse(os.path.exists(filename + ".meta.json"))
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmpdir, "pvtools.sock")
+        self.file2 = os.path.join(pvt.PVTOOLS_DIR,
+                                  "tests/data/Cell2Unstructured.vtk")
+        self.server = pvt.daemon.Server(self.socket, max_open=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.01)
+        self.client = pvt.daemon.Client(self.socket, backend="numpy")
+
+    def tearDown(self):
+        self.client.shutdown()
+        self.client.close()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def test_queries(self):
+        self.assertEqual(self.client.probe(self.file2, "PPressure",
+                                           (0.5, 0.5, 0.5)), 15.0)
+        self.assertEqual(self.client.probe(
+            self.file2, ["PPressure", "PVelocity Z"], (1.5, 0.5, 0.5)),
+            {"PPressure": 25.0, "PVelocity Z": 2.5})
+        values = self.client.line(self.file2, "PPressure",
+                                  ((0, 0.5, 0.5), (2, 0.5, 0.5)), npoints=5)
+        self.assertIsInstance(values, np.ndarray)
+        self.assertEqual(values.tolist(), [10.0, 15.0, 20.0, 25.0, 30.0])
+        self.assertEqual(self.server.pool.get(self.file2, backend="numpy"),
+                         self.server.pool.get(self.file2, backend="numpy"))
+
+        kwargs = dict(variable=[("PVelocity Z", "uz"), ("PPressure", "p")],
+                      point=[((0.0, 0.5, 0.5), "P1"), ((1.0, 0.5, 0.5), "P2")])
+        self.assertEqual(self.client.to_dict("probe", self.file2, **kwargs),
+                         pvt.to_dict("probe", self.file2, **kwargs))
+        self.assertEqual(self.client.status()["open"], 1)
+
+        self.assertRaises(RuntimeError, self.client.probe,
+                          os.path.join(self.tmpdir, "missing.vtk"), "p",
+                          (0, 0, 0))
+        self.assertRaises(RuntimeError, self.client.call, self.file2,
+                          "close")
+        self.assertRaises(RuntimeError, self.client.to_dict, "line",
+                          self.file2, variable="PPressure",
+                          line=((0, 0.5, 0.5), (2, 0.5, 0.5)), adaptive=True)
+        # The connection is still usable after the errors
+        self.assertEqual(self.client.call(self.file2, "times"), [])
+
+    def test_clients(self):
+        # Other clients are answered while the first one stays connected
+        with pvt.daemon.Client(self.socket, backend="numpy") as client:
+            self.assertEqual(client.probe(self.file2, "PPressure",
+                                          (0.5, 0.5, 0.5)), 15.0)
+            self.assertEqual(self.client.call(self.file2, "times"), [])
+            self.assertEqual(client.call(self.file2, "times"), [])
+        self.assertEqual(self.client.status()["open"], 1)
+
+        # The running daemon is not replaced
+        self.assertRaises(RuntimeError,
+                          pvt.daemon.Server(self.socket).serve_forever)
+        self.assertEqual(self.client.call(self.file2, "times"), [])
+
+    def test_eviction(self):
+        pool = pvt.daemon.SourcePool(max_open=2)
+        first = pool.get(self.file2, backend="numpy")
+        pool.get(self.file2, backend="numpy", cache_index=False)
+        pool.get(self.file2, backend="numpy")
+        pool.get(self.file2, backend="numpy", arrays=["PPressure"])
+        self.assertEqual(len(pool), 2)
+        # Least recently used was closed, the first one was used since
+        self.assertIsNotNone(first.mesh)
+
+        pool.max_memory = 1
+        pool.evict()
+        self.assertEqual(len(pool), 1)
+        pool.close()
+        self.assertIsNone(first.mesh)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.datafile = os.path.join(self.tmpdir, "data.vtk")
+        with open(self.datafile, "w") as f:
+            f.write("data")
+        self.cache = pvt.cache.ResultCache(os.path.join(self.tmpdir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_put(self):
+        key = self.cache.key(self.datafile, "probe", [(0, 0, 1)])
+        self.assertEqual(self.cache.get(key), None)
+        self.cache.put(key, {("p",): np.arange(3.0)})
+        value = self.cache.get(key)
+        self.assertEqual(list(value[("p",)]), [0.0, 1.0, 2.0])
+
+    def test_key(self):
+        key = self.cache.key(self.datafile, "probe", [(0, 0, 1)])
+        self.assertEqual(key, self.cache.key(self.datafile, "probe",
+                                             ((0.0, 0.0, 1.0),)))
+        self.assertNotEqual(key, self.cache.key(self.datafile, "probe",
+                                                [(0, 0, 2)]))
+
+        # Modified file invalidates the entries
+        with open(self.datafile, "w") as f:
+            f.write("modified data")
+        self.assertNotEqual(key, self.cache.key(self.datafile, "probe",
+                                                [(0, 0, 1)]))
+
+    def test_eviction(self):
+        keys = [self.cache.key(self.datafile, i) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, np.zeros(100))
+            # Entries are ordered by the modification time
+            os.utime(self.cache._path(key), (i, i))
+        self.cache.max_size = self.cache.size() + 10
+
+        # Reading marks the entry as recently used
+        self.cache.get(keys[0])
+        self.cache.put(self.cache.key(self.datafile, 3), np.zeros(100))
+
+        self.assertTrue(self.cache.get(keys[0]) is not None)
+        self.assertEqual(self.cache.get(keys[1]), None)
+        self.assertTrue(self.cache.size() <= self.cache.max_size)
+
+
 class TestFoam(unittest.TestCase):
     def setUp(self):
         self.casefile = os.path.join(pvt.PVTOOLS_DIR,
@@ -145,11 +992,346 @@ class TestFoam(unittest.TestCase):
             self.assertAlmostEqual(ds.probe("p", (0, 0, -1)), None)
             self.assertAlmostEqual(ds.probe("Y", (1, 0.5, 0.5)), 0.5)
 
+    def test_times(self):
+        with pvt.dsopen(self.casefile) as ds:
+            self.assertEqual(ds.times(), [0.0, 1.0])
+            self.assertEqual(ds.time, 1.0)
+
+            series = list(ds.probe_series("p", (1.0, 0.5, 0.5)))
+            self.assertEqual([t for t, _ in series], [0.0, 1.0])
+            self.assertAlmostEqual(series[0][1], 0.0)
+            self.assertAlmostEqual(series[1][1], 1.5)
+
+            line = ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5))
+            for pa, pb in zip(ds.line("p", line, 3, time=0.0), [0, 0, 0]):
+                self.assertAlmostEqual(pa, pb)
+            for pa, pb in zip(ds.line("p", line, 3), [1.0, 1.5, 2.0]):
+                self.assertAlmostEqual(pa, pb)
+            self.assertAlmostEqual(ds.probe("p", (0.0, 0.5, 0.5), 1.0), 1.0)
+
+    def test_to_dict_times(self):
+        res = pvt.to_dict(
+            "probe",
+            filename=self.casefile,
+            variable="p",
+            point=[((0.0, 0.5, 0.5), "P1"), ((2.0, 0.5, 0.5), "P2")],
+            time=[(0.0, "t0"), (1.0, "t1")])
+
+        self.assertAlmostEqual(res[("P1", "t0")], 0.0)
+        self.assertAlmostEqual(res[("P2", "t0")], 0.0)
+        self.assertAlmostEqual(res[("P1", "t1")], 1.0)
+        self.assertAlmostEqual(res[("P2", "t1")], 2.0)
+
+
+class TestFoamReader(unittest.TestCase):
+    def setUp(self):
+        self.casefile = os.path.join(pvt.PVTOOLS_DIR,
+                                     "tests/data/Cell1Foam/Cell1Foam.foam")
+
+    def test_probe_series_follow(self):
+        tmpdir = tempfile.mkdtemp()
+        casedir = os.path.join(tmpdir, "Cell1Foam")
+        shutil.copytree(os.path.dirname(self.casefile), casedir)
+
+        with pvt.dsopen(os.path.join(casedir, "Cell1Foam.foam"),
+                        backend="numpy") as ds:
+            series = ds.probe_series("p", (0.0, 0.5, 0.5), follow=True,
+                                     poll_interval=0.01, timeout=0.1)
+            self.assertEqual(next(series), (0.0, 0.0))
+            self.assertEqual(next(series), (1.0, 1.0))
+
+            # New time directory written while following
+            shutil.copytree(os.path.join(casedir, "1"),
+                            os.path.join(casedir, "2.5"))
+            self.assertEqual(next(series), (2.5, 1.0))
+            self.assertEqual(list(series), [])
+
+        shutil.rmtree(tmpdir)
+
+    def test_mesh(self):
+        mesh = pvt.foam.read(self.casefile)
+        self.assertEqual(mesh.time, "1")
+        self.assertEqual(mesh.case.times(), ["0", "1"])
+        self.assertEqual(mesh.num_points, 12)
+        self.assertEqual(mesh.num_cells, 2)
+        self.assertEqual(list(mesh.cell_types), [12, 12])
+        self.assertEqual(mesh.bounds(), (0, 0, 0, 2, 1, 1))
+        self.assertEqual([patch[0] for patch in mesh.case.boundary],
+                         ["faceA", "faceB", "faceC", "faceD", "faceE",
+                          "faceF"])
+
+    def test_fields(self):
+        mesh = pvt.foam.read(self.casefile)
+        self.assertEqual(sorted(mesh.get_variables('cell')), ["U", "p"])
+        self.assertEqual(list(mesh.cell_data["p"]), [1.0, 2.0])
+        self.assertEqual(mesh.cell_data["U"].shape, (2, 3))
+
+        p = mesh.point_data["p"]
+        x = mesh.points[:, 0]
+        for xval, pval in [(0.0, 1.0), (1.0, 1.5), (2.0, 2.0)]:
+            for val in p[x == xval]:
+                self.assertAlmostEqual(val, pval)
+
+        mesh = pvt.foam.read(self.casefile, "0")
+        self.assertEqual(mesh.cell_data["U"].tolist(), [[0, 0, 0]] * 2)
+
+    def test_numpy_backend(self):
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            self.assertEqual(sorted(ds.get_variables('cell')), ["U", "p"])
+            self.assertEqual(sorted(ds.get_variables('point')), ["U", "p"])
+
+    def test_numpy_reductions(self):
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            # The fluxes are outwards of the domain
+            self.assertAlmostEqual(ds.flux("U", ("patch", "faceA")), -4.0)
+            self.assertAlmostEqual(ds.flux("U", ("patch", "faceB")), 4.0)
+            self.assertAlmostEqual(ds.flux("U", ("patch", "faceD")), 4.0)
+            self.assertAlmostEqual(ds.average("p", ("patch", "faceD")), 2.0)
+            self.assertAlmostEqual(ds.integrate("p", ("box", (None,) * 6)),
+                                   3.0)
+
+            res = pvt.to_dict("average", filename=self.casefile,
+                              variable=[("p", "p"), ("U X", "ux")],
+                              region=[(("patch", "faceC"), "C"),
+                                      (("patch", "faceD"), "D")])
+            self.assertAlmostEqual(res[("p", "C")], 1.0)
+            self.assertAlmostEqual(res[("p", "D")], 2.0)
+            self.assertEqual(len(res), 4)
+
+    def test_select_arrays(self):
+        self.assertEqual(pvt.datasource.required_arrays(["U X", "p", "Y"]),
+                         ["U", "U X", "p"])
+
+        with pvt.dsopen(self.casefile, backend="numpy", arrays=["p"],
+                        regions=["internalMesh"]) as ds:
+            self.assertEqual(ds.get_variables("cell"), ["p"])
+            self.assertEqual(ds.get_variables("point"), ["p"])
+            self.assertEqual(ds.probe("U", (0.0, 0.5, 0.5)), None)
+            # Also at the other times
+            self.assertAlmostEqual(ds.probe("p", (0.0, 0.5, 0.5), time=0),
+                                   0.0)
+            self.assertEqual(ds.probe("U", (0.0, 0.5, 0.5), time=0), None)
+
+        with pvt.dsopen(self.casefile, backend="numpy",
+                        cell_to_point=False) as ds:
+            self.assertEqual(sorted(ds.get_variables("cell")), ["U", "p"])
+            self.assertEqual(ds.get_variables("point"), [])
+
+        with self.assertRaises(ValueError):
+            pvt.DataSource(self.casefile, backend="numpy",
+                           regions=["internalMesh", "faceA"])
+
+    def test_numpy_probe(self):
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            self.assertAlmostEqual(ds.probe("p", (0.0, 0.5, 0.5)), 1.0)
+            self.assertAlmostEqual(ds.probe("p", (1.0, 0.5, 0.5)), 1.5)
+            self.assertAlmostEqual(ds.probe("p", (2.0, 0.5, 0.5)), 2.0)
+            self.assertAlmostEqual(ds.probe("U Z", (0.0, 0.5, 0.5)), 4.0)
+            self.assertAlmostEqual(ds.probe("U", (0.0, 0.5, 0.5)), 5.0)
+            self.assertEqual(ds.probe("Missing", (1.0, 0.5, 0.5)), None)
+            self.assertEqual(ds.probe("p", (0, 0, -1)), None)
+            self.assertAlmostEqual(ds.probe("Y", (1, 0.5, 0.5)), 0.5)
+
+    def test_numpy_boundary_line(self):
+        mesh = pvt.foam.read(self.casefile)
+        offsets, connectivity = mesh.boundary_faces()
+        self.assertEqual(len(offsets) - 1, 10)
+
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            arr = ds.boundary_line("p", (1.0, 0.0, 0.0), (1, 0, 0))
+            self.assertEqual(len(arr), 4)
+            for val in arr:
+                self.assertAlmostEqual(val, 1.5)
+
+            arr = ds.boundary_line("p", (1.0, 0.0, 0.0), (1, 0, 0), time=0)
+            self.assertEqual(list(arr), [0.0] * 4)
+
+    def test_field(self):
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            points = ds.mesh.points
+            self.assertEqual(ds.field("p").tolist(),
+                             ds.mesh.point_data["p"].tolist())
+            self.assertEqual(ds.field("X").tolist(), points[:, 0].tolist())
+            self.assertEqual(sorted(ds.field(["p", "Missing"])),
+                             ["Missing", "p"])
+            self.assertEqual(ds.field("Missing"), None)
+
+            # Views of the data, not to be modified
+            view = ds.field("U Z", copy=False)
+            self.assertTrue(np.may_share_memory(view,
+                                                ds.mesh.point_data["U"]))
+            self.assertFalse(view.flags.writeable)
+            self.assertTrue(ds.field("U Z").flags.writeable)
+
+            magnitudes = ds.field("U", dtype=np.float32)
+            self.assertEqual(magnitudes.dtype, np.float32)
+            self.assertAlmostEqual(magnitudes[points[:, 0] == 0][0], 5.0,
+                                   places=5)
+            self.assertEqual(ds.field("p", time=0).tolist(), [0.0] * 12)
+
+            values = ds.probe_many("p", [(0, 0.5, 0.5), (0, 0, -1)],
+                                   dtype=np.float32)
+            self.assertEqual(values.dtype, np.float32)
+            self.assertTrue(np.isnan(values[1]))
+            line = ds.line("p", ((0, 0.5, 0.5), (2, 0.5, 0.5)), 3,
+                           copy=False, dtype=np.float32)
+            self.assertEqual(line.dtype, np.float32)
+
+    def test_polyhedral_locator(self):
+        mesh = pvt.foam.read(self.casefile)
+
+        class PolyhedralMesh(type(mesh)):
+            # The hexahedra located through their faces, as polyhedra
+            @property
+            def cell_types(self):
+                return np.full(self.num_cells, pvt.mesh.VTK_POLYHEDRON)
+
+        points = np.random.RandomState(0).uniform(-0.2, 2.2, (500, 3))
+        cells, _, _ = pvt.locator.CellLocator(mesh).find(points)
+        mesh.__class__ = PolyhedralMesh
+        locator = pvt.locator.CellLocator(mesh)
+        self.assertEqual(len(locator.elem_cells), 2 * 6 * 2)
+        self.assertEqual(locator.centroids.tolist(),
+                         [[0.5, 0.5, 0.5], [1.5, 0.5, 0.5]])
+        samples = locator.sample(points)
+        self.assertEqual(list(samples.cells >= 0), list(cells >= 0))
+        inside = cells >= 0
+        self.assertTrue(np.allclose(samples.PointData["p"][inside],
+                                    1 + 0.5 * points[inside, 0]))
+
+    def test_cell_data(self):
+        line = ((0.0, 0.5, 0.5), (2.0, 0.5, 0.5))
+        for cell_to_point in [True, False]:
+            with pvt.dsopen(self.casefile, backend="numpy",
+                            cell_to_point=cell_to_point) as ds:
+                self.assertAlmostEqual(
+                    ds.probe("p", (0.25, 0.5, 0.5), loc="cell"), 1.0)
+                self.assertAlmostEqual(
+                    ds.probe("U X", (1.75, 0.5, 0.5), loc="cell"), 4.0)
+                values = ds.probe_many("p", [(1.5, 0.5, 0.5), (3, 0, 0)],
+                                       loc="cell")
+                self.assertEqual(values[0], 2.0)
+                self.assertTrue(np.isnan(values[1]))
+                self.assertEqual(list(ds.line("p", line, 4, loc="cell")),
+                                 [1.0, 1.0, 2.0, 2.0])
+
+                # The values of the cells owning the boundary faces
+                arr = ds.boundary_line("p", (0.5, 0, 0), (1, 0, 0),
+                                       loc="cell")
+                self.assertEqual(list(arr), [1.0] * 4)
+                arr = ds.boundary_line("p", (0, 0, 0.5), (0, 0, 1),
+                                       (1.2, None, None, None, None, None),
+                                       loc="cell")
+                self.assertEqual(list(arr), [2.0] * 4)
+
+                centres, values = ds.extract(
+                    ["p", "U X"], (None, None, None, 1.2, 1, 1))
+                self.assertEqual(centres.tolist(), [[0.5, 0.5, 0.5]])
+                self.assertEqual(list(values["p"]), [1.0])
+                self.assertEqual(list(values["U X"]), [0.0])
+                centres, values = ds.extract("p", time=0)
+                self.assertEqual(len(centres), 2)
+                self.assertEqual(list(values), [0.0, 0.0])
+
+        # Without the interpolated point data, the cell data are the default
+        with pvt.dsopen(self.casefile, backend="numpy",
+                        cell_to_point=False) as ds:
+            self.assertAlmostEqual(ds.probe("p", (0.25, 0.5, 0.5)), 1.0)
+            self.assertEqual(ds.probe("p", (0.25, 0.5, 0.5), loc="point"),
+                             None)
+            self.assertEqual(ds.field("p"), None)
+
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            self.assertAlmostEqual(ds.probe("p", (0.25, 0.5, 0.5)), 1.125)
+
+    def test_adaptive_line(self):
+        line = ((-0.5, 0.5, 0.5), (2.0, 0.5, 0.5))
+        with pvt.dsopen(self.casefile, backend="numpy") as ds:
+            points, values = ds.line("p", line, 3, adaptive=True, tol=1e-6)
+            # The field is linear, only the domain boundary is refined
+            self.assertTrue(len(points) < 20)
+            self.assertTrue(0 < points[0, 0] < 0.001)
+            self.assertTrue(np.all(np.diff(points[:, 0]) > 0))
+            for point, value in zip(points, values):
+                self.assertAlmostEqual(value, 1 + 0.5 * point[0])
+
+            points, values = ds.line(["p", "Missing"], line, 3,
+                                     only_inside=False, adaptive=True)
+            self.assertEqual(points[0, 0], -0.5)
+            self.assertTrue(np.isnan(values["p"][0]))
+            self.assertEqual(len(values["p"]), len(points))
+            self.assertEqual(values["Missing"], None)
+
+    def test_decomposed(self):
+        casefile = os.path.join(
+            pvt.PVTOOLS_DIR,
+            "tests/data/Cell1FoamDecomposed/Cell1FoamDecomposed.foam")
+        self.assertEqual(pvt.foam.processor_dirs(self.casefile), [])
+
+        mesh = pvt.foam.read(casefile, workers=2)
+        self.assertEqual(len(mesh.parts), 2)
+        self.assertEqual(mesh.case.times(), ["0", "1"])
+        # Points on the processor boundary are duplicated
+        self.assertEqual(mesh.num_points, 16)
+        self.assertEqual(mesh.num_cells, 2)
+        self.assertEqual(mesh.bounds(), (0, 0, 0, 2, 1, 1))
+        self.assertEqual(list(mesh.cell_data["p"]), [1.0, 2.0])
+        self.assertEqual(len(mesh.boundary_faces()[0]) - 1, 10)
+
+        tmpdir = tempfile.mkdtemp()
+        casedir = os.path.join(tmpdir, "Cell1FoamDecomposed")
+        shutil.copytree(os.path.dirname(casefile), casedir)
+        casefile = os.path.join(casedir, "Cell1FoamDecomposed.foam")
+
+        with pvt.dsopen(casefile, backend="numpy", cache_index=True) as ds:
+            self.assertEqual(ds.times(), [0.0, 1.0])
+            self.assertEqual(ds.time, 1.0)
+            self.assertAlmostEqual(ds.probe("p", (0.5, 0.5, 0.5)), 1.0)
+            self.assertAlmostEqual(ds.probe("U", (1.5, 0.5, 0.5)), 5.0)
+            self.assertAlmostEqual(ds.probe("p", (1.5, 0.5, 0.5), time=0),
+                                   0.0)
+            self.assertEqual(ds.probe("p", (3, 0.5, 0.5)), None)
+
+            # Samples of both subdomains in the order along the line
+            line = ((2.5, 0.5, 0.5), (0.0, 0.5, 0.5))
+            self.assertEqual(list(ds.line("U X", line, 6, False)[1:]),
+                             [4.0, 4.0, 0.0, 0.0, 0.0])
+            self.assertTrue(np.isnan(ds.line("p", line, 6, False)[0]))
+
+            self.assertAlmostEqual(ds.integrate("p", ("box", (None,) * 6)),
+                                   3.0)
+            self.assertAlmostEqual(ds.flux("U", ("patch", "faceA")), -4.0)
+            self.assertAlmostEqual(ds.flux("U", ("patch", "faceD")), 4.0)
+
+            # Cell data of the subdomains containing the points
+            values = ds.probe_many("p", [(1.5, 0.5, 0.5), (0.5, 0.5, 0.5)],
+                                   loc="cell")
+            self.assertEqual(list(values), [2.0, 1.0])
+            centres, values = ds.extract("U X")
+            self.assertEqual(centres.tolist(),
+                             [[0.5, 0.5, 0.5], [1.5, 0.5, 0.5]])
+            self.assertEqual(list(values), [0.0, 4.0])
+            self.assertEqual(list(ds.boundary_line(
+                "p", (1.5, 0, 0), (1, 0, 0), loc="cell")), [2.0] * 4)
+        # Locator of each subdomain in a sidecar of its own
+        self.assertTrue(os.path.isfile(casefile + ".locator.1.npz"))
+
+        shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(TestVtk))
+    test_suite.addTest(unittest.makeSuite(TestLegacyVtk))
+    test_suite.addTest(unittest.makeSuite(TestBackends))
+    test_suite.addTest(unittest.makeSuite(TestExport))
+    test_suite.addTest(unittest.makeSuite(TestProfiling))
+    test_suite.addTest(unittest.makeSuite(TestBatch))
+    test_suite.addTest(unittest.makeSuite(TestDaemon))
+    test_suite.addTest(unittest.makeSuite(TestMetadata))
+    test_suite.addTest(unittest.makeSuite(TestResultCache))
     test_suite.addTest(unittest.makeSuite(TestFoam))
+    test_suite.addTest(unittest.makeSuite(TestFoamReader))
     test_suite.addTest(doctest.DocTestSuite(pvt.interface))
 
     unittest.TextTestRunner(verbosity=2, buffer=True).run(test_suite)